@@ -0,0 +1,476 @@
+# CLimate Analysis using Digital Estimations (CLAuDE)
+
+import argparse
+import collections
+import json
+import os
+import platform
+import sys
+import time
+
+import numpy as np
+import scipy.integrate
+
+import claude_low_level_library as low_level
+import claude_top_level_library as top_level
+from config import Config
+from decomposition import DecomposedSimulation
+from simulation import Simulation
+from sweep import sweep_config
+
+# a kernel to time, and optionally the reference implementation it has to agree
+# with: reference is called with reference_arguments (or the same arguments),
+# and only region of the two results is compared
+Case = collections.namedtuple(
+    "Case", "name function arguments reference reference_arguments region tolerance"
+)
+Case.__new__.__defaults__ = (None, None, Ellipsis, 1E-12)
+
+# the polar planes need at least four latitudes poleward of POLE_LOWER_LAT_LIMIT
+RESOLUTIONS = (3, 2)
+LEVELS = (21, 41)
+# numbers of latitude bands a whole timestep is timed with
+BANDS = (1, 2, 4)
+# a kernel is reported as a regression when it is this much slower than its baseline
+THRESHOLD = 1.25
+
+
+def benchmark_config(resolution, nlevels, precision=np.float64):
+    """Config on the given grid, with nlevels spread over the standard pressure levels."""
+    standard_levels = Config.PRESSURE_LEVELS
+    pressure_levels = np.interp(
+        np.linspace(0, len(standard_levels) - 1, nlevels),
+        np.arange(len(standard_levels)),
+        standard_levels
+    )
+    return sweep_config(
+        Config, {"RESOLUTION": resolution, "PRESSURE_LEVELS": pressure_levels, "PRECISION": precision}
+    )
+
+
+def benchmark_simulation(resolution, nlevels, precision=np.float64, seed=0):
+    """A Simulation on the given grid, with random winds so the kernels see non-trivial data."""
+    simulation = Simulation(benchmark_config(resolution, nlevels, precision))
+
+    random = np.random.default_rng(seed)
+    scales = {"u": 5, "v": 5, "w": 0.01, "x_dot_N": 5, "y_dot_N": 5, "x_dot_S": 5, "y_dot_S": 5}
+    for name, scale in scales.items():
+        field = getattr(simulation, name)
+        field[...] = random.normal(0, scale, field.shape)
+    simulation.tracer[...] = random.uniform(0, 1, simulation.tracer.shape)
+    low_level.cumulative_sum_z(simulation.potential_temperature, simulation.sigma, simulation.geopotential)
+    np.negative(simulation.geopotential, out=simulation.geopotential)
+    return simulation
+
+
+def benchmark_cases(simulation):
+    """Every kernel of the two libraries, with arguments taken from simulation."""
+    config = simulation.config
+    ll = "low_level."
+    tl = "top_level."
+
+    theta = simulation.potential_temperature
+    # a block of four tracers
+    tracers = simulation.tracer * np.arange(1, 5, dtype=simulation.dtype)[:, None, None, None]
+    temperature = simulation.temperature_world
+    u, v, w = simulation.u, simulation.v, simulation.w
+    geopotential = simulation.geopotential
+    dx, dy = simulation.dx, simulation.dy
+    pressure_levels, lat, lon = config.PRESSURE_LEVELS, config.LAT, config.LON
+    dt = float(config.DT_MAIN)
+    # solar puts the latitude of the sun on a cosine of the season and
+    # solar_matrix on a sine, so they only agree an eighth of the way through the year
+    t = int(config.YEAR // 8)
+    i, j, k = config.NLAT // 2, config.NLON // 2, config.NLEVELS // 2
+
+    pole_low_index_N, pole_high_index_N, pole_low_index_S, pole_high_index_S = simulation.indices
+    (grid_lat_coords_N, grid_lon_coords_N, grid_x_values_N, grid_y_values_N, polar_x_coords_N, polar_y_coords_N,
+     grid_lat_coords_S, grid_lon_coords_S, grid_x_values_S, grid_y_values_S, polar_x_coords_S,
+     polar_y_coords_S) = simulation.coords
+    up_N, down_N, up_S, down_S = simulation.operators
+    grid_N, grid_S = simulation.grids
+    resolution = simulation.polar_grid_resolution
+    x_dot_N, y_dot_N = simulation.x_dot_N, simulation.y_dot_N
+    grid_velocities = (x_dot_N, y_dot_N, simulation.x_dot_S, simulation.y_dot_S)
+
+    theta_north = np.flip(theta[..., pole_low_index_N:, :, :], axis=-2)
+    u_north = np.flip(u[..., pole_low_index_N:, :, :], axis=-2)
+    v_north = np.flip(v[..., pole_low_index_N:, :, :], axis=-2)
+    plane = low_level.beam_me_up(
+        lat[pole_low_index_N:], lon, theta_north, grid_N, grid_lat_coords_N, grid_lon_coords_N, up_N
+    )
+    plane_geopotential = low_level.beam_me_up(
+        lat[pole_low_index_N:], lon, np.flip(geopotential[..., pole_low_index_N:, :, :], axis=-2),
+        grid_N, grid_lat_coords_N, grid_lon_coords_N, up_N
+    )
+    u_add, v_add = top_level.velocity_calculation(
+        u, v, w, pressure_levels, geopotential, theta, simulation.coriolis, config.GRAVITY, dx, dy, dt
+    )
+    column = theta[i, j].copy()
+    w_out = np.empty_like(w)
+
+    solar_arguments = (config.INSOLATION, lat, lon, t, config.DAY, config.YEAR, config.AXIAL_TILT)
+    day_side, over_pole = low_level.solar_latitude_factors(config.INSOLATION, lat, t, config.YEAR, config.AXIAL_TILT)
+    cos_lon = low_level.solar_longitude_factor(lon, t, config.DAY)
+
+    radiation = (
+        temperature, theta, pressure_levels, simulation.heat_capacity_earth, simulation.albedo, config.INSOLATION,
+        lat, lon, t, dt, config.DAY, config.YEAR, config.AXIAL_TILT
+    )
+    velocity = (u, v, w, pressure_levels, geopotential, theta, simulation.coriolis, config.GRAVITY, dx, dy, dt)
+    north_projection = (lon, x_dot_N, y_dot_N, pole_low_index_N, pole_high_index_N,
+                        grid_x_values_N, grid_y_values_N, polar_x_coords_N, polar_y_coords_N)
+    south_projection = (lon, simulation.x_dot_S, simulation.y_dot_S, pole_low_index_S, pole_high_index_S,
+                        grid_x_values_S, grid_y_values_S, polar_x_coords_S, polar_y_coords_S)
+    upload = (lat[pole_low_index_N:], lon, u_north, v_north, grid_N, grid_lat_coords_N, grid_lon_coords_N)
+    plane_velocities = (plane_geopotential, simulation.grid_side_length, simulation.coriolis_plane_N, x_dot_N, y_dot_N,
+                        resolution)
+    plane_w = (x_dot_N, y_dot_N, plane, pressure_levels, resolution, config.GRAVITY)
+
+    return [
+        Case(ll + "members_first", low_level.members_first, (theta,)),
+        Case(ll + "pad_width", low_level.pad_width, (theta, -2, (1, 0))),
+        Case(ll + "scratch", low_level.scratch, (None, "benchmark", theta.shape, theta.dtype)),
+        Case(ll + "scalar_gradient_x", low_level.scalar_gradient_x, (theta, dx, config.NLON, i, j, k)),
+        Case(ll + "scalar_gradient_x_2D", low_level.scalar_gradient_x_2D, (temperature, dx, config.NLON, i, j)),
+        Case(ll + "scalar_gradient_x_matrix", low_level.scalar_gradient_x_matrix, (theta, dx),
+             low_level.scalar_gradient_x_matrix_primitive, region=np.s_[1:-1]),
+        Case(ll + "scalar_gradient_x_matrix_primitive", low_level.scalar_gradient_x_matrix_primitive, (theta, dx)),
+        Case(ll + "scalar_gradient_y", low_level.scalar_gradient_y, (theta, dy, config.NLAT, i, j, k)),
+        Case(ll + "scalar_gradient_y_2D", low_level.scalar_gradient_y_2D, (temperature, dy, config.NLAT, i, j)),
+        Case(ll + "scalar_gradient_y_matrix", low_level.scalar_gradient_y_matrix, (theta, dy),
+             low_level.scalar_gradient_y_matrix_primitive),
+        Case(ll + "scalar_gradient_y_matrix_primitive", low_level.scalar_gradient_y_matrix_primitive, (theta, dy)),
+        Case(ll + "scalar_gradient_z_1D", low_level.scalar_gradient_z_1D, (column, pressure_levels, k)),
+        Case(ll + "scalar_gradient_z_3D", low_level.scalar_gradient_z_3D, (theta, pressure_levels, k)),
+        Case(ll + "scalar_gradient_z_matrix", low_level.scalar_gradient_z_matrix, (theta, pressure_levels),
+             low_level.scalar_gradient_z_matrix_primitive),
+        Case(ll + "scalar_gradient_z_matrix_primitive", low_level.scalar_gradient_z_matrix_primitive,
+             (theta, pressure_levels)),
+        Case(ll + "cumulative_trapezoid_z", low_level.cumulative_trapezoid_z, (theta, pressure_levels),
+             lambda a, p: scipy.integrate.cumulative_trapezoid(a, p, axis=-1, initial=0)),
+        Case(ll + "cumulative_sum_z", low_level.cumulative_sum_z, (theta, simulation.sigma), _cumulative_sum_levels),
+        Case(ll + "surface_optical_depth", low_level.surface_optical_depth, (float(lat[i]),)),
+        Case(ll + "surface_optical_depth_array", low_level.surface_optical_depth_array, (lat,)),
+        Case(ll + "thermal_radiation", low_level.thermal_radiation, (float(temperature[i, j]),)),
+        Case(ll + "thermal_radiation_matrix", low_level.thermal_radiation_matrix, (temperature,),
+             lambda field: _pointwise(low_level.thermal_radiation, field)),
+        Case(ll + "solar", low_level.solar,
+             (config.INSOLATION, float(lat[i]), float(lon[j]), t, config.DAY, config.YEAR, config.AXIAL_TILT)),
+        Case(ll + "solar_matrix", low_level.solar_matrix, solar_arguments, _solar_grid, tolerance=1E-6),
+        Case(ll + "solar_latitude_factors", low_level.solar_latitude_factors,
+             (config.INSOLATION, lat, t, config.YEAR, config.AXIAL_TILT)),
+        Case(ll + "solar_longitude_factor", low_level.solar_longitude_factor, (lon, t, config.DAY)),
+        Case(ll + "solar_pattern", low_level.solar_pattern, (day_side, over_pole, cos_lon), _solar_grid,
+             solar_arguments, tolerance=1E-6),
+        Case(ll + "profile", low_level.profile, (theta,)),
+        Case(ll + "field_reductions", low_level.field_reductions, (theta, np.cos(lat * np.pi / 180)),
+             _field_reductions, tolerance=1E-10),
+        Case(ll + "t_to_theta", low_level.t_to_theta, (theta, pressure_levels)),
+        Case(ll + "theta_to_t", low_level.theta_to_t, (theta, pressure_levels)),
+        Case(ll + "beam_me_up_2D", low_level.beam_me_up_2D,
+             (lat[pole_low_index_N:], lon, temperature[pole_low_index_N:], grid_N, grid_lat_coords_N,
+              grid_lon_coords_N)),
+        # the projection operators drop spline weights below 1E-10, so they
+        # only agree with the splines to about that
+        Case(ll + "beam_me_up", low_level.beam_me_up,
+             (lat[pole_low_index_N:], lon, theta_north, grid_N, grid_lat_coords_N, grid_lon_coords_N, up_N),
+             low_level.beam_me_up,
+             (lat[pole_low_index_N:], lon, theta_north, grid_N, grid_lat_coords_N, grid_lon_coords_N),
+             tolerance=1E-8),
+        Case(ll + "beam_me_down", low_level.beam_me_down,
+             (lon, plane, pole_low_index_N, grid_x_values_N, grid_y_values_N, polar_x_coords_N, polar_y_coords_N,
+              down_N),
+             low_level.beam_me_down,
+             (lon, plane, pole_low_index_N, grid_x_values_N, grid_y_values_N, polar_x_coords_N, polar_y_coords_N),
+             tolerance=1E-8),
+        Case(ll + "projection_operator", low_level.projection_operator,
+             (lat[pole_low_index_N:].astype(np.float64), lon.astype(np.float64), grid_lat_coords_N, grid_lon_coords_N,
+              config.INTERPOLATION_ORDER)),
+        Case(ll + "beam_me_up_operator", low_level.beam_me_up_operator,
+             (lat[pole_low_index_N:].astype(np.float64), lon.astype(np.float64), grid_lat_coords_N, grid_lon_coords_N,
+              config.INTERPOLATION_ORDER)),
+        Case(ll + "beam_me_down_operator", low_level.beam_me_down_operator,
+             (grid_x_values_N, grid_y_values_N, polar_x_coords_N, polar_y_coords_N, config.INTERPOLATION_ORDER)),
+        Case(ll + "apply_projection", low_level.apply_projection, (up_N, theta_north, (grid_N, grid_N))),
+        Case(ll + "combine_data", low_level.combine_data,
+             (pole_low_index_N, pole_high_index_N, u[..., pole_low_index_N:, :, :], v[..., pole_low_index_N:, :, :],
+              lat)),
+        Case(ll + "Blend", simulation.blends[0], (u[..., pole_low_index_N:, :, :], v[..., pole_low_index_N:, :, :]),
+             lambda polar, reprojected: low_level.combine_data(
+                 pole_low_index_N, pole_high_index_N, polar, reprojected, lat
+             )),
+        Case(ll + "grid_x_gradient_matrix", low_level.grid_x_gradient_matrix, (plane, resolution),
+             low_level.grid_x_gradient_matrix_primitive),
+        Case(ll + "grid_x_gradient_matrix_primitive", low_level.grid_x_gradient_matrix_primitive, (plane, resolution)),
+        Case(ll + "grid_y_gradient_matrix", low_level.grid_y_gradient_matrix, (plane, resolution),
+             low_level.grid_y_gradient_matrix_primitive),
+        Case(ll + "grid_y_gradient_matrix_primitive", low_level.grid_y_gradient_matrix_primitive, (plane, resolution)),
+        Case(ll + "grid_p_gradient_matrix", low_level.grid_p_gradient_matrix, (plane, pressure_levels)),
+        Case(ll + "grid_velocities", low_level.grid_velocities, plane_velocities, low_level.grid_velocities_primitive),
+        Case(ll + "grid_velocities_primitive", low_level.grid_velocities_primitive, plane_velocities),
+        Case(ll + "project_velocities_north", low_level.project_velocities_north, north_projection + (down_N,),
+             low_level.project_velocities_north, north_projection, tolerance=1E-8),
+        Case(ll + "project_velocities_north_primitive", low_level.project_velocities_north_primitive,
+             north_projection + (down_N,), low_level.project_velocities_north, north_projection, tolerance=1E-8),
+        Case(ll + "project_velocities_south", low_level.project_velocities_south, south_projection + (down_S,),
+             low_level.project_velocities_south, south_projection, tolerance=1E-8),
+        Case(ll + "project_velocities_south_primitive", low_level.project_velocities_south_primitive,
+             south_projection + (down_S,), low_level.project_velocities_south, south_projection, tolerance=1E-8),
+        Case(ll + "polar_plane_advect", low_level.polar_plane_advect, (plane, x_dot_N, y_dot_N, resolution),
+             low_level.polar_plane_advect_primitive),
+        Case(ll + "polar_plane_advect_primitive", low_level.polar_plane_advect_primitive,
+             (plane, x_dot_N, y_dot_N, resolution)),
+        Case(ll + "upload_velocities", low_level.upload_velocities, upload + (up_N,),
+             low_level.upload_velocities, upload, tolerance=1E-8),
+        Case(ll + "upload_velocities_primitive", low_level.upload_velocities_primitive, upload + (up_N,),
+             low_level.upload_velocities, upload, tolerance=1E-8),
+
+        Case(tl + "laplacian_2d", top_level.laplacian_2d, (temperature, dx, dy), top_level.laplacian_2d_primitive),
+        Case(tl + "laplacian_2d_primitive", top_level.laplacian_2d_primitive, (temperature, dx, dy)),
+        Case(tl + "laplacian_3d", top_level.laplacian_3d, (theta, dx, dy, pressure_levels)),
+        Case(tl + "divergence_with_scalar", top_level.divergence_with_scalar,
+             (theta, u, v, w, dx, dy, pressure_levels), top_level.divergence_with_scalar_primitive),
+        Case(tl + "divergence_with_scalar_primitive", top_level.divergence_with_scalar_primitive,
+             (theta, u, v, w, dx, dy, pressure_levels)),
+        Case(tl + "advect_scalars", top_level.advect_scalars,
+             (theta, tracers, u, v, w, dx, dy, pressure_levels, simulation.tracer_rows), _advect_scalars),
+        Case(tl + "radiation_coefficients", top_level.radiation_coefficients, (pressure_levels, lat)),
+        Case(tl + "radiation_calculation", top_level.radiation_calculation, radiation,
+             top_level.radiation_calculation_primitive),
+        Case(tl + "radiation_calculation_primitive", top_level.radiation_calculation_primitive, radiation),
+        Case(tl + "velocity_calculation", top_level.velocity_calculation, velocity,
+             top_level.velocity_calculation_primitive),
+        Case(tl + "velocity_calculation_primitive", top_level.velocity_calculation_primitive, velocity),
+        Case(tl + "w_calculation", top_level.w_calculation, velocity + (w_out,)),
+        Case(tl + "smoothing_3D", top_level.smoothing_3D, (theta, config.SMOOTHING_PARAM_U)),
+        Case(tl + "spectral_mask", top_level.spectral_mask,
+             (theta.shape[-3:], config.SMOOTHING_PARAM_U, config.SMOOTHING_PARAM_W)),
+        Case(tl + "spectral_filter", top_level.spectral_filter,
+             ((theta, w), (config.SMOOTHING_PARAM_T, config.SMOOTHING_PARAM_W), (0.5, 0.25)),
+             lambda fields, parameters, vert_parameters: [
+                 top_level.smoothing_3D(*arguments) for arguments in zip(fields, parameters, vert_parameters)
+             ], tolerance=1E-9),
+        Case(tl + "polar_planes", top_level.polar_planes,
+             (u, v, u_add, v_add, theta, geopotential, grid_velocities, simulation.indices, simulation.grids,
+              simulation.coords, simulation.coriolis_plane_N, simulation.coriolis_plane_S,
+              simulation.grid_side_length, pressure_levels, lat, lon, dt, resolution, config.GRAVITY,
+              simulation.operators)),
+        Case(tl + "update_plane_velocities", top_level.update_plane_velocities,
+             (lat, lon, pole_low_index_N, pole_low_index_S, u_north, v_north, simulation.grids, grid_lat_coords_N,
+              grid_lon_coords_N, u[..., :pole_low_index_S, :, :], v[..., :pole_low_index_S, :, :], grid_lat_coords_S,
+              grid_lon_coords_S, simulation.operators)),
+        Case(tl + "w_plane", top_level.w_plane, plane_w, top_level.w_plane_primitive),
+        Case(tl + "w_plane_primitive", top_level.w_plane_primitive, plane_w),
+    ]
+
+
+def check_case(case):
+    """Largest difference between a kernel and its reference, relative to the largest reference value.
+
+    Both are given copies of the arguments, as some kernels update them in place.
+    """
+    result = case.function(*_copies(case.arguments))
+    reference = case.reference(*_copies(case.reference_arguments or case.arguments))
+    error = 0.0
+    for fast, slow in zip(_results(result), _results(reference)):
+        fast = np.asarray(fast, dtype=np.float64)[case.region]
+        slow = np.asarray(slow, dtype=np.float64)[case.region]
+        scale = np.abs(slow).max()
+        error = max(error, np.abs(fast - slow).max() / scale if scale else np.abs(fast).max())
+    return float(error)
+
+
+def time_case(case, repeat=5, minimum=0.02):
+    """Best and median time of a single call, and the number of calls per measurement."""
+    number = 1
+    while True:
+        elapsed = _time_calls(case, number)
+        if elapsed >= minimum:
+            break
+        number *= 10 if elapsed < minimum / 10 else 2
+    times = [elapsed / number] + [_time_calls(case, number) / number for _ in range(repeat - 1)]
+    return {"best": min(times), "median": float(np.median(times)), "calls": number}
+
+
+def time_bands(config, bands, steps=5):
+    """Best and median time of a whole timestep of a DecomposedSimulation split into bands."""
+    with DecomposedSimulation(config, bands) as simulation:
+        # the first step has the workers fill their workspaces
+        simulation.run(1)
+        times = []
+        for _ in range(steps):
+            start = time.perf_counter()
+            simulation.run(1)
+            times.append(time.perf_counter() - start)
+    return {"best": min(times), "median": float(np.median(times)), "calls": 1}
+
+
+def run_benchmarks(resolutions=RESOLUTIONS, levels=LEVELS, precision=np.float64, kernels=None, log=print,
+                   bands=BANDS):
+    """Check every kernel against its reference and time it on each grid.
+
+    Raises AssertionError if any kernel disagrees with its reference, so a
+    fast kernel that has gone wrong is never timed into a baseline. kernels
+    optionally restricts the run to names containing one of its entries.
+    Unless it does, a whole timestep is also timed split into each number
+    of latitude bands, as "bands=N".
+    """
+    precision = np.dtype(precision)
+    results = {"metadata": _metadata(precision), "timings": {}, "equivalence": {}}
+    failures = []
+
+    for resolution in resolutions:
+        for nlevels in levels:
+            grid = "res{}_lev{}".format(resolution, nlevels)
+            cases = benchmark_cases(benchmark_simulation(resolution, nlevels, precision))
+            if kernels:
+                cases = [case for case in cases if any(kernel in case.name for kernel in kernels)]
+            else:
+                _check_coverage(cases)
+
+            timings = results["timings"][grid] = {}
+            errors = results["equivalence"][grid] = {}
+            for case in cases:
+                if case.reference is not None:
+                    errors[case.name] = check_case(case)
+                    if errors[case.name] > max(case.tolerance, 1000 * np.finfo(precision).eps):
+                        failures.append("{} {}: relative difference {:.2e}".format(
+                            grid, case.name, errors[case.name]
+                        ))
+                timings[case.name] = time_case(case)
+                log("{:<12} {:<48} {:>12.3e} s".format(grid, case.name, timings[case.name]["best"]))
+
+            for count in bands if not kernels else ():
+                name = "bands={}".format(count)
+                timings[name] = time_bands(benchmark_config(resolution, nlevels, precision), count)
+                log("{:<12} {:<48} {:>12.3e} s".format(grid, name, timings[name]["best"]))
+
+    if failures:
+        raise AssertionError("kernels disagree with their references:\n" + "\n".join(failures))
+    return results
+
+
+def compare_benchmarks(results, baseline, threshold=THRESHOLD):
+    """Kernels in results that are more than threshold times slower than in baseline.
+
+    Returns (grid, kernel, ratio) for each of them.
+    """
+    regressions = []
+    for grid, timings in results["timings"].items():
+        for name, timing in timings.items():
+            previous = baseline["timings"].get(grid, {}).get(name)
+            if previous is not None and timing["best"] > threshold * previous["best"]:
+                regressions.append((grid, name, timing["best"] / previous["best"]))
+    return regressions
+
+
+def _copies(arguments):
+    return tuple(np.array(argument) if isinstance(argument, np.ndarray) else argument for argument in arguments)
+
+
+def _results(result):
+    return result if isinstance(result, tuple) else (result,)
+
+
+def _time_calls(case, number):
+    function, arguments = case.function, case.arguments
+    start = time.perf_counter()
+    for _ in range(number):
+        function(*arguments)
+    return time.perf_counter() - start
+
+
+def _pointwise(function, field, *arguments):
+    flat = field.reshape(-1)
+    return np.array([function(float(value), *arguments) for value in flat]).reshape(field.shape)
+
+
+def _solar_grid(insolation, lat, lon, t, day, year, axial_tilt):
+    return np.array([
+        [low_level.solar(insolation, float(latitude), float(longitude), t, day, year, axial_tilt) for longitude in lon]
+        for latitude in lat
+    ])
+
+
+def _field_reductions(a, weights, field_ndim=3):
+    weights = np.broadcast_to(np.expand_dims(weights, tuple(range(1, field_ndim))), a.shape)
+    return (a.min(), a.max(), np.average(a, weights=weights), np.average(a ** 2, weights=weights), False)
+
+
+def _advect_scalars(theta, tracers, u, v, w, dx, dy, pressure_levels, tracer_rows):
+    theta_addition = top_level.divergence_with_scalar_primitive(theta, u, v, w, dx, dy, pressure_levels)
+    tracer_addition = np.array([
+        top_level.divergence_with_scalar_primitive(tracer, u, v, w, dx, dy, pressure_levels) for tracer in tracers
+    ])
+    tracer_addition[:, ~tracer_rows] = 0
+    for k in range(1, len(pressure_levels) - 1):
+        spacing = pressure_levels[k] - pressure_levels[k - 1]
+        w_down, w_up = 0.5 * (w[..., k] - abs(w[..., k])), 0.5 * (w[..., k] + abs(w[..., k]))
+        tracer_addition[..., k] += w_down * (tracers[..., k] - tracers[..., k - 1]) / spacing
+        tracer_addition[..., k] += w_up * (tracers[..., k + 1] - tracers[..., k]) / spacing
+    return theta_addition, tracer_addition
+
+
+def _cumulative_sum_levels(a, coordinate):
+    output = np.zeros_like(a)
+    for k in range(1, a.shape[-1]):
+        output[..., k] = output[..., k - 1] + a[..., k] * (coordinate[k] - coordinate[k - 1])
+    return output
+
+
+def _check_coverage(cases):
+    covered = {case.name for case in cases}
+    for prefix, module in (("low_level.", low_level), ("top_level.", top_level)):
+        for name in dir(module):
+            function = getattr(module, name)
+            if name.startswith("_") or isinstance(function, type) or not callable(function):
+                continue
+            if getattr(function, "__module__", None) == module.__name__ and prefix + name not in covered:
+                raise AssertionError("no benchmark for " + prefix + name)
+
+
+def _metadata(precision):
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+        "OMP_NUM_THREADS": os.environ.get("OMP_NUM_THREADS"),
+        "precision": precision.name,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the kernels and check them against their references.")
+    parser.add_argument("--resolutions", type=int, nargs="+", default=RESOLUTIONS)
+    parser.add_argument("--levels", type=int, nargs="+", default=LEVELS)
+    parser.add_argument("--precision", default="float64")
+    parser.add_argument("--kernels", nargs="+", help="only run kernels whose names contain one of these")
+    parser.add_argument("--bands", type=int, nargs="*", default=BANDS,
+                        help="numbers of latitude bands to time a whole timestep with (none to skip)")
+    parser.add_argument("--save", help="write the timings to this file, as a baseline for later runs")
+    parser.add_argument("--compare", help="report kernels that have become slower than in this baseline")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD)
+    arguments = parser.parse_args()
+
+    results = run_benchmarks(
+        arguments.resolutions, arguments.levels, arguments.precision, arguments.kernels, bands=arguments.bands
+    )
+
+    if arguments.save:
+        with open(arguments.save, "w") as f:
+            json.dump(results, f, indent=1)
+
+    if arguments.compare:
+        with open(arguments.compare) as f:
+            regressions = compare_benchmarks(results, json.load(f), arguments.threshold)
+        for grid, name, ratio in regressions:
+            print("SLOWER {:<12} {:<48} {:.2f}x".format(grid, name, ratio))
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+# CLimate Analysis using Digital Estimations (CLAuDE)
+
+import json
+import os
+import pickle
+import queue
+import threading
+
+import numpy as np
+
+# checkpoint files start with MAGIC, then the length of a JSON header, the
+# header itself and finally the raw array data, each array aligned so it can
+# be memory-mapped straight back in
+MAGIC = b"CLAUDE\x00\x01"
+ALIGNMENT = 64
+
+# order of the fields in the pickled tuple written by older versions
+PICKLE_FIELDS = (
+    "potential_temperature", "temperature_world", "u", "v", "w",
+    "x_dot_N", "y_dot_N", "x_dot_S", "y_dot_S", "t", "albedo", "tracer"
+)
+
+
+def _align(offset):
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def write_checkpoint(path, state, metadata=None):
+    """Write the arrays and scalars in state to path.
+
+    The file is written next to path and renamed over it once complete, so
+    a crash part way through never leaves a corrupt checkpoint behind.
+    """
+    arrays = {}
+    scalars = {}
+    for name, value in state.items():
+        if isinstance(value, np.ndarray):
+            arrays[name] = np.ascontiguousarray(value)
+        else:
+            scalars[name] = value.item() if isinstance(value, np.generic) else value
+
+    fields = {}
+    offset = 0
+    for name, array in arrays.items():
+        fields[name] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": offset}
+        offset = _align(offset + array.nbytes)
+
+    header = json.dumps({
+        "fields": fields,
+        "scalars": scalars,
+        "metadata": metadata or {},
+    }).encode()
+    data_start = _align(len(MAGIC) + 8 + len(header))
+
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(len(header).to_bytes(8, "little"))
+        f.write(header)
+        for name, array in arrays.items():
+            f.seek(data_start + fields[name]["offset"])
+            array.tofile(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+
+
+def read_checkpoint(path, mmap_mode="c"):
+    """Load a checkpoint, returning (state, metadata).
+
+    Arrays are memory-mapped rather than read in: with the default
+    copy-on-write mode, pages are only copied once the model changes them.
+    Pickled save files from older versions are also accepted.
+    """
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            f.seek(0)
+            return dict(zip(PICKLE_FIELDS, pickle.load(f))), {}
+        header_length = int.from_bytes(f.read(8), "little")
+        header = json.loads(f.read(header_length))
+
+    data_start = _align(len(MAGIC) + 8 + header_length)
+    state = dict(header["scalars"])
+    for name, field in header["fields"].items():
+        state[name] = np.memmap(
+            path,
+            dtype=np.dtype(field["dtype"]),
+            mode=mmap_mode,
+            offset=data_start + field["offset"],
+            shape=tuple(field["shape"])
+        )
+    return state, header["metadata"]
+
+
+class CheckpointWriter:
+    """Saves snapshots of the model state without holding up the integration.
+
+    save() copies the state into one of two snapshot buffers and hands it to
+    a background thread, which writes it with write_checkpoint. It only waits
+    if both buffers are still being written. Can be used directly as a
+    Simulation hook.
+    """
+
+    def __init__(self, path, metadata=None):
+        self.path = path
+        self.metadata = metadata
+        self.error = None
+
+        self._buffers = [None, None]
+        self._free = queue.Queue()
+        self._free.put(0)
+        self._free.put(1)
+        self._pending = queue.Queue()
+
+        self._thread = threading.Thread(target=self._write_loop, daemon=True)
+        self._thread.start()
+
+    def __call__(self, simulation):
+        self.save(simulation.state)
+
+    def save(self, state):
+        """Snapshot state and queue it for writing."""
+        self._raise_error()
+        index = self._free.get()
+
+        buffer = self._buffers[index]
+        if buffer is None or buffer.keys() != state.keys():
+            buffer = {}
+        for name, value in state.items():
+            if not isinstance(value, np.ndarray):
+                buffer[name] = value
+            elif name in buffer and buffer[name].shape == value.shape and buffer[name].dtype == value.dtype:
+                np.copyto(buffer[name], value)
+            else:
+                buffer[name] = np.array(value)
+        self._buffers[index] = buffer
+
+        self._pending.put(index)
+
+    def close(self):
+        """Wait for outstanding writes to finish and stop the writer thread."""
+        self._pending.put(None)
+        self._thread.join()
+        self._raise_error()
+
+    def _write_loop(self):
+        while True:
+            index = self._pending.get()
+            if index is None:
+                return
+            try:
+                write_checkpoint(self.path, self._buffers[index], self.metadata)
+            except Exception as error:
+                self.error = error
+            finally:
+                self._free.put(index)
+
+    def _raise_error(self):
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
@@ -3,21 +3,68 @@
 import numpy as np
 cimport numpy as np
 cimport cython
-from scipy.interpolate import interp2d, RectBivariateSpline
+from cython.parallel cimport prange
+from libc.math cimport fabs
+from scipy.interpolate import RectBivariateSpline
+import scipy.sparse
 
 ctypedef np.float64_t DTYPE_f
+
+# the model state is single or double precision (Config.PRECISION), and the kernels are compiled for both
+ctypedef fused DTYPE_real:
+	np.float32_t
+	np.float64_t
+
 cdef float inv_180 = np.pi/180
 cdef float inv_90 = np.pi/90
 cdef DTYPE_f sigma = 5.67E-8
 
+class Workspace:
+	''' scratch arrays that are reused from step to step instead of being allocated each time, one per name and shape '''
+
+	def __init__(self):
+		self.buffers = {}
+
+	def get(self, name, shape, dtype=np.float64):
+		''' scratch array called name with the given shape and dtype; its contents are whatever was left in it last time '''
+		key = (name, tuple(shape), np.dtype(dtype))
+		if key not in self.buffers:
+			self.buffers[key] = np.empty(shape, dtype)
+		return self.buffers[key]
+
+	@property
+	def nbytes(self):
+		return sum(buffer.nbytes for buffer in self.buffers.values())
+
+cpdef np.ndarray members_first(np.ndarray a, np.int_t field_ndim=3):
+	''' view of a field with its leading member axes merged into one, so that a single run has one member '''
+	return a.reshape((-1,) + np.shape(a)[a.ndim-field_ndim:])
+
+cpdef tuple pad_width(np.ndarray a, np.int_t axis, tuple width):
+	''' np.pad widths that only pad the given axis of a, counted from the end so that leading member axes are left alone '''
+	widths = [(0,0)]*a.ndim
+	widths[a.ndim+axis] = width
+	return tuple(widths)
+
+cpdef scratch(workspace, str name, tuple shape, dtype=np.float64):
+	''' scratch array from workspace, or a new array when there is no workspace '''
+	if workspace is None:
+		return np.empty(shape, dtype)
+	return workspace.get(name, shape, dtype)
+
 # define various useful differential functions:
 # gradient of scalar field a in the local x direction at point i,j
 cpdef scalar_gradient_x(np.ndarray a, np.ndarray dx, np.int_t nlon, np.int_t i, np.int_t j, np.int_t k):
 	return (a[i,(j+1)%nlon,k]-a[i,(j-1)%nlon,k])/(dx[i])
 
-cpdef scalar_gradient_x_matrix(np.ndarray a,np.ndarray dx):
-	cdef np.ndarray output = (np.roll(a, -1, axis=1) - np.roll(a, 1, axis=1)) / dx[:, None, None]
-	return output
+cpdef scalar_gradient_x_matrix(np.ndarray a,np.ndarray dx,np.ndarray out=None):
+	if out is None:
+		out = np.empty(np.shape(a), a.dtype)
+	np.subtract(a[...,2:,:], a[...,:-2,:], out=out[...,1:-1,:])
+	np.subtract(a[...,1,:], a[...,-1,:], out=out[...,0,:])
+	np.subtract(a[...,0,:], a[...,-2,:], out=out[...,-1,:])
+	out /= dx[:, None, None]
+	return out
 
 cpdef scalar_gradient_x_matrix_primitive(np.ndarray a,np.ndarray dx):
 	cdef np.ndarray output = np.zeros_like(a)
@@ -43,10 +90,15 @@ cpdef scalar_gradient_y(np.ndarray a,DTYPE_f dy,np.int_t nlat,np.int_t i,np.int_
 	else:
 		return (a[i+1,j,k]-a[i-1,j,k])/dy
 	
-cpdef scalar_gradient_y_matrix(np.ndarray a,DTYPE_f dy):
-	shift_south = np.pad(a, ((1,0), (0,0), (0,0)), 'reflect', reflect_type='odd')[:-1,:,:]
-	shift_north = np.pad(a, ((0,1), (0,0), (0,0)), 'reflect', reflect_type='odd')[1:,:,:]
-	return (shift_north - shift_south)/dy
+cpdef scalar_gradient_y_matrix(np.ndarray a,DTYPE_f dy,np.ndarray out=None):
+	if out is None:
+		out = np.empty(np.shape(a), a.dtype)
+	np.subtract(a[...,2:,:,:], a[...,:-2,:,:], out=out[...,1:-1,:,:])
+	# odd reflection at the boundaries
+	np.subtract(a[...,1,:,:], 2*a[...,0,:,:] - a[...,1,:,:], out=out[...,0,:,:])
+	np.subtract(2*a[...,-1,:,:] - a[...,-2,:,:], a[...,-2,:,:], out=out[...,-1,:,:])
+	out /= dy
+	return out
 
 cpdef scalar_gradient_y_matrix_primitive(np.ndarray a,DTYPE_f dy):
 	cdef np.ndarray output = np.zeros_like(a)
@@ -83,12 +135,18 @@ cpdef scalar_gradient_z_3D(np.ndarray a,np.ndarray pressure_levels,np.int_t k):
 	else:
 		return -(a[:,:,k+1]-a[:,:,k-1])/(pressure_levels[k+1]-pressure_levels[k-1])
 
-cpdef scalar_gradient_z_matrix(np.ndarray a, np.ndarray pressure_levels):
-	shift_up = np.pad(a, ((0,0), (0,0), (1,0)), 'edge')[:,:,:-1]
-	shift_down = np.pad(a, ((0,0), (0,0), (0,1)), 'edge')[:,:,1:]
+cpdef scalar_gradient_z_matrix(np.ndarray a, np.ndarray pressure_levels, np.ndarray out=None):
+	if out is None:
+		out = np.empty(np.shape(a), a.dtype)
+	np.subtract(a[...,2:], a[...,:-2], out=out[...,1:-1])
+	# one-sided at the top and bottom
+	np.subtract(a[...,1], a[...,0], out=out[...,0])
+	np.subtract(a[...,-1], a[...,-2], out=out[...,-1])
 	shift_pressure_up = np.pad(pressure_levels, (1,0), 'edge')[:-1]
 	shift_pressure_down = np.pad(pressure_levels, (0,1), 'edge')[1:]
-	return - (shift_down - shift_up) / (shift_pressure_down - shift_pressure_up)
+	np.negative(out, out=out)
+	out /= (shift_pressure_down - shift_pressure_up)
+	return out
 
 cpdef scalar_gradient_z_matrix_primitive(np.ndarray a, np.ndarray pressure_levels):
 	cdef np.ndarray output = np.zeros_like(a)
@@ -97,6 +155,27 @@ cpdef scalar_gradient_z_matrix_primitive(np.ndarray a, np.ndarray pressure_level
 		output[:,:,k] = scalar_gradient_z_3D(a,pressure_levels,k)
 	return output
 
+# vertical integrals from the first level to every level at once, in linear time
+cpdef cumulative_trapezoid_z(np.ndarray a, np.ndarray pressure_levels, np.ndarray out=None, dtype=None):
+	''' trapezoidal integral of a over pressure from the first level to each level, along the last axis; the running sum is kept in dtype if given '''
+	if out is None:
+		out = np.empty(np.shape(a), a.dtype)
+	np.add(a[...,1:], a[...,:-1], out=out[...,1:])
+	out[...,1:] *= np.diff(pressure_levels)
+	out[...,1:] /= 2.0
+	out[...,0] = 0
+	np.cumsum(out[...,1:], axis=-1, dtype=dtype, out=out[...,1:])
+	return out
+
+cpdef cumulative_sum_z(np.ndarray a, np.ndarray coordinate, np.ndarray out=None, dtype=None):
+	''' sum of a times the coordinate step below each level, from the first level to each level, along the last axis; the running sum is kept in dtype if given '''
+	if out is None:
+		out = np.empty(np.shape(a), a.dtype)
+	np.multiply(a[...,1:], np.diff(coordinate), out=out[...,1:])
+	out[...,0] = 0
+	np.cumsum(out[...,1:], axis=-1, dtype=dtype, out=out[...,1:])
+	return out
+
 cpdef surface_optical_depth(DTYPE_f lat):
 	return 4# + np.cos(lat*inv_90)*2
 
@@ -106,11 +185,15 @@ cpdef surface_optical_depth_array(np.ndarray lat):
 cpdef thermal_radiation(DTYPE_f a):
 	return sigma*(a**4)
 
-cpdef thermal_radiation_matrix(np.ndarray a):
-	return sigma*(a**4)
+cpdef thermal_radiation_matrix(np.ndarray a, np.ndarray out=None):
+	if out is None:
+		return sigma*(a**4)
+	np.power(a, 4, out=out)
+	out *= sigma
+	return out
 
 # power incident on (lat,lon) at time t
-cpdef solar(DTYPE_f insolation,DTYPE_f  lat,DTYPE_f lon,np.int_t t,DTYPE_f  day,DTYPE_f  year,DTYPE_f  axial_tilt):
+cpdef solar(DTYPE_f insolation,DTYPE_f  lat,DTYPE_f lon,DTYPE_f t,DTYPE_f  day,DTYPE_f  year,DTYPE_f  axial_tilt):
 	cdef float sun_longitude = -t % day
 	cdef float sun_latitude = axial_tilt*np.cos(t*2*np.pi/year)
 	cdef float value = insolation*np.cos((lat-sun_latitude)*inv_180)
@@ -134,42 +217,91 @@ cpdef solar(DTYPE_f insolation,DTYPE_f  lat,DTYPE_f lon,np.int_t t,DTYPE_f  day,
 		else:
 			return value
 
-cpdef solar_matrix(DTYPE_f insolation, np.ndarray  lat, np.ndarray lon, np.int_t t, DTYPE_f  day, DTYPE_f  year, DTYPE_f  axial_tilt):
-	cdef float sun_longitude = -t % day
-	# cdef float sun_latitude = axial_tilt*np.cos(t*2*np.pi/year)
-	cdef float sun_latitude = axial_tilt*np.sin(t*2*np.pi/year)
-	cdef np.ndarray values = insolation*np.cos((lat-sun_latitude)*inv_180)
-	cdef np.ndarray lon_diff, cos_lon
+cpdef solar_matrix(DTYPE_f insolation, np.ndarray  lat, np.ndarray lon, DTYPE_f t, DTYPE_f  day, DTYPE_f  year, DTYPE_f  axial_tilt):
+	''' solar at every (lat,lon) at once, though the latitude of the sun follows a sine of the season here '''
+	day_side, over_pole = solar_latitude_factors(insolation,lat,t,year,axial_tilt)
+	return solar_pattern(day_side,over_pole,solar_longitude_factor(lon,t,day))
 
-	values = np.fmax(values,0)
+cpdef tuple solar_latitude_factors(DTYPE_f insolation, np.ndarray lat, DTYPE_f t, DTYPE_f year, DTYPE_f axial_tilt):
+	''' the part of solar_matrix that depends on latitude and the season: the factor of each row on the day side, and the factor on the night side where the sun shines over the pole (zero for rows it cannot reach) '''
+	cdef float sun_latitude = axial_tilt*np.sin(t*2*np.pi/year)
+	cdef np.ndarray day_side = np.fmax(insolation*np.cos((lat-sun_latitude)*inv_180),0)
+	cdef np.ndarray in_range = np.logical_and((lat + sun_latitude > -90), (lat + sun_latitude < 90))
+	cdef np.ndarray over_pole = np.where(in_range, 0, insolation*np.cos((lat+sun_latitude)*inv_180))
+	return day_side, over_pole
 
+cpdef np.ndarray solar_longitude_factor(np.ndarray lon, DTYPE_f t, DTYPE_f day):
+	''' the part of solar_matrix that depends on longitude and the time of day '''
+	cdef float sun_longitude = -t % day
 	sun_longitude *= 360/day
-	lon_diff = lon-sun_longitude
-	cos_lon = np.cos(lon_diff*inv_180) 
-	values = np.outer(values, cos_lon)
-	
-	cdef np.ndarray in_range_mask = np.logical_and((lat + sun_latitude > -90), (lat + sun_latitude < 90))
-	cdef np.ndarray mask1 = np.logical_and(values < 0, np.logical_not(in_range_mask)[:,None])
-	cdef np.ndarray mask2 = np.logical_and(values < 0, in_range_mask[:,None])
-	cdef np.int_t i
-	for i in range(lat.shape[0]):
-		values[i,:][mask1[i,:]] = insolation*np.cos((lat[i]+sun_latitude)*inv_180)*cos_lon[mask1[i,:]]
-		values[i,:][mask2[i,:]] = 0
+	return np.cos((lon-sun_longitude)*inv_180)
 
-	return values
+cpdef np.ndarray solar_pattern(np.ndarray day_side, np.ndarray over_pole, np.ndarray cos_lon):
+	''' solar_matrix from its latitude and longitude factors, without a loop over the rows '''
+	cdef np.ndarray values = np.outer(day_side, cos_lon)
+	return np.where(values < 0, np.outer(over_pole, cos_lon), values)
 
 cpdef profile(np.ndarray a):
 	return np.mean(np.mean(a,axis=0),axis=0)
 
-cpdef t_to_theta(np.ndarray temperature_atmos, np.ndarray pressure_levels):
+cpdef tuple field_reductions(np.ndarray a, np.ndarray weights, np.int_t field_ndim=3):
+	''' minimum, maximum, mean and mean square of a field in a single pass, and whether it holds a NaN (which the extrema skip and the means take on); the means are weighted by weights along latitude and taken over every member '''
+	cdef tuple shape = np.shape(a)[a.ndim-field_ndim:]
+	# one row of values per latitude of each member
+	cdef np.ndarray rows = np.ascontiguousarray(a).reshape(-1, int(np.prod(shape[1:])))
+	cdef double[:] results = np.zeros(4)
+	if a.dtype == np.float32:
+		_field_reductions[np.float32_t](rows,np.asarray(weights,np.float64),results)
+	else:
+		_field_reductions[np.float64_t](rows,np.asarray(weights,np.float64),results)
+	return results[0], results[1], results[2], results[3], results[2] != results[2]
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+cdef void _field_reductions(const DTYPE_real[:,::1] rows, const double[:] weights, double[:] results):
+	cdef Py_ssize_t nrows = rows.shape[0]
+	cdef Py_ssize_t ncols = rows.shape[1]
+	cdef Py_ssize_t nlat = weights.shape[0]
+	cdef Py_ssize_t row, j, lane
+	cdef double value
+	cdef double minimum = np.inf
+	cdef double maximum = -np.inf
+	# four independent sums per row, so that the additions can overlap
+	cdef double sums[4]
+	cdef double squares[4]
+	cdef double total = 0, square_total = 0, weight_total = 0
+
+	with nogil:
+		for row in range(nrows):
+			for lane in range(4):
+				sums[lane] = 0
+				squares[lane] = 0
+			for j in range(ncols):
+				value = rows[row,j]
+				# comparisons with NaN are false, so NaNs are skipped
+				minimum = value if value < minimum else minimum
+				maximum = value if value > maximum else maximum
+				sums[j & 3] += value
+				squares[j & 3] += value*value
+			total += weights[row % nlat]*((sums[0] + sums[1]) + (sums[2] + sums[3]))
+			square_total += weights[row % nlat]*((squares[0] + squares[1]) + (squares[2] + squares[3]))
+			weight_total += weights[row % nlat]*ncols
+
+	results[0] = minimum
+	results[1] = maximum
+	results[2] = total/weight_total
+	results[3] = square_total/weight_total
+
+cpdef t_to_theta(np.ndarray temperature_atmos, np.ndarray pressure_levels, np.ndarray out=None):
 	cdef DTYPE_f inv_p0 = 1/pressure_levels[0]
 
-	return temperature_atmos*(pressure_levels*inv_p0)**(-0.286)
+	return np.multiply(temperature_atmos, (pressure_levels*inv_p0)**(-0.286), out=out)
 
-cpdef theta_to_t(np.ndarray theta, np.ndarray pressure_levels):
+cpdef theta_to_t(np.ndarray theta, np.ndarray pressure_levels, np.ndarray out=None):
 	cdef DTYPE_f inv_p0 = 1/pressure_levels[0]
 
-	return theta*(pressure_levels*inv_p0)**(0.286)
+	return np.multiply(theta, (pressure_levels*inv_p0)**(0.286), out=out)
 
 ########################################################################################################
 
@@ -179,33 +311,111 @@ cpdef beam_me_up_2D(np.ndarray lats,np.ndarray lon,np.ndarray data,np.int_t grid
 	cdef np.ndarray polar_plane = f(grid_lat_coords,grid_lon_coords,grid=False).reshape((grid_size,grid_size))
 	return polar_plane
 
-cpdef beam_me_up(np.ndarray lats,np.ndarray lon,np.ndarray data,np.int_t grid_size,np.ndarray grid_lat_coords,np.ndarray grid_lon_coords):
+cpdef beam_me_up(np.ndarray lats,np.ndarray lon,np.ndarray data,np.int_t grid_size,np.ndarray grid_lat_coords,np.ndarray grid_lon_coords,operator=None,np.ndarray out=None):
 	'''Projects data on lat-lon grid to x-y polar grid'''
-	cdef np.ndarray polar_plane = np.zeros((grid_size,grid_size,data.shape[2]))
+	if operator is not None:
+		return apply_projection(operator,data,(grid_size,grid_size),out)
+	cdef np.ndarray polar_plane = np.zeros((grid_size,grid_size,data.shape[2])) if out is None else out
 	cdef np.int_t k
 	for k in range(data.shape[2]):
 		f = RectBivariateSpline(lats, lon, data[:,:,k])
 		polar_plane[:,:,k] = f(grid_lat_coords,grid_lon_coords,grid=False).reshape((grid_size,grid_size))
 	return polar_plane
 
-cpdef beam_me_down(lon,data,np.int_t pole_low_index, grid_x_values, grid_y_values,polar_x_coords, polar_y_coords):
+cpdef beam_me_down(lon,data,np.int_t pole_low_index, grid_x_values, grid_y_values,polar_x_coords, polar_y_coords,operator=None,np.ndarray out=None):
 	'''projects data from x-y polar grid onto lat-lon grid'''
-	cdef np.ndarray resample = np.zeros((int(len(polar_x_coords)/len(lon)),len(lon),data.shape[2]))
+	if operator is not None:
+		return apply_projection(operator,data,(int(len(polar_x_coords)/len(lon)),len(lon)),out)
+	cdef np.ndarray resample = np.zeros((int(len(polar_x_coords)/len(lon)),len(lon),data.shape[2])) if out is None else out
 	cdef np.int_t k
 	for k in range(data.shape[2]):
 		f = RectBivariateSpline(x=grid_x_values, y=grid_y_values, z=data[:,:,k])
 		resample[:,:,k] = f(polar_x_coords,polar_y_coords,grid=False).reshape((int(len(polar_x_coords)/len(lon)),len(lon)))
 	return resample
 
+cdef np.ndarray cardinal_weights(np.ndarray x,np.ndarray y,np.ndarray x_coords,np.ndarray y_coords,np.int_t order):
+	''' weight of each x gridline in the spline interpolant evaluated at (x_coords,y_coords) '''
+	# the interpolating spline is a tensor product, so the spline of data that is one along
+	# gridline a and zero elsewhere is the a-th cardinal function in x (times one in y)
+	cdef np.ndarray weights = np.zeros((len(x_coords),len(x)))
+	cdef np.ndarray unit = np.zeros((len(x),len(y)))
+	cdef np.int_t a
+	for a in range(len(x)):
+		unit[a,:] = 1
+		f = RectBivariateSpline(x, y, unit, kx=order, ky=order)
+		weights[:,a] = f(x_coords,y_coords,grid=False)
+		unit[a,:] = 0
+	return weights
+
+cpdef projection_operator(np.ndarray x,np.ndarray y,np.ndarray x_coords,np.ndarray y_coords,np.int_t order=3,DTYPE_f tolerance=1E-10,DTYPE_f max_density=0.3):
+	''' sparse matrix evaluating the spline through data on the (x,y) grid at (x_coords,y_coords): order 1 is bilinear, order 3 matches RectBivariateSpline '''
+	cdef np.ndarray x_weights = cardinal_weights(x,y,x_coords,y_coords,order)
+	cdef np.ndarray y_weights = cardinal_weights(y,x,y_coords,x_coords,order)
+	cdef np.ndarray kept
+
+	# cubic weights decay quickly away from the gridline, so drop the tiny ones and
+	# rescale what is kept so that constant fields are still reproduced exactly
+	kept = np.where(np.abs(x_weights) < tolerance, 0, x_weights)
+	x_weights = kept*(x_weights.sum(axis=1)/kept.sum(axis=1))[:,None]
+	kept = np.where(np.abs(y_weights) < tolerance, 0, y_weights)
+	y_weights = kept*(y_weights.sum(axis=1)/kept.sum(axis=1))[:,None]
+
+	cdef np.int_t ny = len(y)
+	cdef np.int_t p
+	rows, cols, values = [], [], []
+	for p in range(len(x_coords)):
+		a = np.nonzero(x_weights[p])[0]
+		b = np.nonzero(y_weights[p])[0]
+		rows.append(np.full(len(a)*len(b), p))
+		cols.append((a[:,None]*ny + b[None,:]).ravel())
+		values.append(np.outer(x_weights[p,a], y_weights[p,b]).ravel())
+
+	operator = scipy.sparse.csr_matrix((np.concatenate(values),(np.concatenate(rows),np.concatenate(cols))),shape=(len(x_coords),len(x)*ny))
+
+	# on coarse grids the cubic weights reach across most of the grid, and a dense product is faster
+	if operator.nnz > max_density*operator.shape[0]*operator.shape[1]:
+		return operator.toarray()
+	return operator
+
+cpdef beam_me_up_operator(np.ndarray lats,np.ndarray lon,np.ndarray grid_lat_coords,np.ndarray grid_lon_coords,np.int_t order=3):
+	''' precomputed lat-lon to x-y polar grid projection, for use with beam_me_up '''
+	return projection_operator(lats,lon,grid_lat_coords,grid_lon_coords,order)
+
+cpdef beam_me_down_operator(np.ndarray grid_x_values,np.ndarray grid_y_values,polar_x_coords,polar_y_coords,np.int_t order=3):
+	''' precomputed x-y polar grid to lat-lon projection, for use with beam_me_down '''
+	return projection_operator(grid_x_values,grid_y_values,np.asarray(polar_x_coords),np.asarray(polar_y_coords),order)
+
+cpdef apply_projection(operator,np.ndarray data,tuple shape,np.ndarray out=None):
+	''' project every level (and member) of data at once with a precomputed projection operator, into out if given '''
+	cdef np.int_t nlevels = data.shape[data.ndim-1]
+	if data.ndim == 3:
+		if out is None:
+			return (operator @ data.reshape((-1,nlevels))).reshape(shape + (nlevels,))
+		# dense operators multiply straight into out; sparse products have to be copied there
+		if isinstance(operator,np.ndarray) and out.flags.c_contiguous:
+			np.matmul(operator,data.reshape((-1,nlevels)),out=out.reshape((-1,nlevels)))
+		else:
+			np.copyto(out,(operator @ data.reshape((-1,nlevels))).reshape(shape + (nlevels,)))
+		return out
+	# move the members next to the levels, so that they are all projected by the same product
+	cdef tuple members = np.shape(data)[:data.ndim-3]
+	cdef np.ndarray columns = np.moveaxis(members_first(data),0,2).reshape((operator.shape[1],-1))
+	cdef np.ndarray projected = (operator @ columns).reshape(shape + (-1,nlevels))
+	if out is None:
+		return np.moveaxis(projected,2,0).reshape(members + shape + (nlevels,))
+	np.copyto(members_first(out),np.moveaxis(projected,2,0))
+	return out
+
 cpdef combine_data(np.int_t pole_low_index,np.int_t pole_high_index,np.ndarray polar_data,np.ndarray reprojected_data,np.ndarray lat): 
 	cdef np.ndarray output = np.zeros_like(polar_data)
 	cdef np.int_t overlap = abs(pole_low_index - pole_high_index)
 	cdef DTYPE_f scale_reprojected_data, scale_polar_data
 	cdef np.int_t nlat = len(lat)
+	cdef np.int_t nlevels = np.shape(output)[-1]
 	cdef np.int_t k,i
 
 	if lat[pole_low_index] < 0:		# SOUTH POLE
-		for k in range(output.shape[2]):
+		for k in range(nlevels):
 			for i in range(pole_low_index):
 				
 				if i < pole_high_index:
@@ -215,11 +425,11 @@ cpdef combine_data(np.int_t pole_low_index,np.int_t pole_high_index,np.ndarray p
 					scale_polar_data = (i+1-pole_high_index)/overlap
 					scale_reprojected_data = 1 - (i+1-pole_high_index)/overlap
 				
-				output[i,:,k] = scale_reprojected_data*reprojected_data[i,:,k] + scale_polar_data*polar_data[i,:,k]
+				output[...,i,:,k] = scale_reprojected_data*reprojected_data[...,i,:,k] + scale_polar_data*polar_data[...,i,:,k]
 	
 	else:							# NORTH POLE
 		# polar_data = np.roll(polar_data,int(polar_data.shape[1]/2),axis=1)
-		for k in range(output.shape[2]):
+		for k in range(nlevels):
 			for i in range(nlat-pole_low_index):
 				
 				if i + pole_low_index + 1 > pole_high_index:
@@ -229,102 +439,329 @@ cpdef combine_data(np.int_t pole_low_index,np.int_t pole_high_index,np.ndarray p
 					scale_polar_data = 1 - i/overlap
 					scale_reprojected_data = i/overlap
 
-				output[i,:,k] = scale_reprojected_data*reprojected_data[i,:,k] + scale_polar_data*polar_data[i,:,k]
+				output[...,i,:,k] = scale_reprojected_data*reprojected_data[...,i,:,k] + scale_polar_data*polar_data[...,i,:,k]
 	return output
 
-cpdef grid_x_gradient_matrix(np.ndarray data,DTYPE_f polar_grid_resolution):
-	cdef np.ndarray shift_east = np.pad(data, ((0,0), (1,0), (0,0)), 'reflect', reflect_type='odd')[:,:-1,:]
-	cdef np.ndarray shift_west = np.pad(data, ((0,0), (0,1), (0,0)), 'reflect', reflect_type='odd')[:,1:,:]
+class Blend:
+	''' blends a field worked out on the polar plane of one hemisphere into the lat-lon one, rows between pole_high_index and pole_low_index shading from one to the other; same result as combine_data, with the weights of each row worked out once '''
+
+	def __init__(self, np.int_t pole_low_index, np.int_t pole_high_index, np.ndarray lat):
+		cdef np.int_t overlap = abs(pole_low_index - pole_high_index)
+		if lat[pole_low_index] < 0:
+			rows = range(pole_low_index)
+			self.polar_weights = np.array([0.0 if i < pole_high_index else (i+1-pole_high_index)/overlap for i in rows])
+			self.reprojected_weights = np.array([1.0 if i < pole_high_index else 1 - (i+1-pole_high_index)/overlap for i in rows])
+		else:
+			rows = range(len(lat)-pole_low_index)
+			self.polar_weights = np.array([0.0 if i + pole_low_index + 1 > pole_high_index else 1 - i/overlap for i in rows])
+			self.reprojected_weights = np.array([1.0 if i + pole_low_index + 1 > pole_high_index else i/overlap for i in rows])
+
+	def __call__(self, np.ndarray polar_data, np.ndarray reprojected_data, np.ndarray out=None):
+		''' the blend of the two, written to out if given, which may be polar_data itself '''
+		if out is None:
+			out = np.empty_like(polar_data)
+		dtype = out.dtype
+		polar = members_first(np.asarray(polar_data,dtype))
+		reprojected = members_first(np.asarray(reprojected_data,dtype))
+		if dtype == np.float32:
+			_blend_rows[np.float32_t](polar,reprojected,self.polar_weights.astype(dtype),self.reprojected_weights.astype(dtype),members_first(out))
+		else:
+			_blend_rows[np.float64_t](polar,reprojected,self.polar_weights,self.reprojected_weights,members_first(out))
+		return out
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef void _blend_rows(const DTYPE_real[:,:,:,:] polar_view, const DTYPE_real[:,:,:,:] reprojected_view, const DTYPE_real[:] polar_weights, const DTYPE_real[:] reprojected_weights, DTYPE_real[:,:,:,:] out_view):
+	cdef Py_ssize_t members = out_view.shape[0]
+	cdef Py_ssize_t nrows = out_view.shape[1]
+	cdef Py_ssize_t nlon = out_view.shape[2]
+	cdef Py_ssize_t nlevels = out_view.shape[3]
+	cdef Py_ssize_t row, m, i, j, k
+
+	for row in prange(members*nrows, nogil=True, schedule='static'):
+		m = row // nrows
+		i = row % nrows
+		for j in range(nlon):
+			for k in range(nlevels):
+				out_view[m,i,j,k] = reprojected_weights[i]*reprojected_view[m,i,j,k] + polar_weights[i]*polar_view[m,i,j,k]
+
+cpdef grid_x_gradient_matrix(np.ndarray data,DTYPE_f polar_grid_resolution,np.ndarray out=None):
+	''' gradient along x (the second last axis) of a field on a polar plane, oddly reflected at the edges; same result as grid_x_gradient_matrix_primitive '''
+	if out is None:
+		out = np.empty(np.shape(data), data.dtype)
+	np.subtract(data[...,2:,:], data[...,:-2,:], out=out[...,1:-1,:])
+	# odd reflection at the edges
+	np.subtract(data[...,1,:], 2*data[...,0,:] - data[...,1,:], out=out[...,0,:])
+	np.subtract(2*data[...,-1,:] - data[...,-2,:], data[...,-2,:], out=out[...,-1,:])
+	out /= (2 * polar_grid_resolution)
+	return out
+
+cpdef grid_x_gradient_matrix_primitive(np.ndarray data,DTYPE_f polar_grid_resolution):
+	cdef np.ndarray shift_east = np.pad(data, pad_width(data,-2,(1,0)), 'reflect', reflect_type='odd')[...,:-1,:]
+	cdef np.ndarray shift_west = np.pad(data, pad_width(data,-2,(0,1)), 'reflect', reflect_type='odd')[...,1:,:]
 	return (shift_west - shift_east) / (2 * polar_grid_resolution)
 
-cpdef grid_y_gradient_matrix(np.ndarray data,DTYPE_f polar_grid_resolution):
-	cdef np.ndarray shift_south = np.pad(data, ((1,0), (0,0), (0,0)), 'reflect', reflect_type='odd')[:-1,:,:]
-	cdef np.ndarray shift_north = np.pad(data, ((0,1), (0,0), (0,0)), 'reflect', reflect_type='odd')[1:,:,:]
+cpdef grid_y_gradient_matrix(np.ndarray data,DTYPE_f polar_grid_resolution,np.ndarray out=None):
+	''' gradient along y (the third last axis) of a field on a polar plane, oddly reflected at the edges; same result as grid_y_gradient_matrix_primitive '''
+	if out is None:
+		out = np.empty(np.shape(data), data.dtype)
+	np.subtract(data[...,2:,:,:], data[...,:-2,:,:], out=out[...,1:-1,:,:])
+	# odd reflection at the edges
+	np.subtract(data[...,1,:,:], 2*data[...,0,:,:] - data[...,1,:,:], out=out[...,0,:,:])
+	np.subtract(2*data[...,-1,:,:] - data[...,-2,:,:], data[...,-2,:,:], out=out[...,-1,:,:])
+	out /= (2 * polar_grid_resolution)
+	return out
+
+cpdef grid_y_gradient_matrix_primitive(np.ndarray data,DTYPE_f polar_grid_resolution):
+	cdef np.ndarray shift_south = np.pad(data, pad_width(data,-3,(1,0)), 'reflect', reflect_type='odd')[...,:-1,:,:]
+	cdef np.ndarray shift_north = np.pad(data, pad_width(data,-3,(0,1)), 'reflect', reflect_type='odd')[...,1:,:,:]
 	return (shift_north - shift_south) / (2 * polar_grid_resolution)
 
 cpdef grid_p_gradient_matrix(np.ndarray data, np.ndarray pressure_levels):
-	cpdef np.ndarray shift_up = np.pad(data, ((0,0), (0,0), (1,0)), 'edge')[:,:,:-1]
-	cpdef np.ndarray shift_down = np.pad(data, ((0,0), (0,0), (0,1)), 'edge')[:,:,1:]
+	cpdef np.ndarray shift_up = np.pad(data, pad_width(data,-1,(1,0)), 'edge')[...,:-1]
+	cpdef np.ndarray shift_down = np.pad(data, pad_width(data,-1,(0,1)), 'edge')[...,1:]
 	cpdef np.ndarray shift_pressures_up = np.pad(pressure_levels, (1,0), 'edge')[:-1]
 	cpdef np.ndarray shift_pressures_down = np.pad(pressure_levels, (0,1), 'edge')[1:]
 
 	return (shift_down - shift_up)/(shift_pressures_down - shift_pressures_up)
 
-cpdef grid_velocities(np.ndarray polar_plane,np.int_t grid_side_length,np.ndarray coriolis_plane,np.ndarray x_dot,np.ndarray y_dot,DTYPE_f polar_grid_resolution):
+cpdef grid_velocities(np.ndarray polar_plane,np.int_t grid_side_length,np.ndarray coriolis_plane,np.ndarray x_dot,np.ndarray y_dot,DTYPE_f polar_grid_resolution,Py_ssize_t sponge_index=17,tuple out=None):
+	''' acceleration of the winds on a polar plane in a single pass, parallel over rows and members; same result as grid_velocities_primitive. Written to out, a pair of arrays shaped like x_dot, if given '''
+	cdef np.ndarray x_dot_add, y_dot_add
+	if out is None:
+		x_dot_add = np.empty(np.shape(x_dot), x_dot.dtype)
+		y_dot_add = np.empty(np.shape(y_dot), y_dot.dtype)
+	else:
+		x_dot_add, y_dot_add = out
+
+	dtype = x_dot.dtype
+	if dtype == np.float32:
+		_plane_velocity_rows[np.float32_t](members_first(np.asarray(polar_plane,dtype)),np.asarray(coriolis_plane,dtype),members_first(x_dot),members_first(y_dot),polar_grid_resolution,sponge_index,members_first(x_dot_add),members_first(y_dot_add))
+	else:
+		_plane_velocity_rows[np.float64_t](members_first(np.asarray(polar_plane,dtype)),np.asarray(coriolis_plane,dtype),members_first(x_dot),members_first(y_dot),polar_grid_resolution,sponge_index,members_first(x_dot_add),members_first(y_dot_add))
+	return x_dot_add,y_dot_add
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef inline DTYPE_real _plane_value(const DTYPE_real[:,:,:,:] view, Py_ssize_t m, Py_ssize_t i, Py_ssize_t j, Py_ssize_t k, Py_ssize_t di, Py_ssize_t dj) nogil:
+	# view[m,i+di,j+dj,k], oddly reflected about the edge of the plane when that lies beyond it
+	cdef Py_ssize_t i_next = i + di
+	cdef Py_ssize_t j_next = j + dj
+	if i_next < 0 or i_next >= view.shape[1] or j_next < 0 or j_next >= view.shape[2]:
+		return 2*view[m,i,j,k] - view[m,i-di,j-dj,k]
+	return view[m,i_next,j_next,k]
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+cdef void _plane_velocity_rows(const DTYPE_real[:,:,:,:] geopotential_view, const DTYPE_real[:,:] coriolis_view, const DTYPE_real[:,:,:,:] x_dot_view, const DTYPE_real[:,:,:,:] y_dot_view, DTYPE_f resolution, Py_ssize_t sponge_index, DTYPE_real[:,:,:,:] x_add_view, DTYPE_real[:,:,:,:] y_add_view):
+	cdef Py_ssize_t members = x_dot_view.shape[0]
+	cdef Py_ssize_t ny = x_dot_view.shape[1]
+	cdef Py_ssize_t nx = x_dot_view.shape[2]
+	cdef Py_ssize_t nlevels = x_dot_view.shape[3]
+	cdef Py_ssize_t row, m, i, j, k
+
+	cdef DTYPE_real x_here, y_here, x_advection, y_advection
+
+	for row in prange(members*ny, nogil=True, schedule='static'):
+		m = row // ny
+		i = row % ny
+		for j in range(nx):
+			for k in range(nlevels):
+				x_here = x_dot_view[m,i,j,k]
+				y_here = y_dot_view[m,i,j,k]
+
+				if k < sponge_index:
+					# upwind advection, term by term in the same order as grid_velocities_primitive
+					x_advection = (-(0.5*(x_here + fabs(x_here))*(x_here - _plane_value(x_dot_view,m,i,j,k,0,-1))/resolution + 0.5*(x_here - fabs(x_here))*(_plane_value(x_dot_view,m,i,j,k,0,1) - x_here)/resolution)
+						- (0.5*(y_here + fabs(y_here))*(x_here - _plane_value(x_dot_view,m,i,j,k,-1,0))/resolution + 0.5*(y_here - fabs(y_here))*(_plane_value(x_dot_view,m,i,j,k,1,0) - x_here)/resolution))
+					y_advection = (-(0.5*(x_here + fabs(x_here))*(y_here - _plane_value(y_dot_view,m,i,j,k,0,-1))/resolution + 0.5*(x_here - fabs(x_here))*(_plane_value(y_dot_view,m,i,j,k,0,1) - y_here)/resolution)
+						- (0.5*(y_here + fabs(y_here))*(y_here - _plane_value(y_dot_view,m,i,j,k,-1,0))/resolution + 0.5*(y_here - fabs(y_here))*(_plane_value(y_dot_view,m,i,j,k,1,0) - y_here)/resolution))
+
+					x_add_view[m,i,j,k] = x_advection + (coriolis_view[i,j]*y_here - (_plane_value(geopotential_view,m,i,j,k,0,1) - _plane_value(geopotential_view,m,i,j,k,0,-1))/(2*resolution) - 1E-5*x_here)
+					y_add_view[m,i,j,k] = y_advection + (-coriolis_view[i,j]*x_here - (_plane_value(geopotential_view,m,i,j,k,1,0) - _plane_value(geopotential_view,m,i,j,k,-1,0))/(2*resolution) - 1E-5*y_here)
+				else:
+					# sponge layer
+					x_add_view[m,i,j,k] = - x_here*(_plane_value(x_dot_view,m,i,j,k,0,1) - _plane_value(x_dot_view,m,i,j,k,0,-1))/(2*resolution) - y_here*(_plane_value(x_dot_view,m,i,j,k,1,0) - _plane_value(x_dot_view,m,i,j,k,-1,0))/(2*resolution) - 1E-3*x_here
+					y_add_view[m,i,j,k] = - x_here*(_plane_value(y_dot_view,m,i,j,k,0,1) - _plane_value(y_dot_view,m,i,j,k,0,-1))/(2*resolution) - y_here*(_plane_value(y_dot_view,m,i,j,k,1,0) - _plane_value(y_dot_view,m,i,j,k,-1,0))/(2*resolution) - 1E-3*y_here
+
+cpdef grid_velocities_primitive(np.ndarray polar_plane,np.int_t grid_side_length,np.ndarray coriolis_plane,np.ndarray x_dot,np.ndarray y_dot,DTYPE_f polar_grid_resolution):
 	
 	cpdef np.ndarray x_dot_add = np.zeros_like(x_dot)
 	cpdef np.ndarray y_dot_add = np.zeros_like(y_dot)
 
-	x_dot_add -= 0.5*(x_dot + abs(x_dot))*(x_dot - np.pad(x_dot,((0,0), (1,0), (0,0)), 'reflect', reflect_type='odd')[:,:-1,:])/polar_grid_resolution + 0.5*(x_dot - abs(x_dot))*(np.pad(x_dot, ((0,0), (0,1), (0,0)), 'reflect', reflect_type='odd')[:,1:,:] - x_dot)/polar_grid_resolution
-	x_dot_add -= 0.5*(y_dot + abs(y_dot))*(x_dot - np.pad(x_dot,((1,0), (0,0), (0,0)), 'reflect', reflect_type='odd')[:-1,:,:])/polar_grid_resolution + 0.5*(y_dot - abs(y_dot))*(np.pad(x_dot, ((0,1), (0,0), (0,0)), 'reflect', reflect_type='odd')[1:,:,:] - x_dot)/polar_grid_resolution
-	x_dot_add += coriolis_plane[:,:,None]*y_dot - grid_x_gradient_matrix(polar_plane,polar_grid_resolution) - 1E-5*x_dot
+	x_dot_add -= 0.5*(x_dot + abs(x_dot))*(x_dot - np.pad(x_dot, pad_width(x_dot,-2,(1,0)), 'reflect', reflect_type='odd')[...,:-1,:])/polar_grid_resolution + 0.5*(x_dot - abs(x_dot))*(np.pad(x_dot, pad_width(x_dot,-2,(0,1)), 'reflect', reflect_type='odd')[...,1:,:] - x_dot)/polar_grid_resolution
+	x_dot_add -= 0.5*(y_dot + abs(y_dot))*(x_dot - np.pad(x_dot, pad_width(x_dot,-3,(1,0)), 'reflect', reflect_type='odd')[...,:-1,:,:])/polar_grid_resolution + 0.5*(y_dot - abs(y_dot))*(np.pad(x_dot, pad_width(x_dot,-3,(0,1)), 'reflect', reflect_type='odd')[...,1:,:,:] - x_dot)/polar_grid_resolution
+	x_dot_add += coriolis_plane[:,:,None]*y_dot - grid_x_gradient_matrix_primitive(polar_plane,polar_grid_resolution) - 1E-5*x_dot
 
-	y_dot_add -= 0.5*(x_dot + abs(x_dot))*(y_dot - np.pad(y_dot,((0,0), (1,0), (0,0)), 'reflect', reflect_type='odd')[:,:-1,:])/polar_grid_resolution + 0.5*(x_dot - abs(x_dot))*(np.pad(y_dot, ((0,0), (0,1), (0,0)), 'reflect', reflect_type='odd')[:,1:,:] - y_dot)/polar_grid_resolution
-	y_dot_add -= 0.5*(y_dot + abs(y_dot))*(y_dot - np.pad(y_dot,((1,0), (0,0), (0,0)), 'reflect', reflect_type='odd')[:-1,:,:])/polar_grid_resolution + 0.5*(y_dot - abs(y_dot))*(np.pad(y_dot, ((0,1), (0,0), (0,0)), 'reflect', reflect_type='odd')[1:,:,:] - y_dot)/polar_grid_resolution
-	y_dot_add += - coriolis_plane[:,:,None]*x_dot - grid_y_gradient_matrix(polar_plane,polar_grid_resolution) - 1E-5*y_dot
+	y_dot_add -= 0.5*(x_dot + abs(x_dot))*(y_dot - np.pad(y_dot, pad_width(y_dot,-2,(1,0)), 'reflect', reflect_type='odd')[...,:-1,:])/polar_grid_resolution + 0.5*(x_dot - abs(x_dot))*(np.pad(y_dot, pad_width(y_dot,-2,(0,1)), 'reflect', reflect_type='odd')[...,1:,:] - y_dot)/polar_grid_resolution
+	y_dot_add -= 0.5*(y_dot + abs(y_dot))*(y_dot - np.pad(y_dot, pad_width(y_dot,-3,(1,0)), 'reflect', reflect_type='odd')[...,:-1,:,:])/polar_grid_resolution + 0.5*(y_dot - abs(y_dot))*(np.pad(y_dot, pad_width(y_dot,-3,(0,1)), 'reflect', reflect_type='odd')[...,1:,:,:] - y_dot)/polar_grid_resolution
+	y_dot_add += - coriolis_plane[:,:,None]*x_dot - grid_y_gradient_matrix_primitive(polar_plane,polar_grid_resolution) - 1E-5*y_dot
 
-	x_dot_add[:,:,17:] *= 0
-	y_dot_add[:,:,17:] *= 0
+	x_dot_add[...,17:] *= 0
+	y_dot_add[...,17:] *= 0
 
 	# sponge layer
-	x_dot_add[:,:,17:] = - x_dot[:,:,17:]*grid_x_gradient_matrix(x_dot,polar_grid_resolution)[:,:,17:] - y_dot[:,:,17:]*grid_y_gradient_matrix(x_dot,polar_grid_resolution)[:,:,17:] - 1E-3*x_dot[:,:,17:]
-	y_dot_add[:,:,17:] = - x_dot[:,:,17:]*grid_x_gradient_matrix(y_dot,polar_grid_resolution)[:,:,17:] - y_dot[:,:,17:]*grid_y_gradient_matrix(y_dot,polar_grid_resolution)[:,:,17:] - 1E-3*y_dot[:,:,17:]
+	x_dot_add[...,17:] = - x_dot[...,17:]*grid_x_gradient_matrix_primitive(x_dot,polar_grid_resolution)[...,17:] - y_dot[...,17:]*grid_y_gradient_matrix_primitive(x_dot,polar_grid_resolution)[...,17:] - 1E-3*x_dot[...,17:]
+	y_dot_add[...,17:] = - x_dot[...,17:]*grid_x_gradient_matrix_primitive(y_dot,polar_grid_resolution)[...,17:] - y_dot[...,17:]*grid_y_gradient_matrix_primitive(y_dot,polar_grid_resolution)[...,17:] - 1E-3*y_dot[...,17:]
 
 	return x_dot_add,y_dot_add
 
-cpdef project_velocities_north(np.ndarray lon,np.ndarray x_dot,np.ndarray y_dot,np.int_t pole_low_index_N,np.int_t pole_high_index_N,np.ndarray grid_x_values_N,np.ndarray grid_y_values_N,list polar_x_coords_N,list polar_y_coords_N):
+cpdef project_velocities_north(np.ndarray lon,np.ndarray x_dot,np.ndarray y_dot,np.int_t pole_low_index_N,np.int_t pole_high_index_N,np.ndarray grid_x_values_N,np.ndarray grid_y_values_N,polar_x_coords_N,polar_y_coords_N,operator=None,workspace=None):
+	''' winds on the polar plane as u and v on the lat-lon grid around the north pole, flipped in longitude; with a workspace they are (views of) scratch arrays of it '''
+	cdef tuple shape = np.shape(x_dot)[:x_dot.ndim-3] + (int(len(polar_x_coords_N)/len(lon)),len(lon),x_dot.shape[x_dot.ndim-1])
+	dtype = x_dot.dtype
+	cdef np.ndarray reproj_x_dot = beam_me_down(lon,x_dot,pole_low_index_N,grid_x_values_N,grid_y_values_N,polar_x_coords_N,polar_y_coords_N,operator,scratch(workspace,'reproj_x_dot',shape,dtype))
+	cdef np.ndarray reproj_y_dot = beam_me_down(lon,y_dot,pole_low_index_N,grid_x_values_N,grid_y_values_N,polar_x_coords_N,polar_y_coords_N,operator,scratch(workspace,'reproj_y_dot',shape,dtype))
+
+	cdef np.ndarray sin_lon = np.sin(lon[:,None]*np.pi/180)
+	cdef np.ndarray cos_lon = np.cos(lon[:,None]*np.pi/180)
+	cdef np.ndarray product = scratch(workspace,'reproj_product',shape,dtype)
+
+	cdef np.ndarray reproj_u = np.multiply(reproj_x_dot,sin_lon,out=scratch(workspace,'reproj_u',shape,dtype))
+	reproj_u += np.multiply(reproj_y_dot,cos_lon,out=product)
+	cdef np.ndarray reproj_v = np.multiply(reproj_x_dot,cos_lon,out=scratch(workspace,'reproj_v',shape,dtype))
+	reproj_v -= np.multiply(reproj_y_dot,sin_lon,out=product)
 
-	cdef np.ndarray reproj_x_dot = beam_me_down(lon,x_dot,pole_low_index_N,grid_x_values_N,grid_y_values_N,polar_x_coords_N,polar_y_coords_N)		
-	cdef np.ndarray reproj_y_dot = beam_me_down(lon,y_dot,pole_low_index_N,grid_x_values_N,grid_y_values_N,polar_x_coords_N,polar_y_coords_N)
+	return np.flip(reproj_u,axis=-2), np.flip(reproj_v,axis=-2)
+
+cpdef project_velocities_north_primitive(np.ndarray lon,np.ndarray x_dot,np.ndarray y_dot,np.int_t pole_low_index_N,np.int_t pole_high_index_N,np.ndarray grid_x_values_N,np.ndarray grid_y_values_N,polar_x_coords_N,polar_y_coords_N,operator=None):
+
+	cdef np.ndarray reproj_x_dot = beam_me_down(lon,x_dot,pole_low_index_N,grid_x_values_N,grid_y_values_N,polar_x_coords_N,polar_y_coords_N,operator)		
+	cdef np.ndarray reproj_y_dot = beam_me_down(lon,y_dot,pole_low_index_N,grid_x_values_N,grid_y_values_N,polar_x_coords_N,polar_y_coords_N,operator)
 
 	cdef np.ndarray reproj_u = + reproj_x_dot*np.sin(lon[None,:,None]*np.pi/180) + reproj_y_dot*np.cos(lon[None,:,None]*np.pi/180)
 	cdef np.ndarray reproj_v = + reproj_x_dot*np.cos(lon[None,:,None]*np.pi/180) - reproj_y_dot*np.sin(lon[None,:,None]*np.pi/180)
 
-	reproj_u = np.flip(reproj_u,axis=1)
-	reproj_v = np.flip(reproj_v,axis=1)
+	reproj_u = np.flip(reproj_u,axis=-2)
+	reproj_v = np.flip(reproj_v,axis=-2)
 	
 	return reproj_u, reproj_v
 
-cpdef project_velocities_south(np.ndarray lon,np.ndarray x_dot,np.ndarray y_dot,np.int_t pole_low_index_S,np.int_t pole_high_index_S,np.ndarray grid_x_values_S,np.ndarray grid_y_values_S,list polar_x_coords_S,list polar_y_coords_S):
-	cdef np.ndarray reproj_x_dot = beam_me_down(lon,x_dot,pole_low_index_S,grid_x_values_S,grid_y_values_S,polar_x_coords_S,polar_y_coords_S)		
-	cdef np.ndarray reproj_y_dot = beam_me_down(lon,y_dot,pole_low_index_S,grid_x_values_S,grid_y_values_S,polar_x_coords_S,polar_y_coords_S)
+cpdef project_velocities_south(np.ndarray lon,np.ndarray x_dot,np.ndarray y_dot,np.int_t pole_low_index_S,np.int_t pole_high_index_S,np.ndarray grid_x_values_S,np.ndarray grid_y_values_S,polar_x_coords_S,polar_y_coords_S,operator=None,workspace=None):
+	''' winds on the polar plane as u and v on the lat-lon grid around the south pole; with a workspace they are scratch arrays of it '''
+	cdef tuple shape = np.shape(x_dot)[:x_dot.ndim-3] + (int(len(polar_x_coords_S)/len(lon)),len(lon),x_dot.shape[x_dot.ndim-1])
+	dtype = x_dot.dtype
+	cdef np.ndarray reproj_x_dot = beam_me_down(lon,x_dot,pole_low_index_S,grid_x_values_S,grid_y_values_S,polar_x_coords_S,polar_y_coords_S,operator,scratch(workspace,'reproj_x_dot',shape,dtype))
+	cdef np.ndarray reproj_y_dot = beam_me_down(lon,y_dot,pole_low_index_S,grid_x_values_S,grid_y_values_S,polar_x_coords_S,polar_y_coords_S,operator,scratch(workspace,'reproj_y_dot',shape,dtype))
+
+	cdef np.ndarray sin_lon = np.sin(lon[:,None]*np.pi/180)
+	cdef np.ndarray cos_lon = np.cos(lon[:,None]*np.pi/180)
+	cdef np.ndarray product = scratch(workspace,'reproj_product',shape,dtype)
+
+	cdef np.ndarray reproj_u = np.multiply(reproj_x_dot,sin_lon,out=scratch(workspace,'reproj_u',shape,dtype))
+	reproj_u += np.multiply(reproj_y_dot,cos_lon,out=product)
+	cdef np.ndarray reproj_v = np.multiply(reproj_y_dot,sin_lon,out=scratch(workspace,'reproj_v',shape,dtype))
+	reproj_v -= np.multiply(reproj_x_dot,cos_lon,out=product)
+
+	return reproj_u, reproj_v
+
+cpdef project_velocities_south_primitive(np.ndarray lon,np.ndarray x_dot,np.ndarray y_dot,np.int_t pole_low_index_S,np.int_t pole_high_index_S,np.ndarray grid_x_values_S,np.ndarray grid_y_values_S,polar_x_coords_S,polar_y_coords_S,operator=None):
+	cdef np.ndarray reproj_x_dot = beam_me_down(lon,x_dot,pole_low_index_S,grid_x_values_S,grid_y_values_S,polar_x_coords_S,polar_y_coords_S,operator)		
+	cdef np.ndarray reproj_y_dot = beam_me_down(lon,y_dot,pole_low_index_S,grid_x_values_S,grid_y_values_S,polar_x_coords_S,polar_y_coords_S,operator)
 
 	cdef np.ndarray reproj_u = + reproj_x_dot*np.sin(lon[None,:,None]*np.pi/180) + reproj_y_dot*np.cos(lon[None,:,None]*np.pi/180)
 	cdef np.ndarray reproj_v = - reproj_x_dot*np.cos(lon[None,:,None]*np.pi/180) + reproj_y_dot*np.sin(lon[None,:,None]*np.pi/180)
 
 	return reproj_u, reproj_v
 
-cpdef polar_plane_advect(np.ndarray data,np.ndarray x_dot,np.ndarray y_dot, DTYPE_f polar_grid_resolution):
+cpdef polar_plane_advect(np.ndarray data,np.ndarray x_dot,np.ndarray y_dot, DTYPE_f polar_grid_resolution,np.ndarray out=None):
+	''' upwind advection of a field on a polar plane in a single pass, parallel over rows and members; same result as polar_plane_advect_primitive '''
+	if out is None:
+		out = np.empty(np.shape(data), data.dtype)
+	dtype = out.dtype
+	if dtype == np.float32:
+		_plane_advection_rows[np.float32_t](members_first(np.asarray(data,dtype)),members_first(np.asarray(x_dot,dtype)),members_first(np.asarray(y_dot,dtype)),polar_grid_resolution,members_first(out))
+	else:
+		_plane_advection_rows[np.float64_t](members_first(np.asarray(data,dtype)),members_first(np.asarray(x_dot,dtype)),members_first(np.asarray(y_dot,dtype)),polar_grid_resolution,members_first(out))
+	return out
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+cdef void _plane_advection_rows(const DTYPE_real[:,:,:,:] data_view, const DTYPE_real[:,:,:,:] x_dot_view, const DTYPE_real[:,:,:,:] y_dot_view, DTYPE_f resolution, DTYPE_real[:,:,:,:] out_view):
+	cdef Py_ssize_t members = data_view.shape[0]
+	cdef Py_ssize_t ny = data_view.shape[1]
+	cdef Py_ssize_t nx = data_view.shape[2]
+	cdef Py_ssize_t nlevels = data_view.shape[3]
+	cdef Py_ssize_t row, m, i, j, k
+
+	cdef DTYPE_real a_here, x_here, y_here
+
+	for row in prange(members*ny, nogil=True, schedule='static'):
+		m = row // ny
+		i = row % ny
+		for j in range(nx):
+			for k in range(nlevels):
+				a_here = data_view[m,i,j,k]
+				x_here = x_dot_view[m,i,j,k]
+				y_here = y_dot_view[m,i,j,k]
+				# term by term in the same order as polar_plane_advect_primitive
+				out_view[m,i,j,k] = (0.5*(x_here + fabs(x_here))*(a_here - _plane_value(data_view,m,i,j,k,0,-1))/resolution
+					+ 0.5*(x_here - fabs(x_here))*(_plane_value(data_view,m,i,j,k,0,1) - a_here)/resolution
+					+ 0.5*(y_here + fabs(y_here))*(a_here - _plane_value(data_view,m,i,j,k,-1,0))/resolution
+					+ 0.5*(y_here - fabs(y_here))*(_plane_value(data_view,m,i,j,k,1,0) - a_here)/resolution)
+
+cpdef polar_plane_advect_primitive(np.ndarray data,np.ndarray x_dot,np.ndarray y_dot, DTYPE_f polar_grid_resolution):
 	
 	cpdef np.ndarray output = np.zeros_like(data)
 
-	output += 0.5*(x_dot + abs(x_dot))*(data - np.pad(data, ((0,0), (1,0), (0,0)), 'reflect', reflect_type='odd')[:,:-1,:])/polar_grid_resolution 
-	output += 0.5*(x_dot - abs(x_dot))*(np.pad(data, ((0,0), (0,1), (0,0)), 'reflect', reflect_type='odd')[:,1:,:] - data)/polar_grid_resolution
-	output += 0.5*(y_dot + abs(y_dot))*(data - np.pad(data, ((1,0), (0,0), (0,0)), 'reflect', reflect_type='odd')[:-1,:,:])/polar_grid_resolution
-	output += 0.5*(y_dot - abs(y_dot))*(np.pad(data, ((0,1), (0,0), (0,0)), 'reflect', reflect_type='odd')[1:,:,:] - data)/polar_grid_resolution
+	output += 0.5*(x_dot + abs(x_dot))*(data - np.pad(data, pad_width(data,-2,(1,0)), 'reflect', reflect_type='odd')[...,:-1,:])/polar_grid_resolution 
+	output += 0.5*(x_dot - abs(x_dot))*(np.pad(data, pad_width(data,-2,(0,1)), 'reflect', reflect_type='odd')[...,1:,:] - data)/polar_grid_resolution
+	output += 0.5*(y_dot + abs(y_dot))*(data - np.pad(data, pad_width(data,-3,(1,0)), 'reflect', reflect_type='odd')[...,:-1,:,:])/polar_grid_resolution
+	output += 0.5*(y_dot - abs(y_dot))*(np.pad(data, pad_width(data,-3,(0,1)), 'reflect', reflect_type='odd')[...,1:,:,:] - data)/polar_grid_resolution
 	
 	return output
 
-cpdef upload_velocities(np.ndarray lat,np.ndarray lon,np.ndarray reproj_u,np.ndarray reproj_v,np.int_t grid_size,np.ndarray grid_lat_coords,np.ndarray grid_lon_coords):
-	
-	cdef np.ndarray grid_u = beam_me_up(lat,lon,reproj_u,grid_size,grid_lat_coords,grid_lon_coords)
-	cdef np.ndarray grid_v = beam_me_up(lat,lon,reproj_v,grid_size,grid_lat_coords,grid_lon_coords)
+cpdef upload_velocities(np.ndarray lat,np.ndarray lon,np.ndarray reproj_u,np.ndarray reproj_v,np.int_t grid_size,np.ndarray grid_lat_coords,np.ndarray grid_lon_coords,operator=None,tuple out=None,workspace=None):
+	''' u and v on the lat-lon grid as winds on the polar plane, written to out (a pair of arrays) if given; the projections go through scratch arrays of workspace '''
+	cdef tuple shape = np.shape(reproj_u)[:reproj_u.ndim-3] + (grid_size,grid_size,reproj_u.shape[reproj_u.ndim-1])
+	dtype = reproj_u.dtype
+	cdef np.ndarray grid_u = beam_me_up(lat,lon,reproj_u,grid_size,grid_lat_coords,grid_lon_coords,operator,scratch(workspace,'grid_u',shape,dtype))
+	cdef np.ndarray grid_v = beam_me_up(lat,lon,reproj_v,grid_size,grid_lat_coords,grid_lon_coords,operator,scratch(workspace,'grid_v',shape,dtype))
+
+	cdef np.ndarray x_dot, y_dot
+	if out is None:
+		x_dot = np.empty(shape, dtype)
+		y_dot = np.empty(shape, dtype)
+	else:
+		x_dot, y_dot = out
+	cdef np.ndarray product = scratch(workspace,'plane_product',shape,dtype)
 
-	cdef np.int_t nlevels = reproj_u.shape[2]
+	grid_lon_coords = grid_lon_coords.reshape((grid_size,grid_size))
+	cdef np.ndarray sin_lon = np.sin(grid_lon_coords*np.pi/180)[:,:,None]
+	cdef np.ndarray cos_lon = np.cos(grid_lon_coords*np.pi/180)[:,:,None]
 
-	cdef np.ndarray x_dot = np.zeros((grid_size,grid_size,nlevels))	
-	cdef np.ndarray y_dot = np.zeros((grid_size,grid_size,nlevels))	
+	if lat[0] < 0:
+		np.multiply(grid_u,sin_lon,out=x_dot)
+		x_dot -= np.multiply(grid_v,cos_lon,out=product)
+		np.multiply(grid_u,cos_lon,out=y_dot)
+		y_dot += np.multiply(grid_v,sin_lon,out=product)
+	else:
+		np.multiply(grid_v,cos_lon,out=x_dot)
+		x_dot -= np.multiply(grid_u,sin_lon,out=product)
+		np.negative(np.multiply(grid_u,cos_lon,out=y_dot),out=y_dot)
+		y_dot -= np.multiply(grid_v,sin_lon,out=product)
+
+	return x_dot,y_dot
+
+cpdef upload_velocities_primitive(np.ndarray lat,np.ndarray lon,np.ndarray reproj_u,np.ndarray reproj_v,np.int_t grid_size,np.ndarray grid_lat_coords,np.ndarray grid_lon_coords,operator=None):
+	
+	cdef np.ndarray grid_u = beam_me_up(lat,lon,reproj_u,grid_size,grid_lat_coords,grid_lon_coords,operator)
+	cdef np.ndarray grid_v = beam_me_up(lat,lon,reproj_v,grid_size,grid_lat_coords,grid_lon_coords,operator)
+
+	cdef np.ndarray x_dot, y_dot
 
 	grid_lon_coords = grid_lon_coords.reshape((grid_size,grid_size))
+	cdef np.ndarray sin_lon = np.sin(grid_lon_coords*np.pi/180)[:,:,None]
+	cdef np.ndarray cos_lon = np.cos(grid_lon_coords*np.pi/180)[:,:,None]
 
 	if lat[0] < 0:
-		for k in range(nlevels):
-			x_dot[:,:,k] = grid_u[:,:,k]*np.sin(grid_lon_coords*np.pi/180) - grid_v[:,:,k]*np.cos(grid_lon_coords*np.pi/180)
-			y_dot[:,:,k] = grid_u[:,:,k]*np.cos(grid_lon_coords*np.pi/180) + grid_v[:,:,k]*np.sin(grid_lon_coords*np.pi/180)
+		x_dot = grid_u*sin_lon - grid_v*cos_lon
+		y_dot = grid_u*cos_lon + grid_v*sin_lon
 	else:
-		for k in range(nlevels):
-			x_dot[:,:,k] = -grid_u[:,:,k]*np.sin(grid_lon_coords*np.pi/180) + grid_v[:,:,k]*np.cos(grid_lon_coords*np.pi/180)
-			y_dot[:,:,k] = -grid_u[:,:,k]*np.cos(grid_lon_coords*np.pi/180) - grid_v[:,:,k]*np.sin(grid_lon_coords*np.pi/180)
+		x_dot = -grid_u*sin_lon + grid_v*cos_lon
+		y_dot = -grid_u*cos_lon - grid_v*sin_lon
 
 	return x_dot,y_dot
 
@@ -1,8 +1,29 @@
-from setuptools import setup
+import sys
+
+from setuptools import Extension, setup
 from Cython.Build import cythonize
 import numpy
 
+# the kernels run in parallel with OpenMP where the compiler supports it
+if sys.platform == "win32":
+    openmp_compile_args, openmp_link_args = ["/openmp"], []
+elif sys.platform == "darwin":
+    # Apple clang ships without OpenMP, so the kernels run on a single thread
+    openmp_compile_args, openmp_link_args = [], []
+else:
+    openmp_compile_args, openmp_link_args = ["-fopenmp"], ["-fopenmp"]
+
+extensions = [
+    Extension(
+        name,
+        [name + ".pyx"],
+        extra_compile_args=openmp_compile_args,
+        extra_link_args=openmp_link_args
+    )
+    for name in ("claude_low_level_library", "claude_top_level_library")
+]
+
 setup(
     include_dirs=[numpy.get_include()],
-    ext_modules=cythonize("*.pyx", compiler_directives={"language_level": "3"})
+    ext_modules=cythonize(extensions, compiler_directives={"language_level": "3"})
 )
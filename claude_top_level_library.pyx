@@ -1,31 +1,235 @@
 # claude_top_level_library
 
+import concurrent.futures
+
 import claude_low_level_library as low_level
 import numpy as np
 cimport numpy as np
 cimport cython
+from cython.parallel cimport parallel, prange
+from libc.math cimport fabs
+from libc.stdlib cimport free, malloc
+import scipy.fft
 
 ctypedef np.float64_t DTYPE_f
 
-cpdef laplacian_2d(np.ndarray a,np.ndarray dx,DTYPE_f dy):
-	cdef np.ndarray a_dx = (np.roll(a, -1, axis=1) - np.roll(a, 1, axis=1)) / dx[:, None]
-	cdef np.ndarray output = (np.roll(a_dx, -1, axis=1) - np.roll(a_dx, 1, axis=1)) / dx[:, None]
-
-	shift_south = np.pad(a, ((1,0), (0,0)), 'reflect', reflect_type='odd')[:-1,:]
-	shift_north = np.pad(a, ((0,1), (0,0)), 'reflect', reflect_type='odd')[1:,:]
+# truncation masks of spectral_filter, by shape and parameters
+_spectral_masks = {}
+
+# the model state is single or double precision (Config.PRECISION), and the kernels are compiled for both
+ctypedef fused DTYPE_real:
+	np.float32_t
+	np.float64_t
+
+# precision of the radiation flux recurrences, which can stay double when the state is single
+ctypedef fused DTYPE_acc:
+	np.float32_t
+	np.float64_t
+
+cpdef laplacian_2d(np.ndarray a,np.ndarray dx,DTYPE_f dy,workspace=None):
+	''' laplacian of a surface field, as laplacian_3d without the vertical part; same result as laplacian_2d_primitive '''
+	# the field is differentiated as a single level, so that it shares the gradients of the 3d fields
+	cdef np.ndarray field = a[...,None]
+	cdef tuple shape = np.shape(field)
+	cdef np.ndarray gradient = low_level.scratch(workspace,'laplacian_2d_gradient',shape,a.dtype)
+	cdef np.ndarray second_gradient = low_level.scratch(workspace,'laplacian_2d_second_gradient',shape,a.dtype)
+	cdef np.ndarray output = low_level.scratch(workspace,'laplacian_2d',shape,a.dtype)
+
+	low_level.scalar_gradient_x_matrix(low_level.scalar_gradient_x_matrix(field,dx,gradient),dx,output)
+	output += low_level.scalar_gradient_y_matrix(low_level.scalar_gradient_y_matrix(field,dy,gradient),dy,second_gradient)
+	return output[...,0]
+
+cpdef laplacian_2d_primitive(np.ndarray a,np.ndarray dx,DTYPE_f dy):
+	cdef np.ndarray a_dx = (np.roll(a, -1, axis=-1) - np.roll(a, 1, axis=-1)) / dx[:, None]
+	cdef np.ndarray output = (np.roll(a_dx, -1, axis=-1) - np.roll(a_dx, 1, axis=-1)) / dx[:, None]
+
+	shift_south = np.pad(a, low_level.pad_width(a,-2,(1,0)), 'reflect', reflect_type='odd')[...,:-1,:]
+	shift_north = np.pad(a, low_level.pad_width(a,-2,(0,1)), 'reflect', reflect_type='odd')[...,1:,:]
 	a_dy = (shift_north - shift_south)/dy
 	
-	shift_south = np.pad(a_dy, ((1,0), (0,0)), 'reflect', reflect_type='odd')[:-1,:]
-	shift_north = np.pad(a_dy, ((0,1), (0,0)), 'reflect', reflect_type='odd')[1:,:]
+	shift_south = np.pad(a_dy, low_level.pad_width(a_dy,-2,(1,0)), 'reflect', reflect_type='odd')[...,:-1,:]
+	shift_north = np.pad(a_dy, low_level.pad_width(a_dy,-2,(0,1)), 'reflect', reflect_type='odd')[...,1:,:]
 	output += (shift_north - shift_south)/dy
 
 	return output
 
-cpdef laplacian_3d(np.ndarray a,np.ndarray dx,DTYPE_f dy,np.ndarray pressure_levels):
-	cdef np.ndarray output = low_level.scalar_gradient_x_matrix(low_level.scalar_gradient_x_matrix(a,dx),dx) + low_level.scalar_gradient_y_matrix(low_level.scalar_gradient_y_matrix(a,dy),dy) + low_level.scalar_gradient_z_matrix_primitive(low_level.scalar_gradient_z_matrix_primitive(a, pressure_levels),pressure_levels)
+cpdef laplacian_3d(np.ndarray a,np.ndarray dx,DTYPE_f dy,np.ndarray pressure_levels,workspace=None):
+	cdef tuple shape = np.shape(a)
+	cdef np.ndarray gradient = low_level.scratch(workspace,'laplacian_gradient',shape,a.dtype)
+	cdef np.ndarray second_gradient = low_level.scratch(workspace,'laplacian_second_gradient',shape,a.dtype)
+	cdef np.ndarray output = low_level.scratch(workspace,'laplacian',shape,a.dtype)
+
+	low_level.scalar_gradient_x_matrix(low_level.scalar_gradient_x_matrix(a,dx,gradient),dx,output)
+	output += low_level.scalar_gradient_y_matrix(low_level.scalar_gradient_y_matrix(a,dy,gradient),dy,second_gradient)
+	output += low_level.scalar_gradient_z_matrix(low_level.scalar_gradient_z_matrix(a,pressure_levels,gradient),pressure_levels,second_gradient)
 	return output
 
-cpdef divergence_with_scalar(np.ndarray a, np.ndarray u, np.ndarray v, np.ndarray w, np.ndarray dx, DTYPE_f dy, np.ndarray pressure_levels):
+cpdef divergence_with_scalar(np.ndarray a, np.ndarray u, np.ndarray v, np.ndarray w, np.ndarray dx, DTYPE_f dy, np.ndarray pressure_levels, np.ndarray out=None):
+	''' divergence of (a*u) where a is a scalar field and u is the atmospheric velocity field, in a single pass over every member; same result as divergence_with_scalar_primitive '''
+	if out is None:
+		out = np.empty(np.shape(a), a.dtype)
+	if a.dtype == np.float32:
+		_divergence_rows[np.float32_t](low_level.members_first(a),low_level.members_first(u),low_level.members_first(v),np.asarray(dx,a.dtype),dy,low_level.members_first(out))
+	else:
+		_divergence_rows[np.float64_t](low_level.members_first(a),low_level.members_first(u),low_level.members_first(v),np.asarray(dx,a.dtype),dy,low_level.members_first(out))
+	return out
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+cdef void _divergence_rows(const DTYPE_real[:,:,:,:] a_view, const DTYPE_real[:,:,:,:] u_view, const DTYPE_real[:,:,:,:] v_view, const DTYPE_real[:] dx_view, DTYPE_f dy, DTYPE_real[:,:,:,:] out_view):
+	cdef Py_ssize_t members = a_view.shape[0]
+	cdef Py_ssize_t nlat = a_view.shape[1]
+	cdef Py_ssize_t nlon = a_view.shape[2]
+	cdef Py_ssize_t nlevels = a_view.shape[3]
+	cdef Py_ssize_t row, m, i, j, k, east, west
+
+	cdef DTYPE_real a_here, u_here, v_here, a_south, a_north, x_term, y_term
+
+	for row in prange(members*nlat, nogil=True, schedule='static'):
+		m = row // nlat
+		i = row % nlat
+		for j in range(nlon):
+			east = (j + 1) % nlon
+			west = (j + nlon - 1) % nlon
+			for k in range(nlevels):
+				a_here = a_view[m,i,j,k]
+				u_here = u_view[m,i,j,k]
+				v_here = v_view[m,i,j,k]
+
+				# odd reflection at the poles
+				if i == 0:
+					a_south = 2*a_here - a_view[m,i+1,j,k]
+				else:
+					a_south = a_view[m,i-1,j,k]
+				if i == nlat-1:
+					a_north = 2*a_here - a_view[m,i-1,j,k]
+				else:
+					a_north = a_view[m,i+1,j,k]
+
+				x_term = (u_here + fabs(u_here))*(a_here - a_view[m,i,west,k])/dx_view[i] + (u_here - fabs(u_here))*(a_view[m,i,east,k] - a_here)/dx_view[i]
+				y_term = (v_here + fabs(v_here))*(a_here - a_south)/dy + (v_here - fabs(v_here))*(a_north - a_here)/dy
+				out_view[m,i,j,k] = x_term + y_term
+
+cpdef tuple advect_scalars(np.ndarray theta, np.ndarray tracers, np.ndarray u, np.ndarray v, np.ndarray w, np.ndarray dx, DTYPE_f dy, np.ndarray pressure_levels, np.ndarray tracer_rows=None, np.ndarray theta_out=None, np.ndarray tracer_out=None):
+	''' advection of theta (exactly as divergence_with_scalar) and of a block of passive tracers, shaped (tracers, lat, lon, level) after any member axes, in one pass over each row; the upwind coefficients are worked out once per gridpoint and shared by all of them. The tracers are also upwinded vertically, and horizontally only on tracer_rows (every row by default) '''
+	if theta_out is None:
+		theta_out = np.empty(np.shape(theta), theta.dtype)
+	if tracer_out is None:
+		tracer_out = np.empty(np.shape(tracers), theta.dtype)
+	if tracer_rows is None:
+		tracer_rows = np.ones(np.shape(theta)[-3], np.uint8)
+	cdef np.ndarray rows = np.asarray(tracer_rows, np.uint8)
+	# one over the pressure spacing of the layer below each level
+	cdef np.ndarray inverse_spacing = np.ones(len(pressure_levels), theta.dtype)
+	inverse_spacing[1:] = 1/np.diff(pressure_levels)
+	# (members, tracers, lat, lon, level), which may hold no tracers at all
+	cdef tuple block_shape = (low_level.members_first(theta).shape[0],) + np.shape(tracers)[tracers.ndim-4:]
+	cdef np.ndarray tracer_block = tracers.reshape(block_shape)
+	cdef np.ndarray tracer_out_block = tracer_out.reshape(block_shape)
+	if theta.dtype == np.float32:
+		_advection_rows[np.float32_t](low_level.members_first(theta),tracer_block,low_level.members_first(u),low_level.members_first(v),low_level.members_first(w),np.asarray(dx,theta.dtype),dy,inverse_spacing,rows,low_level.members_first(theta_out),tracer_out_block)
+	else:
+		_advection_rows[np.float64_t](low_level.members_first(theta),tracer_block,low_level.members_first(u),low_level.members_first(v),low_level.members_first(w),np.asarray(dx,theta.dtype),dy,inverse_spacing,rows,low_level.members_first(theta_out),tracer_out_block)
+	return theta_out, tracer_out
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+cdef void _advection_rows(const DTYPE_real[:,:,:,:] theta_view, const DTYPE_real[:,:,:,:,:] tracer_view, const DTYPE_real[:,:,:,:] u_view, const DTYPE_real[:,:,:,:] v_view, const DTYPE_real[:,:,:,:] w_view, const DTYPE_real[:] dx_view, DTYPE_f dy, const DTYPE_real[:] inverse_spacing, const unsigned char[:] tracer_rows, DTYPE_real[:,:,:,:] theta_out, DTYPE_real[:,:,:,:,:] tracer_out):
+	cdef Py_ssize_t members = theta_view.shape[0]
+	cdef Py_ssize_t ntracers = tracer_view.shape[1]
+	cdef Py_ssize_t nlat = theta_view.shape[1]
+	cdef Py_ssize_t nlon = theta_view.shape[2]
+	cdef Py_ssize_t nlevels = theta_view.shape[3]
+	cdef Py_ssize_t size = nlon*nlevels
+	cdef Py_ssize_t row, m, n, i, j, k, east, west, south, north, index
+
+	cdef DTYPE_real u_east, u_west, v_north, v_south, a_here, a_south, a_north, x_term, y_term, tendency, inverse_dx
+	cdef DTYPE_real inverse_dy = 1/dy
+	# upwind coefficients of the tracers along one row, per thread
+	cdef DTYPE_real *coefficients
+	cdef DTYPE_real *c_east
+	cdef DTYPE_real *c_west
+	cdef DTYPE_real *c_north
+	cdef DTYPE_real *c_south
+	cdef DTYPE_real *c_down
+	cdef DTYPE_real *c_up
+
+	with nogil, parallel():
+		coefficients = <DTYPE_real *> malloc(6*size*sizeof(DTYPE_real))
+		c_east = coefficients
+		c_west = coefficients + size
+		c_north = coefficients + 2*size
+		c_south = coefficients + 3*size
+		c_down = coefficients + 4*size
+		c_up = coefficients + 5*size
+
+		for row in prange(members*nlat, schedule='static'):
+			m = row // nlat
+			i = row % nlat
+			# neighbouring rows, reflected at the poles
+			south = i - 1 if i > 0 else i + 1
+			north = i + 1 if i < nlat-1 else i - 1
+			inverse_dx = 1/dx_view[i]
+
+			# theta exactly as divergence_with_scalar, keeping the coefficients for the tracers
+			for j in range(nlon):
+				east = (j + 1) % nlon
+				west = (j + nlon - 1) % nlon
+				for k in range(nlevels):
+					index = j*nlevels + k
+					u_east = u_view[m,i,j,k] + fabs(u_view[m,i,j,k])
+					u_west = u_view[m,i,j,k] - fabs(u_view[m,i,j,k])
+					v_north = v_view[m,i,j,k] + fabs(v_view[m,i,j,k])
+					v_south = v_view[m,i,j,k] - fabs(v_view[m,i,j,k])
+
+					a_here = theta_view[m,i,j,k]
+					# odd reflection at the poles
+					a_south = 2*a_here - theta_view[m,south,j,k] if i == 0 else theta_view[m,south,j,k]
+					a_north = 2*a_here - theta_view[m,north,j,k] if i == nlat-1 else theta_view[m,north,j,k]
+					x_term = u_east*(a_here - theta_view[m,i,west,k])/dx_view[i] + u_west*(theta_view[m,i,east,k] - a_here)/dx_view[i]
+					y_term = v_north*(a_here - a_south)/dy + v_south*(a_north - a_here)/dy
+					theta_out[m,i,j,k] = x_term + y_term
+
+					if tracer_rows[i]:
+						c_east[index] = u_east*inverse_dx
+						c_west[index] = u_west*inverse_dx
+						c_north[index] = v_north*inverse_dy
+						c_south[index] = v_south*inverse_dy
+					else:
+						c_east[index] = 0
+						c_west[index] = 0
+						c_north[index] = 0
+						c_south[index] = 0
+					if 0 < k < nlevels-1:
+						c_down[index] = 0.5*(w_view[m,i,j,k] - fabs(w_view[m,i,j,k]))*inverse_spacing[k]
+						c_up[index] = 0.5*(w_view[m,i,j,k] + fabs(w_view[m,i,j,k]))*inverse_spacing[k]
+					else:
+						c_down[index] = 0
+						c_up[index] = 0
+
+			# then every tracer in turn, the horizontal and vertical upwinding together
+			for n in range(ntracers):
+				for j in range(nlon):
+					east = (j + 1) % nlon
+					west = (j + nlon - 1) % nlon
+					for k in range(nlevels):
+						index = j*nlevels + k
+						a_here = tracer_view[m,n,i,j,k]
+						a_south = 2*a_here - tracer_view[m,n,south,j,k] if i == 0 else tracer_view[m,n,south,j,k]
+						a_north = 2*a_here - tracer_view[m,n,north,j,k] if i == nlat-1 else tracer_view[m,n,north,j,k]
+						tendency = (
+							c_east[index]*(a_here - tracer_view[m,n,i,west,k]) + c_west[index]*(tracer_view[m,n,i,east,k] - a_here)
+							+ c_north[index]*(a_here - a_south) + c_south[index]*(a_north - a_here)
+						)
+						if 0 < k < nlevels-1:
+							tendency = tendency + c_down[index]*(a_here - tracer_view[m,n,i,j,k-1]) + c_up[index]*(tracer_view[m,n,i,j,k+1] - a_here)
+						tracer_out[m,n,i,j,k] = tendency
+
+		free(coefficients)
+
+cpdef divergence_with_scalar_primitive(np.ndarray a, np.ndarray u, np.ndarray v, np.ndarray w, np.ndarray dx, DTYPE_f dy, np.ndarray pressure_levels):
 	''' divergence of (a*u) where a is a scalar field and u is the atmospheric velocity field '''
 	# https://scicomp.stackexchange.com/questions/27737/advection-equation-with-finite-difference-importance-of-forward-backward-or-ce
 
@@ -37,7 +241,119 @@ cpdef divergence_with_scalar(np.ndarray a, np.ndarray u, np.ndarray v, np.ndarra
 	
 	return output
 
-cpdef radiation_calculation(np.ndarray temperature_world, np.ndarray potential_temperature, np.ndarray pressure_levels, np.ndarray heat_capacity_earth, np.ndarray albedo, DTYPE_f insolation, np.ndarray lat, np.ndarray lon, np.int_t t, np.int_t dt, DTYPE_f day, DTYPE_f year, DTYPE_f axial_tilt):
+cpdef radiation_coefficients(np.ndarray pressure_levels, np.ndarray lat):
+	''' optical depth steps and per-level coefficients for radiation_calculation, which only depend on the grid '''
+	cdef DTYPE_f fl = 0.1
+	cdef DTYPE_f inv_day = 1/(24*60*60)
+
+	cdef np.ndarray sun_lat = low_level.surface_optical_depth_array(lat)
+	cdef np.ndarray optical_depth = np.outer(sun_lat, (fl*(pressure_levels/pressure_levels[0]) + (1-fl)*(pressure_levels/pressure_levels[0])**4))
+
+	# change in optical depth across the layer below each level, and the denominator of the flux recurrences
+	cdef np.ndarray depth_step = np.zeros_like(optical_depth)
+	depth_step[:,1:] = optical_depth[:,1:] - optical_depth[:,:-1]
+	cdef np.ndarray depth_denominator = np.ones_like(optical_depth)
+	depth_denominator[:,1:] = 1 + optical_depth[:,:-1] - optical_depth[:,1:]
+
+	# pressure spacing of the vertical gradient, one-sided at the top and bottom as in scalar_gradient_z_matrix
+	cdef np.ndarray gradient_spacing = (np.pad(pressure_levels, (0,1), 'edge')[1:] - np.pad(pressure_levels, (1,0), 'edge')[:-1]).astype(np.float64)
+
+	cdef np.ndarray heating_denominator = (1000*pressure_levels).astype(np.float64)
+	# approximate SW heating of ozone, per unit of the normalised solar pattern
+	cdef np.ndarray ozone_heating = np.where(pressure_levels < 400*100, 75*inv_day*(100/pressure_levels), 0)
+
+	return depth_step, depth_denominator, gradient_spacing, heating_denominator, ozone_heating
+
+cpdef radiation_calculation(np.ndarray temperature_world, np.ndarray potential_temperature, np.ndarray pressure_levels, np.ndarray heat_capacity_earth, np.ndarray albedo, insolation, np.ndarray lat, np.ndarray lon, DTYPE_f t, DTYPE_f dt, DTYPE_f day, DTYPE_f year, axial_tilt, tuple coefficients=None, workspace=None, accumulator=None, np.ndarray solar_pattern=None):
+	''' longwave fluxes and heating one column at a time, parallel over latitude and members; same result as radiation_calculation_primitive, but updates both temperatures in place. insolation and axial_tilt can be given per member, and the flux recurrences run in accumulator precision if it is given. solar_pattern is the normalised sunlight of each member (see solar.SolarForcing), found from t and axial_tilt if not given '''
+	if coefficients is None:
+		coefficients = radiation_coefficients(pressure_levels, lat)
+
+	cdef tuple shape = np.shape(potential_temperature)
+	dtype = potential_temperature.dtype
+	cdef np.ndarray temperature_atmos = low_level.theta_to_t(potential_temperature,pressure_levels,low_level.scratch(workspace,'temperature_atmos',shape,dtype))
+	cdef np.ndarray emission = low_level.thermal_radiation_matrix(temperature_atmos,low_level.scratch(workspace,'emission',shape,dtype))
+	cdef np.ndarray surface_emission = low_level.thermal_radiation_matrix(temperature_world)
+
+	cdef Py_ssize_t members = low_level.members_first(temperature_world,2).shape[0]
+	cdef Py_ssize_t nlat = len(lat)
+	cdef Py_ssize_t nlon = len(lon)
+	cdef Py_ssize_t m
+
+	cdef np.ndarray insolations = np.broadcast_to(np.asarray(insolation,dtype=np.float64),(members,))
+	cdef np.ndarray axial_tilts = np.broadcast_to(np.asarray(axial_tilt,dtype=np.float64),(members,))
+
+	# shortwave at the surface and ozone heating share the same pattern, so the sun is only located once per tilt
+	if solar_pattern is None:
+		solar_pattern = np.empty((members,nlat,nlon))
+		for m in range(members):
+			if m > 0 and axial_tilts[m] == axial_tilts[m-1]:
+				solar_pattern[m] = solar_pattern[m-1]
+			else:
+				solar_pattern[m] = low_level.solar_matrix(1,lat,lon,t,day,year,axial_tilts[m])
+
+	# every element is written by the sweeps below
+	accumulator = dtype if accumulator is None else accumulator
+	cdef np.ndarray upward_radiation = low_level.scratch(workspace,'upward_radiation',shape,accumulator)
+	cdef np.ndarray downward_radiation = low_level.scratch(workspace,'downward_radiation',shape,accumulator)
+
+	cdef np.ndarray world = low_level.members_first(temperature_world,2)
+	cdef np.ndarray atmos = low_level.members_first(temperature_atmos)
+	cdef np.ndarray emitted = low_level.members_first(emission)
+	cdef np.ndarray surface_emitted = low_level.members_first(surface_emission,2)
+	cdef np.ndarray heat_capacity = low_level.members_first(np.broadcast_to(heat_capacity_earth.astype(dtype,copy=False),np.shape(temperature_world)),2)
+	cdef np.ndarray surface_albedo = low_level.members_first(np.broadcast_to(albedo.astype(dtype,copy=False),np.shape(temperature_world)),2)
+	cdef np.ndarray up = low_level.members_first(upward_radiation)
+	cdef np.ndarray down = low_level.members_first(downward_radiation)
+	depth_step, depth_denominator, gradient_spacing, heating_denominator, ozone_heating = coefficients
+
+	if dtype == np.float32 and accumulator == np.float64:
+		_radiation_columns[np.float32_t,np.float64_t](world,atmos,emitted,surface_emitted,heat_capacity,surface_albedo,insolations,solar_pattern,depth_step,depth_denominator,gradient_spacing,heating_denominator,ozone_heating,up,down,dt)
+	elif dtype == np.float32:
+		_radiation_columns[np.float32_t,np.float32_t](world,atmos,emitted,surface_emitted,heat_capacity,surface_albedo,insolations,solar_pattern,depth_step,depth_denominator,gradient_spacing,heating_denominator,ozone_heating,up,down,dt)
+	else:
+		_radiation_columns[np.float64_t,np.float64_t](world,atmos,emitted,surface_emitted,heat_capacity,surface_albedo,insolations,solar_pattern,depth_step,depth_denominator,gradient_spacing,heating_denominator,ozone_heating,up,down,dt)
+
+	return temperature_world, low_level.t_to_theta(temperature_atmos,pressure_levels,potential_temperature)
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+cdef void _radiation_columns(DTYPE_real[:,:,:] temperature_world_view, DTYPE_real[:,:,:,:] temperature_view, const DTYPE_real[:,:,:,:] emission_view, const DTYPE_real[:,:,:] surface_emission_view, const DTYPE_real[:,:,:] heat_capacity_view, const DTYPE_real[:,:,:] albedo_view, const DTYPE_f[:] insolation_view, const DTYPE_f[:,:,:] solar_view, const DTYPE_f[:,:] depth_step, const DTYPE_f[:,:] depth_denominator, const DTYPE_f[:] gradient_spacing, const DTYPE_f[:] heating_denominator, const DTYPE_f[:] ozone_heating, DTYPE_acc[:,:,:,:] up, DTYPE_acc[:,:,:,:] down, DTYPE_f dt):
+	cdef Py_ssize_t members = temperature_view.shape[0]
+	cdef Py_ssize_t nlat = temperature_view.shape[1]
+	cdef Py_ssize_t nlon = temperature_view.shape[2]
+	cdef Py_ssize_t nlevels = temperature_view.shape[3]
+	cdef Py_ssize_t row, m, i, j, k, lower, upper
+
+	cdef DTYPE_f z_gradient, Q
+
+	for row in prange(members*nlat, nogil=True, schedule='static'):
+		m = row // nlat
+		i = row % nlat
+		for j in range(nlon):
+			# upward longwave flux, bc is thermal radiation at surface
+			up[m,i,j,0] = surface_emission_view[m,i,j]
+			for k in range(1,nlevels):
+				up[m,i,j,k] = (up[m,i,j,k-1] - depth_step[i,k]*emission_view[m,i,j,k])/depth_denominator[i,k]
+
+			# downward longwave flux, bc is zero at TOA (in model)
+			down[m,i,j,nlevels-1] = 0
+			for k in range(nlevels-2,-1,-1):
+				down[m,i,j,k] = (down[m,i,j,k+1] - emission_view[m,i,j,k]*depth_step[i,k+1])/depth_denominator[i,k+1]
+
+			# gradient of difference provides heating at each level
+			for k in range(nlevels):
+				lower = k-1 if k > 0 else 0
+				upper = k+1 if k < nlevels-1 else nlevels-1
+				z_gradient = -((up[m,i,j,upper] - down[m,i,j,upper]) - (up[m,i,j,lower] - down[m,i,j,lower]))/gradient_spacing[k]
+				Q = -287*temperature_view[m,i,j,k]*z_gradient/heating_denominator[k] + solar_view[m,i,j]*ozone_heating[k]
+				temperature_view[m,i,j,k] += Q*dt
+
+			# update surface temperature with shortwave radiation flux
+			temperature_world_view[m,i,j] += dt*((1-albedo_view[m,i,j])*(insolation_view[m]*solar_view[m,i,j] + down[m,i,j,0]) - up[m,i,j,0])/heat_capacity_view[m,i,j]
+
+cpdef radiation_calculation_primitive(np.ndarray temperature_world, np.ndarray potential_temperature, np.ndarray pressure_levels, np.ndarray heat_capacity_earth, np.ndarray albedo, DTYPE_f insolation, np.ndarray lat, np.ndarray lon, DTYPE_f t, DTYPE_f dt, DTYPE_f day, DTYPE_f year, DTYPE_f axial_tilt):
 	# calculate change in temperature of ground and atmosphere due to radiative imbalance
 	cdef np.int_t nlat,nlon,nlevels,k
 	cdef DTYPE_f fl = 0.1
@@ -80,7 +396,65 @@ cpdef radiation_calculation(np.ndarray temperature_world, np.ndarray potential_t
 
 	return temperature_world, low_level.t_to_theta(temperature_atmos,pressure_levels)
 
-cpdef velocity_calculation(np.ndarray u,np.ndarray v,np.ndarray w,np.ndarray pressure_levels,np.ndarray geopotential,np.ndarray potential_temperature,np.ndarray coriolis,DTYPE_f gravity,np.ndarray dx,DTYPE_f dy,DTYPE_f dt):
+cpdef velocity_calculation(np.ndarray u,np.ndarray v,np.ndarray w,np.ndarray pressure_levels,np.ndarray geopotential,np.ndarray potential_temperature,np.ndarray coriolis,DTYPE_f gravity,np.ndarray dx,DTYPE_f dy,DTYPE_f dt,Py_ssize_t sponge_index=17,tuple out=None):
+	''' acceleration of the atmosphere in a single pass over the grid, parallel over latitude and members; same result as velocity_calculation_primitive '''
+	cdef np.ndarray u_add, v_add
+	if out is None:
+		u_add = np.zeros(np.shape(u), u.dtype)
+		v_add = np.zeros(np.shape(v), v.dtype)
+	else:
+		u_add, v_add = out
+		u_add[...,:2,:,:] = 0
+		u_add[...,-2:,:,:] = 0
+		v_add[...,:2,:,:] = 0
+		v_add[...,-2:,:,:] = 0
+
+	if u.dtype == np.float32:
+		_velocity_rows[np.float32_t](low_level.members_first(u),low_level.members_first(v),low_level.members_first(geopotential),np.asarray(coriolis,u.dtype),np.asarray(dx,u.dtype),dy,dt,sponge_index,low_level.members_first(u_add),low_level.members_first(v_add))
+	else:
+		_velocity_rows[np.float64_t](low_level.members_first(u),low_level.members_first(v),low_level.members_first(geopotential),np.asarray(coriolis,u.dtype),np.asarray(dx,u.dtype),dy,dt,sponge_index,low_level.members_first(u_add),low_level.members_first(v_add))
+
+	return u_add,v_add
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+cdef void _velocity_rows(const DTYPE_real[:,:,:,:] u_view, const DTYPE_real[:,:,:,:] v_view, const DTYPE_real[:,:,:,:] geopotential_view, const DTYPE_real[:] coriolis_view, const DTYPE_real[:] dx_view, DTYPE_f dy, DTYPE_f dt, Py_ssize_t sponge_index, DTYPE_real[:,:,:,:] u_add_view, DTYPE_real[:,:,:,:] v_add_view):
+	cdef Py_ssize_t members = u_view.shape[0]
+	cdef Py_ssize_t nlat = u_view.shape[1]
+	cdef Py_ssize_t nlon = u_view.shape[2]
+	cdef Py_ssize_t nlevels = u_view.shape[3]
+	cdef Py_ssize_t rows = nlat - 4
+	cdef Py_ssize_t row, m, i, j, k, east, west
+
+	cdef DTYPE_real u_here, v_here, u_advection, v_advection
+
+	# the two rows nearest each pole are left at zero, as they are handled by the polar planes
+	for row in prange(members*rows, nogil=True, schedule='static'):
+		m = row // rows
+		i = row % rows + 2
+		for j in range(nlon):
+			east = (j + 1) % nlon
+			west = (j + nlon - 1) % nlon
+			for k in range(nlevels):
+				u_here = u_view[m,i,j,k]
+				v_here = v_view[m,i,j,k]
+
+				# upwind advection, term by term in the same order as velocity_calculation_primitive
+				u_advection = (-(u_here+fabs(u_here))*(u_here - u_view[m,i,west,k])/dx_view[i] - (u_here-fabs(u_here))*(u_view[m,i,east,k] - u_here)/dx_view[i]
+					- (v_here+fabs(v_here))*(u_here - u_view[m,i-1,j,k])/dy - (v_here-fabs(v_here))*(u_view[m,i+1,j,k] - u_here)/dy)
+				v_advection = (-(u_here+fabs(u_here))*(v_here - v_view[m,i,west,k])/dx_view[i] - (u_here-fabs(u_here))*(v_view[m,i,east,k] - v_here)/dx_view[i]
+					- (v_here+fabs(v_here))*(v_here - v_view[m,i-1,j,k])/dy - (v_here-fabs(v_here))*(v_view[m,i+1,j,k] - v_here)/dy)
+
+				if k < sponge_index:
+					u_add_view[m,i,j,k] = dt*(u_advection + coriolis_view[i]*v_here - (geopotential_view[m,i,east,k] - geopotential_view[m,i,west,k])/dx_view[i] - 1E-5*u_here)
+					v_add_view[m,i,j,k] = dt*(v_advection - coriolis_view[i]*u_here - (geopotential_view[m,i+1,j,k] - geopotential_view[m,i-1,j,k])/dy - 1E-5*v_here)
+				else:
+					# advection only in sponge layer
+					u_add_view[m,i,j,k] = dt*(u_advection - 1E-3*u_here)
+					v_add_view[m,i,j,k] = dt*(v_advection - 1E-3*v_here)
+
+cpdef velocity_calculation_primitive(np.ndarray u,np.ndarray v,np.ndarray w,np.ndarray pressure_levels,np.ndarray geopotential,np.ndarray potential_temperature,np.ndarray coriolis,DTYPE_f gravity,np.ndarray dx,DTYPE_f dy,DTYPE_f dt):
 
 	# calculate acceleration of atmosphere using primitive equations on beta-plane
 	cpdef np.ndarray u_temp = dt*(-(u+abs(u))*(u - np.roll(u, 1, axis=1))/dx[:, None, None] - (u-abs(u))*(np.roll(u, -1, axis=1) - u)/dx[:, None, None] 
@@ -120,55 +494,110 @@ cpdef velocity_calculation(np.ndarray u,np.ndarray v,np.ndarray w,np.ndarray pre
 
 	return u_add,v_add
 
-cpdef w_calculation(np.ndarray u,np.ndarray v,np.ndarray w,np.ndarray pressure_levels,np.ndarray geopotential,np.ndarray potential_temperature,np.ndarray coriolis,DTYPE_f gravity,np.ndarray dx,DTYPE_f dy,DTYPE_f dt):
-	cdef np.ndarray w_temp = np.zeros_like(u)
-	cdef np.ndarray temperature_atmos = low_level.theta_to_t(potential_temperature,pressure_levels) 
+cpdef w_calculation(np.ndarray u,np.ndarray v,np.ndarray w,np.ndarray pressure_levels,np.ndarray geopotential,np.ndarray potential_temperature,np.ndarray coriolis,DTYPE_f gravity,np.ndarray dx,DTYPE_f dy,DTYPE_f dt,np.ndarray out=None,workspace=None,accumulator=None):
+	''' vertical velocity from the divergence of u and v; it is added to w and returned, or if out is given written there instead. The vertical integral is summed in accumulator precision if it is given '''
+	cdef tuple shape = np.shape(u)
+	cdef np.ndarray w_temp = np.zeros(shape, u.dtype) if out is None else out
 	
-	cdef np.int_t nlevels, k
-	nlevels = len(pressure_levels)
-
-	u_dx = low_level.scalar_gradient_x_matrix(u, dx)
-	u_dy = low_level.scalar_gradient_y_matrix(v, dy)
+	# w_temp[:,:,k] = - gravity*pressure_levels[k]*np.trapz(u_dx[:,:,:k]+u_dy[:,:,:k],pressure_levels[:k])/(287*temperature_atmos[:,:,k])
+	cdef np.ndarray u_dx = low_level.scalar_gradient_x_matrix(u, dx, low_level.scratch(workspace,'u_dx',shape,u.dtype))
+	cdef np.ndarray u_dy = low_level.scalar_gradient_y_matrix(v, dy, low_level.scratch(workspace,'u_dy',shape,u.dtype))
+	u_dx += u_dy
 	
-	for k in np.arange(1,nlevels).tolist():
-		# w_temp[:,:,k] = w_temp[:,:,k-1] - (pressure_levels[k] - pressure_levels[k-1]) * pressure_levels[k] * gravity * ( low_level.scalar_gradient_x_matrix(u, dx)[:,:,k] + low_level.scalar_gradient_y_matrix(v, dy)[:,:,k] )/(287*temperature_atmos[:,:,k])
-		# w_temp[:,:,k] = - gravity*pressure_levels[k]*np.trapz(u_dx[:,:,:k]+u_dy[:,:,:k],pressure_levels[:k])/(287*temperature_atmos[:,:,k])
-		w_temp[:,:,k] = - np.trapz(u_dx[:,:,:k]+u_dy[:,:,:k],pressure_levels[:k])
+	# level k takes the divergence integrated up to the level below it
+	cdef np.ndarray integral = low_level.cumulative_trapezoid_z(u_dx,pressure_levels,u_dy,accumulator)
+	np.negative(integral[...,:-1], out=w_temp[...,1:])
+	w_temp[...,0] = 0
 	
-	w_temp[-1:,:,:] = 0
-	w_temp[:1,:,:] = 0
+	w_temp[...,-1:,:,:] = 0
+	w_temp[...,:1,:,:] = 0
 
-	w += w_temp
+	if out is None:
+		w += w_temp
 
 	return w_temp
 
 cpdef smoothing_3D(np.ndarray a,DTYPE_f smooth_parameter, DTYPE_f vert_smooth_parameter=0.5):
-	cdef np.int_t nlat = a.shape[0]
-	cdef np.int_t nlon = a.shape[1]
-	cdef np.int_t nlevels = a.shape[2]
+	''' reference for spectral_filter: zeroes bands of the complex FFT of one field '''
+	cdef np.int_t nlat, nlon, nlevels
+	nlat, nlon, nlevels = np.shape(a)[a.ndim-3:]
 	smooth_parameter *= 0.5
-	cdef np.ndarray test = np.fft.fftn(a)
-	test[int(nlat*smooth_parameter):int(nlat*(1-smooth_parameter)),:,:] = 0
-	test[:,int(nlon*smooth_parameter):int(nlon*(1-smooth_parameter)),:] = 0
-	test[:,:,int(nlevels*vert_smooth_parameter):int(nlevels*(1-vert_smooth_parameter))] = 0
-	return np.fft.ifftn(test).real
-
-cpdef polar_planes(np.ndarray u,np.ndarray v,np.ndarray u_add,np.ndarray v_add,np.ndarray potential_temperature,np.ndarray geopotential,tuple grid_velocities,tuple indices,tuple grids,tuple coords,np.ndarray coriolis_plane_N,np.ndarray coriolis_plane_S,DTYPE_f grid_side_length,np.ndarray pressure_levels,np.ndarray lat,np.ndarray lon,DTYPE_f dt,DTYPE_f polar_grid_resolution,DTYPE_f gravity):
+	cdef np.ndarray test = np.fft.fftn(a, axes=(-3,-2,-1))
+	test[...,int(nlat*smooth_parameter):int(nlat*(1-smooth_parameter)),:,:] = 0
+	test[...,int(nlon*smooth_parameter):int(nlon*(1-smooth_parameter)),:] = 0
+	test[...,int(nlevels*vert_smooth_parameter):int(nlevels*(1-vert_smooth_parameter))] = 0
+	return np.fft.ifftn(test, axes=(-3,-2,-1)).real
+
+cpdef np.ndarray spectral_mask(tuple shape, DTYPE_f smooth_parameter, DTYPE_f vert_smooth_parameter=0.5):
+	''' weights of the real FFT coefficients of a (lat, lon, level) field of the given shape that give the same result as smoothing_3D; the bands it zeroes are not symmetric in frequency, so a coefficient whose negative frequency is zeroed keeps half its weight. Cached by shape and parameters '''
+	key = (shape, smooth_parameter, vert_smooth_parameter)
+	if key in _spectral_masks:
+		return _spectral_masks[key]
+
+	cdef list masks = []
+	cdef list negative = []
+	for n, parameter in zip(shape, (0.5*smooth_parameter, 0.5*smooth_parameter, vert_smooth_parameter)):
+		weights = np.ones(n)
+		weights[int(n*parameter):int(n*(1-parameter))] = 0
+		masks.append(weights)
+		negative.append(-np.arange(n) % n)
+
+	cdef np.ndarray full = masks[0][:,None,None]*masks[1][None,:,None]*masks[2][None,None,:]
+	cdef np.ndarray mask = 0.5*(full + full[np.ix_(*negative)])[:,:,:shape[2]//2+1]
+	_spectral_masks[key] = mask
+	return mask
+
+cpdef list spectral_filter(tuple fields, tuple smooth_parameters, tuple vert_smooth_parameters=None, workers=1):
+	''' smoothing_3D of several fields of the same shape in one batch of real FFTs run on workers threads (-1 for one per core), each field with its own parameters; the fields keep their dtype '''
+	if vert_smooth_parameters is None:
+		vert_smooth_parameters = (0.5,)*len(fields)
+	cdef tuple shape = np.shape(fields[0])[fields[0].ndim-3:]
+	dtype = fields[0].dtype
+
+	spectrum = scipy.fft.rfftn(np.stack(fields), axes=(-3,-2,-1), workers=workers)
+	for n in range(len(fields)):
+		spectrum[n] *= spectral_mask(shape, smooth_parameters[n], vert_smooth_parameters[n])
+	cdef np.ndarray filtered = scipy.fft.irfftn(spectrum, s=shape, axes=(-3,-2,-1), workers=workers)
+	return [field.astype(dtype, copy=False) for field in filtered]
+
+cpdef polar_planes(np.ndarray u,np.ndarray v,np.ndarray u_add,np.ndarray v_add,np.ndarray potential_temperature,np.ndarray geopotential,tuple grid_velocities,tuple indices,tuple grids,tuple coords,np.ndarray coriolis_plane_N,np.ndarray coriolis_plane_S,DTYPE_f grid_side_length,np.ndarray pressure_levels,np.ndarray lat,np.ndarray lon,DTYPE_f dt,DTYPE_f polar_grid_resolution,DTYPE_f gravity,tuple operators=None,str hemispheres='NS',tuple blends=None,executor=None,tuple workspaces=None):
+	''' one timestep on the polar planes of the hemispheres given, 'N' and/or 'S'; the reprojected addition of a hemisphere that is left out is None. blends are the low_level.Blend of each hemisphere. Given an executor (e.g. a concurrent.futures.ThreadPoolExecutor), the south plane is stepped on it while the north is stepped here; the two only write to their own parts of the arrays, and the projections and plane kernels spend most of their time outside the GIL. workspaces are a (north, south) pair of low_level.Workspace for the plane temporaries, one per hemisphere so that they can be stepped at once; the reprojected additions are then scratch arrays of them '''
 
 	x_dot_N,y_dot_N,x_dot_S,y_dot_S = grid_velocities[:]
 	pole_low_index_N,pole_high_index_N,pole_low_index_S,pole_high_index_S = indices[:]
 	grid_length_N,grid_length_S = grids[:]
-	grid_lat_coords_N,grid_lon_coords_N,grid_x_values_N,grid_y_values_N,polar_x_coords_N,polar_y_coords_N,grid_lat_coords_S,grid_lon_coords_S,grid_x_values_S,grid_y_values_S,polar_x_coords_S,polar_y_coords_S = coords[:]
-	
+	if blends is None:
+		blends = (low_level.Blend(pole_low_index_N,pole_high_index_N,lat),low_level.Blend(pole_low_index_S,pole_high_index_S,lat))
+	blend_N,blend_S = blends
+	up_N,down_N,up_S,down_S = operators[:] if operators is not None else (None,None,None,None)
+	workspace_N,workspace_S = workspaces if workspaces is not None else (None,None)
+
+	south = None
+	if 'S' in hemispheres:
+		south = _on_pool(executor if 'N' in hemispheres else None,_south_plane,u_add,v_add,potential_temperature,geopotential,x_dot_S,y_dot_S,pole_low_index_S,pole_high_index_S,grid_length_S,coords[6:],coriolis_plane_S,grid_side_length,lat,lon,dt,polar_grid_resolution,up_S,down_S,blend_S,workspace_S)
+
+	north_reprojected_addition = None
+	if 'N' in hemispheres:
+		north_reprojected_addition = _north_plane(u_add,v_add,potential_temperature,geopotential,x_dot_N,y_dot_N,pole_low_index_N,pole_high_index_N,grid_length_N,coords[:6],coriolis_plane_N,grid_side_length,lat,lon,dt,polar_grid_resolution,up_N,down_N,blend_N,workspace_N)
+
+	south_reprojected_addition = south.result() if south is not None else None
+
+	return u_add,v_add,north_reprojected_addition,south_reprojected_addition,x_dot_N,y_dot_N,x_dot_S,y_dot_S
+
+def _north_plane(u_add,v_add,potential_temperature,geopotential,x_dot_N,y_dot_N,pole_low_index_N,pole_high_index_N,grid_length_N,coords_N,coriolis_plane_N,grid_side_length,lat,lon,dt,polar_grid_resolution,up_N,down_N,blend_N,workspace=None):
+	grid_lat_coords_N,grid_lon_coords_N,grid_x_values_N,grid_y_values_N,polar_x_coords_N,polar_y_coords_N = coords_N
+	plane_shape = np.shape(x_dot_N)
+	reprojected_shape = np.shape(u_add[...,pole_low_index_N:,:,:])
+
 	### north pole ###
-	north_temperature_data = np.flip(potential_temperature[pole_low_index_N:,:,:],axis=1)
-	north_polar_plane_temperature = low_level.beam_me_up(lat[pole_low_index_N:],lon,north_temperature_data,grid_length_N,grid_lat_coords_N,grid_lon_coords_N)
-	
-	north_geopotential_data = np.flip(geopotential[pole_low_index_N:,:,:],axis=1)
-	north_polar_plane_geopotential = low_level.beam_me_up(lat[pole_low_index_N:],lon,north_geopotential_data,grid_length_N,grid_lat_coords_N,grid_lon_coords_N)
-	
+	north_temperature_data = np.flip(potential_temperature[...,pole_low_index_N:,:,:],axis=-2)
+	north_polar_plane_temperature = low_level.beam_me_up(lat[pole_low_index_N:],lon,north_temperature_data,grid_length_N,grid_lat_coords_N,grid_lon_coords_N,up_N,low_level.scratch(workspace,'plane_temperature',plane_shape,x_dot_N.dtype))
+
+	north_geopotential_data = np.flip(geopotential[...,pole_low_index_N:,:,:],axis=-2)
+	north_polar_plane_geopotential = low_level.beam_me_up(lat[pole_low_index_N:],lon,north_geopotential_data,grid_length_N,grid_lat_coords_N,grid_lon_coords_N,up_N,low_level.scratch(workspace,'plane_geopotential',plane_shape,x_dot_N.dtype))
+
 	# calculate local velocity on Cartesian grid (CARTESIAN)
-	x_dot_add,y_dot_add = low_level.grid_velocities(north_polar_plane_geopotential,grid_side_length,coriolis_plane_N,x_dot_N,y_dot_N,polar_grid_resolution)
+	x_dot_add,y_dot_add = low_level.grid_velocities(north_polar_plane_geopotential,grid_side_length,coriolis_plane_N,x_dot_N,y_dot_N,polar_grid_resolution,out=(low_level.scratch(workspace,'x_dot_add',plane_shape,x_dot_N.dtype),low_level.scratch(workspace,'y_dot_add',plane_shape,x_dot_N.dtype)))
 
 	x_dot_add *= dt
 	y_dot_add *= dt
@@ -177,32 +606,33 @@ cpdef polar_planes(np.ndarray u,np.ndarray v,np.ndarray u_add,np.ndarray v_add,n
 	y_dot_N += y_dot_add
 
 	# advect temperature field, isolate field to subtract from existing temperature field (CARTESIAN)
-	north_polar_plane_addition = low_level.polar_plane_advect(north_polar_plane_temperature,x_dot_N,y_dot_N,polar_grid_resolution)
+	north_polar_plane_addition = low_level.polar_plane_advect(north_polar_plane_temperature,x_dot_N,y_dot_N,polar_grid_resolution,low_level.scratch(workspace,'plane_addition',plane_shape,x_dot_N.dtype))
 
 	# project velocities onto polar grid (POLAR)
-	reproj_u_N, reproj_v_N = low_level.project_velocities_north(lon,x_dot_add,y_dot_add,pole_low_index_N,pole_high_index_N,grid_x_values_N,grid_y_values_N,polar_x_coords_N,polar_y_coords_N)
+	reproj_u_N, reproj_v_N = low_level.project_velocities_north(lon,x_dot_add,y_dot_add,pole_low_index_N,pole_high_index_N,grid_x_values_N,grid_y_values_N,polar_x_coords_N,polar_y_coords_N,down_N,workspace)
 
 	# combine velocities with those calculated on polar grid (POLAR)
-	reproj_u_N = low_level.combine_data(pole_low_index_N,pole_high_index_N,u_add[pole_low_index_N:,:,:],-reproj_u_N,lat)
-	reproj_v_N = low_level.combine_data(pole_low_index_N,pole_high_index_N,v_add[pole_low_index_N:,:,:],reproj_v_N,lat)
-
-	# add the combined velocities to the global velocity arrays
-	u_add[pole_low_index_N:,:,:] = reproj_u_N
-	v_add[pole_low_index_N:,:,:] = reproj_v_N
+	# and add them to the global velocity arrays
+	blend_N(u_add[...,pole_low_index_N:,:,:],np.negative(reproj_u_N,out=reproj_u_N),u_add[...,pole_low_index_N:,:,:])
+	blend_N(v_add[...,pole_low_index_N:,:,:],reproj_v_N,v_add[...,pole_low_index_N:,:,:])
 
 	# project addition to temperature field onto polar grid (POLAR)
-	north_reprojected_addition = low_level.beam_me_down(lon,north_polar_plane_addition,pole_low_index_N,grid_x_values_N,grid_y_values_N,polar_x_coords_N,polar_y_coords_N)
-	north_reprojected_addition = np.flip(north_reprojected_addition,axis=1)
+	north_reprojected_addition = low_level.beam_me_down(lon,north_polar_plane_addition,pole_low_index_N,grid_x_values_N,grid_y_values_N,polar_x_coords_N,polar_y_coords_N,down_N,low_level.scratch(workspace,'reprojected_addition',reprojected_shape,x_dot_N.dtype))
+	north_reprojected_addition = np.flip(north_reprojected_addition,axis=-2)
+	return north_reprojected_addition
 
-	###################################################################
+def _south_plane(u_add,v_add,potential_temperature,geopotential,x_dot_S,y_dot_S,pole_low_index_S,pole_high_index_S,grid_length_S,coords_S,coriolis_plane_S,grid_side_length,lat,lon,dt,polar_grid_resolution,up_S,down_S,blend_S,workspace=None):
+	grid_lat_coords_S,grid_lon_coords_S,grid_x_values_S,grid_y_values_S,polar_x_coords_S,polar_y_coords_S = coords_S
+	plane_shape = np.shape(x_dot_S)
+	reprojected_shape = np.shape(u_add[...,:pole_low_index_S,:,:])
 
 	### south pole ###
-	south_polar_plane_temperature = low_level.beam_me_up(lat[:pole_low_index_S],lon,potential_temperature[:pole_low_index_S,:,:],grid_length_S,grid_lat_coords_S,grid_lon_coords_S)
-	
-	south_geopotential_data = geopotential[:pole_low_index_S,:,:]
-	south_polar_plane_geopotential = low_level.beam_me_up(lat[:pole_low_index_S],lon,south_geopotential_data,grid_length_S,grid_lat_coords_S,grid_lon_coords_S)
+	south_polar_plane_temperature = low_level.beam_me_up(lat[:pole_low_index_S],lon,potential_temperature[...,:pole_low_index_S,:,:],grid_length_S,grid_lat_coords_S,grid_lon_coords_S,up_S,low_level.scratch(workspace,'plane_temperature',plane_shape,x_dot_S.dtype))
+
+	south_geopotential_data = geopotential[...,:pole_low_index_S,:,:]
+	south_polar_plane_geopotential = low_level.beam_me_up(lat[:pole_low_index_S],lon,south_geopotential_data,grid_length_S,grid_lat_coords_S,grid_lon_coords_S,up_S,low_level.scratch(workspace,'plane_geopotential',plane_shape,x_dot_S.dtype))
 
-	x_dot_add,y_dot_add = low_level.grid_velocities(south_polar_plane_geopotential,grid_side_length,coriolis_plane_S,x_dot_S,y_dot_S,polar_grid_resolution)
+	x_dot_add,y_dot_add = low_level.grid_velocities(south_polar_plane_geopotential,grid_side_length,coriolis_plane_S,x_dot_S,y_dot_S,polar_grid_resolution,out=(low_level.scratch(workspace,'x_dot_add',plane_shape,x_dot_S.dtype),low_level.scratch(workspace,'y_dot_add',plane_shape,x_dot_S.dtype)))
 
 	x_dot_add *= dt
 	y_dot_add *= dt
@@ -210,37 +640,64 @@ cpdef polar_planes(np.ndarray u,np.ndarray v,np.ndarray u_add,np.ndarray v_add,n
 	x_dot_S += x_dot_add
 	y_dot_S += y_dot_add
 
-	south_polar_plane_addition = low_level.polar_plane_advect(south_polar_plane_temperature,x_dot_S,y_dot_S,polar_grid_resolution)
+	south_polar_plane_addition = low_level.polar_plane_advect(south_polar_plane_temperature,x_dot_S,y_dot_S,polar_grid_resolution,low_level.scratch(workspace,'plane_addition',plane_shape,x_dot_S.dtype))
+
+	reproj_u_S, reproj_v_S = low_level.project_velocities_south(lon,x_dot_add,y_dot_add,pole_low_index_S,pole_high_index_S,grid_x_values_S,grid_y_values_S,polar_x_coords_S,polar_y_coords_S,down_S,workspace)
+
+	blend_S(u_add[...,:pole_low_index_S,:,:],reproj_u_S,u_add[...,:pole_low_index_S,:,:])
+	blend_S(v_add[...,:pole_low_index_S,:,:],reproj_v_S,v_add[...,:pole_low_index_S,:,:])
+
+	south_reprojected_addition = low_level.beam_me_down(lon,south_polar_plane_addition,pole_low_index_S,grid_x_values_S,grid_y_values_S,polar_x_coords_S,polar_y_coords_S,down_S,low_level.scratch(workspace,'reprojected_addition',reprojected_shape,x_dot_S.dtype))
+	return south_reprojected_addition
+
+def _on_pool(executor,function,*arguments):
+	# future of function(*arguments), run on executor or, without one, right away
+	if executor is not None:
+		return executor.submit(function,*arguments)
+	future = concurrent.futures.Future()
+	future.set_result(function(*arguments))
+	return future
+
+cpdef update_plane_velocities(np.ndarray lat,np.ndarray lon,np.int_t pole_low_index_N,np.int_t pole_low_index_S,np.ndarray new_u_N,np.ndarray new_v_N,tuple grids,np.ndarray grid_lat_coords_N,np.ndarray grid_lon_coords_N,np.ndarray new_u_S,np.ndarray new_v_S,np.ndarray grid_lat_coords_S,np.ndarray grid_lon_coords_S,tuple operators=None,str hemispheres='NS',executor=None,tuple workspaces=None,tuple out=None):
+	''' re-project combined velocites to polar plane (prevent discontinuity at the boundary), for the hemispheres given; those left out are None. As in polar_planes, the south is done on executor if one is given, and workspaces are a (north, south) pair. The plane velocities are written to out, (x_dot_N, y_dot_N, x_dot_S, y_dot_S), if given '''
+	up_N,down_N,up_S,down_S = operators[:] if operators is not None else (None,None,None,None)
+	workspace_N,workspace_S = workspaces if workspaces is not None else (None,None)
+	out_N,out_S = (out[:2],out[2:]) if out is not None else (None,None)
+	x_dot_N = y_dot_N = x_dot_S = y_dot_S = None
+	south = None
+	if 'S' in hemispheres:
+		south = _on_pool(executor if 'N' in hemispheres else None,low_level.upload_velocities,lat[:pole_low_index_S],lon,new_u_S,new_v_S,grids[1],grid_lat_coords_S,grid_lon_coords_S,up_S,out_S,workspace_S)
+	if 'N' in hemispheres:
+		x_dot_N,y_dot_N = low_level.upload_velocities(lat[pole_low_index_N:],lon,new_u_N,new_v_N,grids[0],grid_lat_coords_N,grid_lon_coords_N,up_N,out_N,workspace_N)
+	if south is not None:
+		x_dot_S,y_dot_S = south.result()
+	return x_dot_N,y_dot_N,x_dot_S,y_dot_S
 
-	reproj_u_S, reproj_v_S = low_level.project_velocities_south(lon,x_dot_add,y_dot_add,pole_low_index_S,pole_high_index_S,grid_x_values_S,grid_y_values_S,polar_x_coords_S,polar_y_coords_S)
-	
-	reproj_u_S = low_level.combine_data(pole_low_index_S,pole_high_index_S,u_add[:pole_low_index_S,:,:],reproj_u_S,lat)
-	reproj_v_S = low_level.combine_data(pole_low_index_S,pole_high_index_S,v_add[:pole_low_index_S,:,:],reproj_v_S,lat)
-	
-	south_reprojected_addition = low_level.beam_me_down(lon,south_polar_plane_addition,pole_low_index_S,grid_x_values_S,grid_y_values_S,polar_x_coords_S,polar_y_coords_S)
+cpdef w_plane(np.ndarray x_dot,np.ndarray y_dot,np.ndarray temperature,np.ndarray pressure_levels,DTYPE_f polar_grid_resolution,DTYPE_f gravity,accumulator=None,np.ndarray out=None,workspace=None):
+	''' vertical velocity on a polar plane, written to out if given, with the gradients kept in scratch arrays of workspace; same result as w_plane_primitive '''
+	cdef tuple shape = np.shape(x_dot)
+	cdef np.ndarray w_temp = np.empty(shape, x_dot.dtype) if out is None else out
+	temperature = low_level.theta_to_t(temperature,pressure_levels,low_level.scratch(workspace,'plane_temperature',np.shape(temperature),temperature.dtype))
 
-	u_add[:pole_low_index_S,:,:] = reproj_u_S
-	v_add[:pole_low_index_S,:,:] = reproj_v_S
+	cdef np.ndarray x_dot_dx = low_level.grid_x_gradient_matrix(x_dot, polar_grid_resolution, low_level.scratch(workspace,'plane_x_gradient',shape,x_dot.dtype))
+	cdef np.ndarray y_dot_dy = low_level.grid_y_gradient_matrix(y_dot, polar_grid_resolution, low_level.scratch(workspace,'plane_y_gradient',shape,y_dot.dtype))
+	x_dot_dx += y_dot_dy
 
-	return u_add,v_add,north_reprojected_addition,south_reprojected_addition,x_dot_N,y_dot_N,x_dot_S,y_dot_S
+	# w_temp[:,:,k] = - gravity*pressure_levels[k]*np.trapz(x_dot_dx[:,:,:k]+y_dot_dy[:,:,:k],pressure_levels[:k])/(287*temperature[:,:,k])
+	np.negative(low_level.cumulative_trapezoid_z(x_dot_dx,pressure_levels,y_dot_dy,accumulator)[...,:-1],out=w_temp[...,1:])
+	w_temp[...,0] = 0
 
-cpdef update_plane_velocities(np.ndarray lat,np.ndarray lon,np.int_t pole_low_index_N,np.int_t pole_low_index_S,np.ndarray new_u_N,np.ndarray new_v_N,tuple grids,np.ndarray grid_lat_coords_N,np.ndarray grid_lon_coords_N,np.ndarray new_u_S,np.ndarray new_v_S,np.ndarray grid_lat_coords_S,np.ndarray grid_lon_coords_S):
-	''' re-project combined velocites to polar plane (prevent discontinuity at the boundary)'''
-	x_dot_N,y_dot_N = low_level.upload_velocities(lat[pole_low_index_N:],lon,new_u_N,new_v_N,grids[0],grid_lat_coords_N,grid_lon_coords_N)
-	x_dot_S,y_dot_S = low_level.upload_velocities(lat[:pole_low_index_S],lon,new_u_S,new_v_S,grids[1],grid_lat_coords_S,grid_lon_coords_S)
-	return x_dot_N,y_dot_N,x_dot_S,y_dot_S
+	return w_temp
 
-cpdef w_plane(np.ndarray x_dot,np.ndarray y_dot,np.ndarray temperature,np.ndarray pressure_levels,DTYPE_f polar_grid_resolution,DTYPE_f gravity):
+cpdef w_plane_primitive(np.ndarray x_dot,np.ndarray y_dot,np.ndarray temperature,np.ndarray pressure_levels,DTYPE_f polar_grid_resolution,DTYPE_f gravity,accumulator=None):
 	cdef np.ndarray w_temp = np.zeros_like(x_dot)
-	cdef np.int_t k
 	temperature = low_level.theta_to_t(temperature,pressure_levels)
 
-	cdef np.ndarray x_dot_dx = low_level.grid_x_gradient_matrix(x_dot, polar_grid_resolution)
-	cdef np.ndarray y_dot_dy = low_level.grid_y_gradient_matrix(y_dot, polar_grid_resolution)
+	cdef np.ndarray x_dot_dx = low_level.grid_x_gradient_matrix_primitive(x_dot, polar_grid_resolution)
+	cdef np.ndarray y_dot_dy = low_level.grid_y_gradient_matrix_primitive(y_dot, polar_grid_resolution)
 	
-	for k in np.arange(1,len(pressure_levels)).tolist():
-		# w_temp[:,:,k] = - gravity*pressure_levels[k]*np.trapz(x_dot_dx[:,:,:k]+y_dot_dy[:,:,:k],pressure_levels[:k])/(287*temperature[:,:,k])
-		w_temp[:,:,k] = - np.trapz(x_dot_dx[:,:,:k]+y_dot_dy[:,:,:k],pressure_levels[:k])
+	# w_temp[:,:,k] = - gravity*pressure_levels[k]*np.trapz(x_dot_dx[:,:,:k]+y_dot_dy[:,:,:k],pressure_levels[:k])/(287*temperature[:,:,k])
+	w_temp[...,1:] = - low_level.cumulative_trapezoid_z(x_dot_dx+y_dot_dy,pressure_levels,None,accumulator)[...,:-1]
 	
 	return w_temp
 	
\ No newline at end of file
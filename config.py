@@ -19,6 +19,10 @@ class Config:
     GRAVITY = 9.81
     # Tilt of rotational axis w.r.t. solar plane
     AXIAL_TILT = 23.5
+    # None, or (times of day, times of year) at which to tabulate the sunlight
+    # up front instead of locating the sun every timestep (see
+    # solar.SolarForcing)
+    SOLAR_TABLE = None
     PRESSURE_LEVELS = (np.array([
         1000,
         950,
@@ -43,6 +47,9 @@ class Config:
         1
     ])) * 100
     NLEVELS = len(PRESSURE_LEVELS)
+    # number of passive tracers carried along by the winds (see
+    # top_level.advect_scalars)
+    NTRACERS = 1
     # timestep for initial period where the model only
     # calculates radiative effects
     DT_SPINUP = 60 * 17.2
@@ -51,15 +58,35 @@ class Config:
     DT_MAIN = 60 * 9.2
     # how long the model should only calculate radiative effects
     SPINUP_LENGTH = 0 * DAY
+    # after spinup, choose each timestep from the CFL number of the winds
+    # instead of using DT_MAIN
+    ADAPTIVE_DT = False
+    # CFL number the adaptive timestep aims for
+    CFL_TARGET = 0.5
+    # bounds on the adaptive timestep (s)
+    DT_MIN = DT_MAIN / 8
+    DT_MAX = DT_MAIN * 2
+    # largest factor the adaptive timestep grows by from one step to the next
+    DT_GROWTH = 1.1
+    # run these phases of a timestep (either of schedule.SUBCYCLED_PHASES)
+    # only every so many timesteps, trading accuracy for speed: the radiation
+    # heating is held in between its runs, and the polar planes keep their own
+    # winds in between refreshes of "plane_velocities" from the lat-lon grid
+    PHASE_FREQ = {"radiation": 1, "plane_velocities": 1}
+    # split the grid into this many latitude bands, each stepped by its own
+    # worker process (see decomposition.DecomposedSimulation)
+    BANDS = 1
 
     """
     SMOOTHING
     """
 
     # you probably won't need this, but there is the option to smooth out
-    # fields using FFTs (NB this slows down computation considerably and can
-    # introduce nonphysical errors)
+    # fields using FFTs (NB this can introduce nonphysical errors)
     SMOOTHING = False
+    # threads the smoothing FFTs run on; None follows OMP_NUM_THREADS (which
+    # sweeps limit) and otherwise uses one per core
+    SMOOTHING_WORKERS = None
     SMOOTHING_PARAM_T = 1.0
     SMOOTHING_PARAM_U = 0.9
     SMOOTHING_PARAM_V = 0.9
@@ -70,19 +97,45 @@ class Config:
     SAVE / LOADING
     """
 
-    # SAVE current state to file?
+    # SAVE current state to file? (save files pickled by older versions of
+    # the model can still be loaded, and are replaced by a checkpoint on the
+    # next save)
     SAVE = True
     SAVE_FILE = "save_file.p"
 
-    # LOAD initial state from file?
+    # LOAD initial state from file? (one saved on another grid is
+    # interpolated onto this one, so a run can be spun up cheaply at a coarse
+    # RESOLUTION and carried on at a finer one)
     LOAD = True
     INITIAL_SETUP = True
     SETUP_GRIDS = True
+    # directory the grid geometry built by INITIAL_SETUP and SETUP_GRIDS is
+    # cached in, by a hash of the settings it depends on, to be memory-mapped
+    # by later runs on the same grid (None to build it every time)
+    GEOMETRY_CACHE = None
     # write to file after this many timesteps have passed
     SAVE_FREQ = 100
     # how many timesteps between plots (set this low if you want realtime
     # plots, set this high to improve performance)
     PLOT_FREQ = 5
+    # simulated time between saves and between plots (s), used instead of
+    # SAVE_FREQ and PLOT_FREQ when set; with ADAPTIVE_DT they default to the
+    # time that many DT_MAIN steps would have covered
+    SAVE_INTERVAL = None
+    PLOT_INTERVAL = None
+    # append these fields (e.g. "u", "potential_temperature") to the
+    # history archive in the HISTORY_FILE directory every HISTORY_FREQ
+    # timesteps, or HISTORY_INTERVAL of simulated time (see history.HistoryWriter)
+    HISTORY_FIELDS = ()
+    HISTORY_FILE = "history"
+    HISTORY_FREQ = 10
+    HISTORY_INTERVAL = None
+    # keep only this many mantissa bits of each value in the history, to
+    # make it smaller (None to store it exactly)
+    HISTORY_KEEP_BITS = None
+    # draw the plots in a separate process, so the model does not wait for
+    # them (frames are skipped if plotting cannot keep up)
+    PLOT_PROCESS = True
 
     """
     DISPLAY
@@ -108,6 +161,24 @@ class Config:
     TOP = 17
     # print times taken to calculate specific processes each timestep
     VERBOSE = False
+    # time each phase of a timestep and each kernel, and count the calls (VERBOSE implies it)
+    INSTRUMENT = False
+    # also record the peak memory allocated within each timer (slows the model down considerably,
+    # and steps the poles one after the other, as the peak is shared by every thread)
+    INSTRUMENT_MEMORY = False
+    # write the timings, with rolling percentiles, to this .json or .csv file at the end of a run
+    # and whenever the process receives SIGUSR1
+    INSTRUMENT_FILE = None
+    # scalar diagnostics worked out as the model runs (see diagnostics.Diagnostics): any of
+    # "extrema", "global_mean", "kinetic_energy" and "nan"
+    DIAGNOSTICS = ("extrema",)
+    # fields the extrema and global means are taken of
+    DIAGNOSTICS_FIELDS = ("temperature_world", "u", "v", "w")
+    # where the diagnostics go: "stdout" and/or .csv and .jsonl files (none to switch them off)
+    DIAGNOSTICS_SINKS = ("stdout",)
+    # work them out after this many timesteps have passed, or this much simulated time (s)
+    DIAGNOSTICS_FREQ = 1
+    DIAGNOSTICS_INTERVAL = None
 
     """
     POLE LATITUDE LIMIT
@@ -121,6 +192,26 @@ class Config:
     # (do not set beyond about 80) [also mirrored to north POLE]
     POLE_HIGHER_LAT_LIMIT = -85
 
+    # order of the spline used to project between the polar planes and the
+    # lat-lon grid: 3 for bicubic, 1 for bilinear (faster, less accurate)
+    INTERPOLATION_ORDER = 3
+    # step the south polar plane on a thread of its own, alongside the north;
+    # None does so when OMP_NUM_THREADS (which sweeps limit) or, failing
+    # that, the number of cores is more than one. Never with INSTRUMENT_MEMORY
+    CONCURRENT_POLES = None
+
+    """
+    PRECISION
+    """
+
+    # floating point type of the model state and kernels: np.float32 halves
+    # the memory and bandwidth of a run, at some cost in accuracy (run
+    # drift_report.py to see how much for a given setup)
+    PRECISION = np.float64
+    # with single PRECISION, still sum the radiation flux recurrences and the
+    # vertical integrals in double precision
+    ACCUMULATE_DOUBLE = True
+
     """
     STUFF :}
     """
@@ -0,0 +1,486 @@
+# CLimate Analysis using Digital Estimations (CLAuDE)
+
+import multiprocessing
+import multiprocessing.connection
+import traceback
+
+import numpy as np
+
+import claude_low_level_library as low_level
+import claude_top_level_library as top_level
+
+from config import Config
+from schedule import Schedule
+from simulation import Simulation
+from solar import SolarForcing
+from sweep import attach_geometry, share_geometry, thread_limit
+
+# rows beyond the edge of a band that its stencils reach: the laplacians take
+# the gradient of a gradient
+HALO = 2
+# fields the bands read and write, kept in shared memory
+SHARED_FIELDS = (
+    "temperature_world", "potential_temperature", "u", "v", "w", "tracer", "geopotential", "atmosp_addition",
+    "u_add", "v_add", "x_dot_N", "y_dot_N", "x_dot_S", "y_dot_S", "north_reprojected_addition",
+    "south_reprojected_addition", "south_addition_smoothed", "heat_capacity_earth", "albedo"
+)
+
+
+def latitude_bands(nlat, indices, bands):
+    """Split the rows of the grid into bands of about the same size.
+
+    Returns a list of (start, end) row ranges. The first and last bands are
+    widened if need be to hold the whole of the south and north polar
+    regions, which are stepped on the polar planes.
+    """
+    pole_low_index_N, pole_high_index_N, pole_low_index_S, pole_high_index_S = indices
+    edges = np.linspace(0, nlat, bands + 1).round().astype(int)
+    if bands > 1:
+        edges[1] = max(edges[1], pole_low_index_S)
+        edges[-2] = min(edges[-2], pole_low_index_N)
+    if np.any(np.diff(edges) <= 0):
+        raise ValueError("{} rows cannot be split into {} bands with whole polar regions".format(nlat, bands))
+    return [(int(start), int(end)) for start, end in zip(edges[:-1], edges[1:])]
+
+
+class DecomposedSimulation(Simulation):
+    """A Simulation whose timesteps are shared out between worker processes.
+
+    The grid is split into latitude bands (config.BANDS of them, unless
+    bands is given), each stepped by its own worker; the first and last
+    also own the south and north polar planes. The fields live in shared
+    memory, so the rows a band's stencils need from its neighbours are read
+    straight from them, with the workers waiting for each other between
+    the phases of a timestep. Longitude stays whole within each band. The
+    result is the same as that of a Simulation.
+
+    threads limits the OpenMP and BLAS threads of each worker. Call close()
+    when done, to stop the workers and free the shared memory.
+    """
+
+    def __init__(self, config=Config, bands=None, members=None, threads=1):
+        if config.SMOOTHING:
+            raise ValueError("SMOOTHING filters whole fields, so cannot be split into bands")
+        if Schedule(config.PHASE_FREQ).subcycled:
+            raise ValueError("PHASE_FREQ subcycling is not supported with bands")
+        super().__init__(config, members)
+        self.bands = latitude_bands(config.NLAT, self.indices, bands or config.BANDS)
+
+        # written during the first timestep, but shared from the start
+        pole_low_index_N, pole_high_index_N, pole_low_index_S, pole_high_index_S = self.indices
+        self.u_add = np.zeros_like(self.u)
+        self.v_add = np.zeros_like(self.v)
+        self.north_reprojected_addition = np.zeros_like(self.u[..., pole_low_index_N:, :, :])
+        self.south_reprojected_addition = np.zeros_like(self.u[..., :pole_low_index_S, :, :])
+
+        self._workers = []
+        self._connections = []
+        geometry_block, geometry = share_geometry(self.geometry)
+        state_block, state = share_geometry({name: getattr(self, name) for name in SHARED_FIELDS})
+        self._blocks = [geometry_block, state_block]
+        self._attached, fields = attach_geometry(state, writeable=True)
+        for name in SHARED_FIELDS:
+            setattr(self, name, fields[name])
+
+        context = multiprocessing.get_context("spawn")
+        # kept, as the workers only open it once they have started
+        self._barrier = context.Barrier(len(self.bands))
+        with thread_limit(threads):
+            for band in self.bands:
+                connection, worker_connection = context.Pipe()
+                worker = context.Process(
+                    target=_run_band,
+                    args=(_settings(config), members, geometry, state, band, self._barrier, worker_connection),
+                    daemon=True
+                )
+                worker.start()
+                self._workers.append(worker)
+                self._connections.append(connection)
+
+    def advance(self, dt):
+        """Have every band advance its rows by dt, and wait for them to finish."""
+        for connection in self._connections:
+            connection.send((self.t, dt, self.velocity))
+
+        errors = []
+        waiting = dict(zip(self._connections, self.bands))
+        exits = {worker.sentinel: connection for worker, connection in zip(self._workers, self._connections)}
+        while waiting:
+            for ready in multiprocessing.connection.wait(list(waiting) + list(exits)):
+                connection = exits.pop(ready, ready)
+                if connection not in waiting:
+                    continue
+                band = waiting.pop(connection)
+                if connection.poll():
+                    error = connection.recv()
+                else:
+                    # the other bands would wait for this one for ever
+                    self._barrier.abort()
+                    error = "worker exited"
+                if error is not None:
+                    errors.append("band {}-{}: {}".format(band[0], band[1], error))
+        if errors:
+            self.close()
+            raise RuntimeError("\n".join(errors))
+
+    def close(self):
+        """Stop the workers and release the shared memory."""
+        super().close()
+        for connection in self._connections:
+            try:
+                connection.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+        for worker in self._workers:
+            worker.join(5)
+            if worker.is_alive():
+                worker.terminate()
+        self._workers = []
+        self._connections = []
+
+        # the fields are copied out of the blocks before they go
+        for name in SHARED_FIELDS:
+            setattr(self, name, np.array(getattr(self, name)))
+        if self._attached is not None:
+            self._attached.close()
+            self._attached = None
+        for block in self._blocks:
+            block.close()
+            block.unlink()
+        self._blocks = []
+
+
+def _settings(config):
+    # a worker imports Config afresh, so changes made to it here have to be
+    # passed along
+    return {name: getattr(config, name) for name in dir(config) if name.isupper()}
+
+
+def _run_band(settings, members, geometry, state, band, barrier, connection):
+    geometry_block, geometry = attach_geometry(geometry)
+    state_block, fields = attach_geometry(state, writeable=True)
+    # the state is the shared fields, of which each band only touches its own
+    # rows and their halo; only the main process reports, and a band steps
+    # its polar plane itself
+    settings.update(LOAD=False, VERBOSE=False, INSTRUMENT=False, INSTRUMENT_FILE=None, CONCURRENT_POLES=False)
+    simulation = Simulation(type("BandConfig", (Config,), settings), members, geometry, fields)
+    stepper = _Band(simulation, band, barrier)
+
+    with simulation:
+        while True:
+            message = connection.recv()
+            if message is None:
+                break
+            try:
+                simulation.t, dt, simulation.velocity = message
+                stepper.advance(dt)
+                connection.send(None)
+            except Exception:
+                # release the other bands from waiting on this one
+                barrier.abort()
+                connection.send(traceback.format_exc())
+
+    del simulation, stepper, fields, geometry
+    state_block.close()
+    geometry_block.close()
+
+
+class _Band:
+    # Simulation.advance restricted to the rows of one band, phase by phase;
+    # the two have to be kept in step
+
+    def __init__(self, simulation, band, barrier):
+        config = simulation.config
+        self.simulation = simulation
+        self.barrier = barrier
+        start, end = band
+        self.rows = slice(start, end)
+        # the band and the rows around it that its stencils read, and where
+        # the band sits within those
+        self.halo = slice(max(start - HALO, 0), min(end + HALO, config.NLAT))
+        self.inner = slice(start - self.halo.start, end - self.halo.start)
+        self.first = start == 0
+        self.last = end == config.NLAT
+        self.hemispheres = ("S" if self.first else "") + ("N" if self.last else "")
+
+        depth_step, depth_denominator, *coefficients = simulation.radiation_coefficients
+        self.radiation_coefficients = (depth_step[self.rows], depth_denominator[self.rows], *coefficients)
+        self.solar = SolarForcing(
+            config.LAT[self.rows], config.LON, config.DAY, config.YEAR, config.AXIAL_TILT,
+            simulation.members or 1, config.SOLAR_TABLE
+        )
+        # rows of the halo the tracers are advected on
+        self.tracer_rows = simulation.tracer_rows[self.halo]
+
+    def advance(self, dt):
+        sim = self.simulation
+        config = sim.config
+        rows, halo, inner = self.rows, self.halo, self.inner
+        workspace = sim.workspace
+        (pole_low_index_N, pole_high_index_N,
+         pole_low_index_S, pole_high_index_S) = sim.indices
+        (grid_lat_coords_N, grid_lon_coords_N, grid_x_values_N,
+         grid_y_values_N, polar_x_coords_N, polar_y_coords_N,
+         grid_lat_coords_S, grid_lon_coords_S, grid_x_values_S,
+         grid_y_values_S, polar_x_coords_S, polar_y_coords_S) = sim.coords
+        grids = sim.grids
+        operators = sim.operators
+        blend_N, blend_S = sim.blends
+        dx = sim.dx
+        dy = sim.dy
+
+        # columns are independent in the radiation, so each band does its own
+        top_level.radiation_calculation(
+            sim.temperature_world[..., rows, :],
+            sim.potential_temperature[..., rows, :, :],
+            config.PRESSURE_LEVELS,
+            sim.heat_capacity_earth[..., rows, :],
+            sim.albedo[..., rows, :],
+            config.INSOLATION,
+            config.LAT[rows],
+            config.LON,
+            sim.t,
+            dt,
+            config.DAY,
+            config.YEAR,
+            config.AXIAL_TILT,
+            self.radiation_coefficients,
+            workspace,
+            sim.accumulator,
+            self.solar.pattern(sim.t)
+        )
+        self.barrier.wait()
+
+        diffusion = top_level.laplacian_2d(sim.temperature_world[..., halo, :], dx[halo], dy, workspace)[..., inner, :]
+        if self.first:
+            diffusion[..., 0, :] = np.mean(diffusion[..., 1, :], axis=-1, keepdims=True)
+        if self.last:
+            diffusion[..., -1, :] = np.mean(diffusion[..., -2, :], axis=-1, keepdims=True)
+        self.barrier.wait()
+        sim.temperature_world[..., rows, :] -= dt * 1E-5 * diffusion
+
+        geopotential = sim.geopotential[..., rows, :, :]
+        low_level.cumulative_sum_z(sim.potential_temperature[..., rows, :, :], sim.sigma, geopotential, sim.accumulator)
+        np.negative(geopotential, out=geopotential)
+
+        if not sim.velocity:
+            return
+        self.barrier.wait()
+
+        shape = np.shape(sim.u[..., halo, :, :])
+        u_add, v_add = top_level.velocity_calculation(
+            sim.u[..., halo, :, :],
+            sim.v[..., halo, :, :],
+            sim.w[..., halo, :, :],
+            config.PRESSURE_LEVELS,
+            sim.geopotential[..., halo, :, :],
+            sim.potential_temperature[..., halo, :, :],
+            sim.coriolis[halo],
+            config.GRAVITY,
+            dx[halo],
+            dy,
+            dt,
+            out=(workspace.get('u_add', shape, sim.dtype), workspace.get('v_add', shape, sim.dtype))
+        )
+        sim.u_add[..., rows, :, :] = u_add[..., inner, :, :]
+        sim.v_add[..., rows, :, :] = v_add[..., inner, :, :]
+
+        # the polar regions lie wholly within the first and last bands
+        if self.hemispheres:
+            grid_velocities = (sim.x_dot_N, sim.y_dot_N, sim.x_dot_S, sim.y_dot_S)
+            (_, _, north_reprojected_addition, south_reprojected_addition,
+             _, _, _, _) = top_level.polar_planes(
+                 sim.u,
+                 sim.v,
+                 sim.u_add,
+                 sim.v_add,
+                 sim.potential_temperature,
+                 sim.geopotential,
+                 grid_velocities,
+                 sim.indices,
+                 grids,
+                 sim.coords,
+                 sim.coriolis_plane_N,
+                 sim.coriolis_plane_S,
+                 sim.grid_side_length,
+                 config.PRESSURE_LEVELS,
+                 config.LAT,
+                 config.LON,
+                 dt,
+                 sim.polar_grid_resolution,
+                 config.GRAVITY,
+                 operators,
+                 self.hemispheres,
+                 sim.blends
+            )
+        self.barrier.wait()
+
+        sim.u[..., rows, :, :] += sim.u_add[..., rows, :, :]
+        sim.v[..., rows, :, :] += sim.v_add[..., rows, :, :]
+
+        if self.hemispheres:
+            x_dot_N, y_dot_N, x_dot_S, y_dot_S = top_level.update_plane_velocities(
+                config.LAT,
+                config.LON,
+                pole_low_index_N,
+                pole_low_index_S,
+                np.flip(sim.u[..., pole_low_index_N:, :, :], axis=-2),
+                np.flip(sim.v[..., pole_low_index_N:, :, :], axis=-2),
+                grids,
+                grid_lat_coords_N,
+                grid_lon_coords_N,
+                sim.u[..., :pole_low_index_S, :, :],
+                sim.v[..., :pole_low_index_S, :, :],
+                grid_lat_coords_S,
+                grid_lon_coords_S,
+                operators,
+                self.hemispheres
+            )
+        self.barrier.wait()
+
+        w = top_level.w_calculation(
+            sim.u[..., halo, :, :],
+            sim.v[..., halo, :, :],
+            sim.w[..., halo, :, :],
+            config.PRESSURE_LEVELS,
+            sim.geopotential[..., halo, :, :],
+            sim.potential_temperature[..., halo, :, :],
+            sim.coriolis[halo],
+            config.GRAVITY,
+            dx[halo],
+            dy,
+            dt,
+            out=workspace.get('w', shape, sim.dtype),
+            workspace=workspace,
+            accumulator=sim.accumulator
+        )
+        sim.w[..., rows, :, :] = w[..., inner, :, :]
+
+        if self.last:
+            sim.north_reprojected_addition[...] = north_reprojected_addition
+            sim.x_dot_N[...] = x_dot_N
+            sim.y_dot_N[...] = y_dot_N
+
+            theta_N = low_level.beam_me_up(
+                config.LAT[pole_low_index_N:],
+                config.LON,
+                sim.potential_temperature[..., pole_low_index_N:, :, :],
+                grids[0],
+                grid_lat_coords_N,
+                grid_lon_coords_N,
+                operators[0]
+            )
+            w_N = top_level.w_plane(
+                sim.x_dot_N,
+                sim.y_dot_N,
+                theta_N,
+                config.PRESSURE_LEVELS,
+                sim.polar_grid_resolution,
+                config.GRAVITY,
+                sim.accumulator
+            )
+            w_N = np.flip(
+                low_level.beam_me_down(
+                    config.LON,
+                    w_N,
+                    pole_low_index_N,
+                    grid_x_values_N,
+                    grid_y_values_N,
+                    polar_x_coords_N,
+                    polar_y_coords_N,
+                    operators[1]
+                ),
+                axis=-2
+            )
+            blend_N(sim.w[..., pole_low_index_N:, :, :], w_N, sim.w[..., pole_low_index_N:, :, :])
+
+        if self.first:
+            sim.south_reprojected_addition[...] = south_reprojected_addition
+            sim.x_dot_S[...] = x_dot_S
+            sim.y_dot_S[...] = y_dot_S
+
+            w_S = top_level.w_plane(
+                sim.x_dot_S,
+                sim.y_dot_S,
+                low_level.beam_me_up(
+                    config.LAT[:pole_low_index_S],
+                    config.LON,
+                    sim.potential_temperature[..., :pole_low_index_S, :, :],
+                    grids[1],
+                    grid_lat_coords_S,
+                    grid_lon_coords_S,
+                    operators[2]
+                ),
+                config.PRESSURE_LEVELS,
+                sim.polar_grid_resolution,
+                config.GRAVITY,
+                sim.accumulator
+            )
+            w_S = low_level.beam_me_down(
+                config.LON,
+                w_S,
+                pole_low_index_S,
+                grid_x_values_S,
+                grid_y_values_S,
+                polar_x_coords_S,
+                polar_y_coords_S,
+                operators[3]
+            )
+            blend_S(sim.w[..., :pole_low_index_S, :, :], w_S, sim.w[..., :pole_low_index_S, :, :])
+
+        sim.w[..., rows, :, 18:] *= 0
+        self.barrier.wait()
+
+        atmosp_addition, tracer_addition = top_level.advect_scalars(
+            sim.potential_temperature[..., halo, :, :],
+            sim.tracer[..., halo, :, :],
+            sim.u[..., halo, :, :],
+            sim.v[..., halo, :, :],
+            sim.w[..., halo, :, :],
+            dx[halo],
+            dy,
+            config.PRESSURE_LEVELS,
+            self.tracer_rows,
+            workspace.get('atmosp_addition', shape, sim.dtype),
+            workspace.get('tracer_addition', sim.tracer[..., halo, :, :].shape, sim.dtype)
+        )
+        sim.atmosp_addition[..., rows, :, :] = atmosp_addition[..., inner, :, :]
+
+        # combine addition calculated on polar grid with
+        # that calculated on the cartestian grid
+        if self.last:
+            blend_N(
+                sim.atmosp_addition[..., pole_low_index_N:, :, :],
+                sim.north_reprojected_addition,
+                sim.atmosp_addition[..., pole_low_index_N:, :, :]
+            )
+        if self.first:
+            blend_S(
+                sim.atmosp_addition[..., :pole_low_index_S, :, :],
+                sim.south_reprojected_addition,
+                sim.south_addition_smoothed
+            )
+            sim.atmosp_addition[..., :pole_low_index_S, :, :] = sim.south_addition_smoothed
+
+        sim.atmosp_addition[..., rows, :, 17] *= 0.5
+        sim.atmosp_addition[..., rows, :, 18:] *= 0
+
+        self.barrier.wait()
+
+        sim.potential_temperature[..., rows, :, :] -= dt*sim.atmosp_addition[..., rows, :, :]
+        sim.tracer[..., rows, :, :] -= dt*tracer_addition[..., inner, :, :]
+        self.barrier.wait()
+
+        diffusion = top_level.laplacian_3d(
+            sim.potential_temperature[..., halo, :, :],
+            dx[halo],
+            dy,
+            config.PRESSURE_LEVELS,
+            workspace
+        )[..., inner, :, :]
+        if self.first:
+            diffusion[..., 0, :, :] = np.mean(diffusion[..., 1, :, :], axis=-2, keepdims=True)
+        if self.last:
+            diffusion[..., -1, :, :] = np.mean(diffusion[..., -2, :, :], axis=-2, keepdims=True)
+        self.barrier.wait()
+        sim.potential_temperature[..., rows, :, :] -= dt * 1E-4 * diffusion
@@ -0,0 +1,147 @@
+# CLimate Analysis using Digital Estimations (CLAuDE)
+
+import collections
+import csv
+import json
+import sys
+
+import numpy as np
+
+import claude_low_level_library as low_level
+
+# number of recent records kept in Diagnostics.history
+WINDOW = 1000
+METRICS = ("extrema", "global_mean", "kinetic_energy", "nan")
+
+
+class Diagnostics:
+    """Scalar metrics of the model state, kept in a ring buffer and handed to sinks.
+
+    Can be used directly as a Simulation hook; the cadence is that of the
+    hook. Each call works out the metrics asked for, any of METRICS, over
+    the named fields. Every field is read once, by
+    low_level.field_reductions, however many metrics use it. The global
+    means and the kinetic energy are weighted by the area of each latitude
+    row and taken over every member of an ensemble.
+
+    Each record is a dict of t, dt, step_time (and cfl, if the timestep is
+    adaptive) and the metrics. It is appended to history, which holds the
+    last window records, and passed to the write method of every sink.
+    """
+
+    def __init__(self, metrics=("extrema",), fields=("temperature_world", "u", "v", "w"), sinks=(), window=WINDOW):
+        unknown = set(metrics) - set(METRICS)
+        if unknown:
+            raise ValueError("unknown diagnostics: " + ", ".join(sorted(unknown)))
+        self.metrics = metrics
+        self.fields = fields
+        self.sinks = list(sinks)
+        self.history = collections.deque(maxlen=window)
+        self._weights = None
+
+    def __call__(self, simulation):
+        self.record(simulation)
+
+    def record(self, simulation):
+        """Work out the metrics of simulation, store them and pass them on to the sinks."""
+        if self._weights is None:
+            self._weights = np.cos(simulation.config.LAT * np.pi / 180)
+
+        needed = list(self.fields)
+        if "kinetic_energy" in self.metrics:
+            needed += [name for name in ("u", "v") if name not in needed]
+        reductions = {}
+        for name in needed:
+            field = getattr(simulation, name)
+            # the axis of a block of tracers is reduced over like that of members
+            field_ndim = min(field.ndim - len(simulation.member_shape), 3)
+            reductions[name] = low_level.field_reductions(field, self._weights, field_ndim)
+
+        record = {"t": simulation.t, "dt": simulation.dt, "step_time": simulation.step_time}
+        if simulation.cfl is not None:
+            record["cfl"] = simulation.cfl
+        for name in self.fields:
+            minimum, maximum, mean, _, _ = reductions[name]
+            if "extrema" in self.metrics:
+                record[name + "_min"] = minimum
+                record[name + "_max"] = maximum
+            if "global_mean" in self.metrics:
+                record[name + "_mean"] = mean
+        if "kinetic_energy" in self.metrics:
+            record["kinetic_energy"] = 0.5 * (reductions["u"][3] + reductions["v"][3])
+        if "nan" in self.metrics:
+            record["nan"] = any(reduction[4] for reduction in reductions.values())
+
+        self.history.append(record)
+        for sink in self.sinks:
+            sink.write(record)
+        return record
+
+    def close(self):
+        """Close every sink."""
+        for sink in self.sinks:
+            sink.close()
+
+
+class StdoutSink:
+    """Prints each record on a line of its own, with t in units of day."""
+
+    def __init__(self, day=60 * 60 * 24, stream=None):
+        self.day = day
+        self.stream = stream or sys.stdout
+
+    def write(self, record):
+        values = ("{} {}".format(name, _format(value)) for name, value in record.items() if name != "t")
+        print("t = {} days | {}".format(round(record["t"] / self.day, 2), "  ".join(values)), file=self.stream)
+
+    def close(self):
+        self.stream.flush()
+
+
+class CsvSink:
+    """Writes the records to a CSV file, one row each, with the names of the first as the header."""
+
+    def __init__(self, path):
+        self._file = open(path, "w", newline="")
+        self._writer = None
+
+    def write(self, record):
+        if self._writer is None:
+            self._writer = csv.DictWriter(self._file, list(record), extrasaction="ignore")
+            self._writer.writeheader()
+        self._writer.writerow(record)
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class JsonLinesSink:
+    """Writes the records to a file as JSON, one line each."""
+
+    def __init__(self, path):
+        self._file = open(path, "w")
+
+    def write(self, record):
+        self._file.write(json.dumps(record) + "\n")
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+def open_sink(target, day=60 * 60 * 24):
+    """Sink for target: "stdout", or a path ending in .csv or .jsonl."""
+    if target == "stdout":
+        return StdoutSink(day)
+    if target.endswith(".csv"):
+        return CsvSink(target)
+    if target.endswith(".jsonl"):
+        return JsonLinesSink(target)
+    raise ValueError("no diagnostics sink for {!r}; use 'stdout' or a .csv or .jsonl path".format(target))
+
+
+def _format(value):
+    if isinstance(value, float):
+        return "{:.4g}".format(value)
+    return str(value)
@@ -0,0 +1,66 @@
+# CLimate Analysis using Digital Estimations (CLAuDE)
+
+import sys
+
+import numpy as np
+
+from config import Config
+from simulation import Simulation
+from sweep import sweep_config
+
+# prognostic fields compared between the two runs
+DRIFT_FIELDS = ("potential_temperature", "temperature_world", "u", "v", "w", "tracer")
+
+
+def drift_report(steps, config=Config, precision=np.float32, interval=None, overrides=None):
+    """Run config in double and in the given precision side by side.
+
+    Both runs start from the same state. Every interval timesteps (and after
+    the last) the fields of the two are compared; each row of the returned
+    list holds the step, the field, the largest and root mean square
+    difference, and the latter relative to the root mean square of the
+    double precision field. The state size and mean step time of each run
+    are returned alongside.
+    """
+    overrides = dict(overrides or {})
+    reference = Simulation(sweep_config(config, dict(overrides, PRECISION=np.float64)))
+    reduced = Simulation(sweep_config(config, dict(overrides, PRECISION=precision)))
+    interval = interval or steps
+
+    rows = []
+    times = [0.0, 0.0]
+    for step in range(1, steps + 1):
+        reference.step()
+        reduced.step()
+        times[0] += reference.step_time
+        times[1] += reduced.step_time
+
+        if step % interval == 0 or step == steps:
+            for name in DRIFT_FIELDS:
+                expected = getattr(reference, name)
+                difference = getattr(reduced, name) - expected
+                rms = np.sqrt(np.mean(difference ** 2))
+                scale = np.sqrt(np.mean(expected ** 2))
+                relative = float(rms / scale) if scale else 0.0
+                rows.append((step, name, float(np.abs(difference).max()), float(rms), relative))
+
+    summary = {
+        "state_bytes": [sum(getattr(run, name).nbytes for name in DRIFT_FIELDS) for run in (reference, reduced)],
+        "step_time": [total / steps for total in times],
+    }
+    return rows, summary
+
+
+def print_drift_report(rows, summary):
+    """Print the result of drift_report as a table."""
+    print("{:>6} {:<22} {:>12} {:>12} {:>12}".format("step", "field", "max |diff|", "rms diff", "relative"))
+    for step, name, largest, rms, relative in rows:
+        print("{:>6} {:<22} {:>12.3e} {:>12.3e} {:>12.3e}".format(step, name, largest, rms, relative))
+    print("state size:", " / ".join(str(round(size / 2 ** 20, 1)) + " MiB" for size in summary["state_bytes"]))
+    print("step time: ", " / ".join(str(round(time, 4)) + " s" for time in summary["step_time"]))
+
+
+if __name__ == "__main__":
+    steps = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    interval = int(sys.argv[2]) if len(sys.argv) > 2 else None
+    print_drift_report(*drift_report(steps, interval=interval))
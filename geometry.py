@@ -0,0 +1,123 @@
+# CLimate Analysis using Digital Estimations (CLAuDE)
+
+import hashlib
+import json
+import os
+
+import numpy as np
+import scipy.sparse
+
+from checkpoint import read_checkpoint, write_checkpoint
+
+# settings the grid geometry is built from; runs that agree on all of them
+# can share a single copy of it
+GEOMETRY_SETTINGS = (
+    "DAY", "PLANET_RADIUS", "PRESSURE_LEVELS", "LAT", "LON",
+    "POLE_LOWER_LAT_LIMIT", "POLE_HIGHER_LAT_LIMIT", "INTERPOLATION_ORDER", "PRECISION"
+)
+# bumped whenever the geometry itself changes, so that older cache files are
+# not picked up
+CACHE_VERSION = 1
+
+
+def plane_axis(lat, planet_radius, pole_lower_lat_limit, grid_pad=2):
+    """x (and y) of the gridpoints along each side of the polar planes."""
+    pole_low_index = np.where(lat > pole_lower_lat_limit)[0][0]
+    # the spacing of the lat-lon grid where the planes meet it
+    resolution = 2 * np.pi * planet_radius / len(lat) * np.cos(lat[pole_low_index] * np.pi / 180)
+    size_of_grid = planet_radius * np.cos(lat[pole_low_index + grid_pad] * np.pi / 180.0)
+    return np.arange(-size_of_grid, size_of_grid, resolution)
+
+
+def geometry_key(config):
+    """The settings of config the geometry depends on, as a string."""
+    return json.dumps([jsonable(getattr(config, name)) for name in GEOMETRY_SETTINGS])
+
+
+def jsonable(value):
+    """value with arrays, numpy scalars and dtypes converted to plain Python."""
+    if isinstance(value, dict):
+        return {name: jsonable(item) for name, item in value.items()}
+    if isinstance(value, (np.ndarray, np.generic)):
+        return value.tolist()
+    if isinstance(value, (type, np.dtype)):
+        return np.dtype(value).name
+    if isinstance(value, (list, tuple)):
+        return [jsonable(item) for item in value]
+    return value
+
+
+def flatten_geometry(geometry):
+    """Split geometry into a list of its arrays and a JSON-friendly layout.
+
+    Sparse matrices are split into their CSR arrays and tuples are followed
+    into; unflatten_geometry puts the two back together.
+    """
+    arrays = []
+
+    def pack(value):
+        if isinstance(value, np.ndarray):
+            arrays.append(value)
+            return ("array", len(arrays) - 1)
+        if scipy.sparse.issparse(value):
+            value = value.tocsr()
+            return ("csr", pack(value.data), pack(value.indices), pack(value.indptr), value.shape)
+        if isinstance(value, tuple):
+            return ("tuple", [pack(item) for item in value])
+        return ("value", jsonable(value))
+
+    return arrays, {name: pack(value) for name, value in geometry.items()}
+
+
+def unflatten_geometry(arrays, layout):
+    """Rebuild the geometry flatten_geometry split up, without copying the arrays."""
+    def unpack(entry):
+        kind = entry[0]
+        if kind == "array":
+            return arrays[entry[1]]
+        if kind == "csr":
+            data, indices, indptr = (unpack(part) for part in entry[1:4])
+            return scipy.sparse.csr_matrix((data, indices, indptr), shape=tuple(entry[4]), copy=False)
+        if kind == "tuple":
+            return tuple(unpack(item) for item in entry[1])
+        return entry[1]
+
+    return {name: unpack(entry) for name, entry in layout.items()}
+
+
+def cache_path(directory, config):
+    """File in directory that holds the geometry of config."""
+    digest = hashlib.sha256((str(CACHE_VERSION) + geometry_key(config)).encode()).hexdigest()
+    return os.path.join(directory, "geometry_" + digest[:16] + ".ckpt")
+
+
+def read_cached_geometry(directory, config):
+    """The geometry of config from the cache in directory, or None if it is not there.
+
+    The arrays are memory-mapped read-only, so runs on the same grid share
+    the pages of the file.
+    """
+    path = cache_path(directory, config)
+    if not os.path.exists(path):
+        return None
+    state, metadata = read_checkpoint(path, mmap_mode="r")
+    if metadata.get("key") != geometry_key(config):
+        return None
+    arrays = [np.asarray(state[str(index)]) for index in range(len(state))]
+    return unflatten_geometry(arrays, metadata["layout"])
+
+
+def write_cached_geometry(directory, config, geometry):
+    """Add the geometry of config to the cache in directory."""
+    os.makedirs(directory, exist_ok=True)
+    path = cache_path(directory, config)
+    arrays, layout = flatten_geometry(geometry)
+    # runs started together may all be writing the same file, so each writes
+    # its own copy and moves it into place
+    own_path = path + "." + str(os.getpid())
+    write_checkpoint(
+        own_path,
+        {str(index): array for index, array in enumerate(arrays)},
+        {"key": geometry_key(config), "layout": layout}
+    )
+    os.replace(own_path, path)
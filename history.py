@@ -0,0 +1,148 @@
+# CLimate Analysis using Digital Estimations (CLAuDE)
+
+import json
+import os
+
+import numpy as np
+
+# the index of an archive, next to one raw data file per field
+INDEX_FILE = "history.json"
+# the data files grow by this many records at a time
+CHUNK = 64
+
+
+def bit_round(a, keep_bits):
+    """a with all but keep_bits bits of each mantissa rounded away, in place.
+
+    Rounds to nearest, ties to even, so the error is unbiased and at most half
+    the last bit kept. The zeroed trailing bits make the archive far more
+    compressible, and a low-order noise floor drops out of the data.
+    """
+    mantissa_bits = np.finfo(a.dtype).nmant
+    if keep_bits >= mantissa_bits:
+        return a
+    drop = mantissa_bits - keep_bits
+    bits = a.view(np.dtype("u" + str(a.dtype.itemsize)))
+    one = bits.dtype.type(1)
+    # round half to even: add just under half, plus the last bit kept
+    bits += (one << bits.dtype.type(drop - 1)) - one + ((bits >> bits.dtype.type(drop)) & one)
+    bits &= ~((one << bits.dtype.type(drop)) - one)
+    return a
+
+
+class HistoryWriter:
+    """Appends snapshots of some fields of the model to an archive on disk.
+
+    The archive is a directory holding INDEX_FILE and a raw file for each
+    field, plus one for t, laid out as a C-ordered array with time first. The
+    files are grown CHUNK records at a time, and the index, which says how
+    many records are complete, is rewritten after each. An archive that
+    already exists is appended to, as long as its fields match. With
+    keep_bits set, floating point fields are passed through bit_round first.
+    Can be used directly as a Simulation hook; see read_history for getting
+    the data back.
+    """
+
+    def __init__(self, path, fields, keep_bits=None):
+        self.path = path
+        self.fields = tuple(fields)
+        self.keep_bits = keep_bits
+        self.count = 0
+        self._files = {}
+        self._layout = None
+        os.makedirs(path, exist_ok=True)
+
+        index_path = os.path.join(path, INDEX_FILE)
+        if os.path.exists(index_path):
+            with open(index_path) as f:
+                index = json.load(f)
+            if list(index["fields"]) != ["t"] + list(self.fields):
+                raise ValueError("history archive {} holds {}, not {}".format(
+                    path, ", ".join(index["fields"]), ", ".join(("t",) + self.fields)
+                ))
+            self._layout = index["fields"]
+            self.count = index["count"]
+
+    def __call__(self, simulation):
+        self.append(simulation)
+
+    def append(self, simulation):
+        """Add the current value of each field of simulation to the archive."""
+        values = {"t": np.array(simulation.t, dtype=np.float64)}
+        for name in self.fields:
+            values[name] = np.asarray(getattr(simulation, name))
+
+        if self._layout is None:
+            self._layout = {name: {"dtype": value.dtype.str, "shape": list(value.shape)}
+                            for name, value in values.items()}
+        for name, value in values.items():
+            layout = self._layout[name]
+            if list(value.shape) != layout["shape"] or value.dtype.str != layout["dtype"]:
+                raise ValueError("{} has changed shape or type since the history archive was started".format(name))
+
+        for name, value in values.items():
+            if self.keep_bits is not None and name != "t" and value.dtype.kind == "f":
+                value = bit_round(value.copy(), self.keep_bits)
+            f = self._file(name)
+            record_bytes = value.nbytes
+            if (self.count + 1) * record_bytes > os.fstat(f.fileno()).st_size:
+                f.truncate((self.count + CHUNK) * record_bytes)
+            f.seek(self.count * record_bytes)
+            f.write(np.ascontiguousarray(value).tobytes())
+            f.flush()
+
+        self.count += 1
+        self._write_index()
+
+    def close(self):
+        """Close the data files; the archive stays readable, and can be appended to again."""
+        for f in self._files.values():
+            f.close()
+        self._files = {}
+
+    def _file(self, name):
+        if name not in self._files:
+            data_path = os.path.join(self.path, name + ".dat")
+            self._files[name] = open(data_path, "r+b" if os.path.exists(data_path) else "w+b")
+        return self._files[name]
+
+    def _write_index(self):
+        index_path = os.path.join(self.path, INDEX_FILE)
+        with open(index_path + ".tmp", "w") as f:
+            json.dump({"count": self.count, "fields": self._layout, "keep_bits": self.keep_bits}, f)
+        os.replace(index_path + ".tmp", index_path)
+
+
+class History:
+    """A history archive, memory-mapped.
+
+    history[name] is a (time, ...) array of that field and history.t the
+    times; only the parts that are indexed are read from disk, so e.g.
+    history["u"][:, ..., 5] pulls a single level out of the whole run.
+    """
+
+    def __init__(self, path):
+        with open(os.path.join(path, INDEX_FILE)) as f:
+            index = json.load(f)
+        self.path = path
+        self.count = index["count"]
+        self.keep_bits = index["keep_bits"]
+        self.fields = [name for name in index["fields"] if name != "t"]
+        self._layout = index["fields"]
+        self.t = self["t"]
+
+    def __getitem__(self, name):
+        layout = self._layout[name]
+        if self.count == 0:
+            return np.empty([0] + layout["shape"], np.dtype(layout["dtype"]))
+        return np.memmap(
+            os.path.join(self.path, name + ".dat"),
+            dtype=np.dtype(layout["dtype"]),
+            mode="r",
+            shape=tuple([self.count] + layout["shape"])
+        )
+
+
+def read_history(path):
+    """Open the history archive at path, without reading any of its data."""
+    return History(path)
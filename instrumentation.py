@@ -0,0 +1,239 @@
+# CLimate Analysis using Digital Estimations (CLAuDE)
+
+import collections
+import contextlib
+import csv
+import json
+import signal
+import threading
+import time
+import tracemalloc
+
+import numpy as np
+
+# number of recent calls of each timer the percentiles are taken over
+WINDOW = 1000
+CSV_COLUMNS = ("name", "calls", "total", "mean", "p50", "p95", "max", "peak_bytes_p50", "peak_bytes_max")
+
+
+class Timing:
+    """Call count, total and recent durations of one named timer."""
+
+    def __init__(self, window):
+        self.calls = 0
+        self.total = 0.0
+        self.last = 0.0
+        self.last_started = 0.0
+        self.durations = collections.deque(maxlen=window)
+        self.peak_bytes = collections.deque(maxlen=window)
+
+    def statistics(self):
+        durations = np.array(self.durations)
+        statistics = {
+            "calls": self.calls,
+            "total": self.total,
+            "mean": self.total / self.calls,
+            "p50": float(np.percentile(durations, 50)),
+            "p95": float(np.percentile(durations, 95)),
+            "max": float(durations.max()),
+        }
+        if self.peak_bytes:
+            statistics["peak_bytes_p50"] = float(np.percentile(self.peak_bytes, 50))
+            statistics["peak_bytes_max"] = int(max(self.peak_bytes))
+        return statistics
+
+
+class Instrumentation:
+    """Nested named timers and counters for the phases and kernels of a run.
+
+    start(name) and stop(name), or the timer(name) context manager, time the
+    code between them under a path made of the names of the enclosing
+    timers, e.g. "step/radiation", and count the calls. With track_memory
+    the peak memory allocated inside each timer is recorded too, using
+    tracemalloc. Its peak is shared by the whole process, so the memory of
+    a timer also counts whatever other threads allocate meanwhile; it is
+    only meaningful when one thread is timed at a time (Simulation turns
+    its concurrent poles off for this). statistics() gives the totals and rolling p50/p95 of every
+    timer, and write() saves them as JSON or CSV.
+    """
+
+    enabled = True
+
+    def __init__(self, track_memory=False, window=WINDOW):
+        self.track_memory = track_memory
+        self.window = window
+        self.timers = {}
+        self.counters = collections.Counter()
+        self._threads = threading.local()
+        if track_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @property
+    def _stack(self):
+        # name, path, start time, traced memory at the start and the highest
+        # peak seen inside, for each running timer; timers started on other
+        # threads (e.g. the polar planes of Simulation) nest on their own
+        if not hasattr(self._threads, "stack"):
+            self._threads.stack = []
+        return self._threads.stack
+
+    def start(self, name):
+        """Start timing name, nested in whichever timers are running."""
+        path = self._stack[-1][1] + "/" + name if self._stack else name
+        if path not in self.timers:
+            # added here rather than in stop, so enclosing timers come first
+            self.timers[path] = Timing(self.window)
+        memory = 0
+        if self.track_memory:
+            memory = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        self._stack.append([name, path, time.perf_counter(), memory, memory])
+
+    def stop(self, name):
+        """Stop the innermost timer, which has to be name, and return its duration."""
+        end = time.perf_counter()
+        started, path, start, memory, peak = self._stack.pop()
+        if started != name:
+            raise ValueError("stopped timer {} while {} was running".format(name, started))
+
+        timing = self.timers[path]
+        duration = end - start
+        timing.calls += 1
+        timing.total += duration
+        timing.last = duration
+        timing.last_started = start
+        timing.durations.append(duration)
+
+        if self.track_memory:
+            # reset_peak is shared by every level of nesting, so the enclosing
+            # timer is told about the peak seen here
+            peak = max(peak, tracemalloc.get_traced_memory()[1])
+            timing.peak_bytes.append(peak - memory)
+            if self._stack:
+                self._stack[-1][4] = max(self._stack[-1][4], peak)
+        return duration
+
+    @contextlib.contextmanager
+    def timer(self, name):
+        """Time the body of a with statement as name."""
+        self.start(name)
+        try:
+            yield
+        finally:
+            self.stop(name)
+
+    def count(self, name, n=1):
+        """Add n to the counter called name."""
+        self.counters[name] += n
+
+    def instrument(self, module):
+        """Stand-in for module whose functions are each timed under their own name."""
+        return InstrumentedModule(module, self)
+
+    def statistics(self):
+        """Totals and rolling percentiles of every timer, and the counters."""
+        return {
+            "timers": {path: timing.statistics() for path, timing in self.timers.items() if timing.calls},
+            "counters": dict(self.counters),
+        }
+
+    def write(self, path):
+        """Save statistics() to path, as CSV if it ends in .csv and as JSON otherwise."""
+        statistics = self.statistics()
+        with open(path, "w", newline="") as f:
+            if not path.endswith(".csv"):
+                json.dump(statistics, f, indent=1)
+                return
+            writer = csv.DictWriter(f, CSV_COLUMNS)
+            writer.writeheader()
+            for name, timing in statistics["timers"].items():
+                writer.writerow(dict(timing, name=name))
+            for name, calls in statistics["counters"].items():
+                writer.writerow({"name": name, "calls": calls})
+
+    def write_on_signal(self, path, signum=getattr(signal, "SIGUSR1", None)):
+        """Save the statistics to path whenever the process receives signum.
+
+        Signals are only available on some platforms, and handlers can only
+        be installed from the main thread; otherwise this does nothing.
+        """
+        if signum is None:
+            return
+        try:
+            signal.signal(signum, lambda *frame: self.write(path))
+        except ValueError:
+            pass
+
+
+class NullInstrumentation:
+    """Instrumentation that records nothing, at next to no cost."""
+
+    enabled = False
+    timers = {}
+    counters = {}
+
+    def start(self, name):
+        pass
+
+    def stop(self, name):
+        pass
+
+    def timer(self, name):
+        return contextlib.nullcontext()
+
+    def count(self, name, n=1):
+        pass
+
+    def instrument(self, module):
+        return module
+
+    def statistics(self):
+        return {"timers": {}, "counters": {}}
+
+    def write(self, path):
+        Instrumentation.write(self, path)
+
+    def write_on_signal(self, path, signum=None):
+        pass
+
+
+class InstrumentedModule:
+    """Wraps each function of a module in a timer named after the function."""
+
+    def __init__(self, module, instrumentation):
+        self._module = module
+        self._instrumentation = instrumentation
+
+    def __getattr__(self, name):
+        attribute = getattr(self._module, name)
+        if callable(attribute) and not isinstance(attribute, type):
+            attribute = _timed(attribute, name, self._instrumentation)
+        # only looked up once
+        setattr(self, name, attribute)
+        return attribute
+
+
+def _timed(function, name, instrumentation):
+    def timed(*args, **kwargs):
+        instrumentation.start(name)
+        try:
+            return function(*args, **kwargs)
+        finally:
+            instrumentation.stop(name)
+    return timed
+
+
+def print_phase_times(simulation):
+    """Print how long each phase and kernel of the last timestep took.
+
+    Attach as the last hook, so that the hooks called before it are
+    included.
+    """
+    instrumentation = simulation.instrumentation
+    step = instrumentation.timers.get("step")
+    if step is None:
+        return
+    for path, timing in instrumentation.timers.items():
+        if timing.last_started >= step.last_started:
+            depth = path.count("/")
+            print("  " * depth + path.rsplit("/", 1)[-1] + ": ", str(round(timing.last, 4)), "s")
@@ -0,0 +1,553 @@
+# CLimate Analysis using Digital Estimations (CLAuDE)
+
+import matplotlib.pyplot as plt
+import numpy as np
+
+import claude_low_level_library as low_level
+
+
+class Plotter:
+    """Live plots of a running Simulation.
+
+    Attach with simulation.add_hook(Plotter(simulation), Config.PLOT_FREQ);
+    matplotlib is only imported along with this module.
+    """
+
+    def __init__(self, sim):
+        config = sim.config
+
+        if config.PLOT:
+            if not config.DIAGNOSTIC:
+                # set up Config.PLOT
+                self.f, self.ax = plt.subplots(2, figsize=(9, 9))
+                self.f.canvas.set_window_title('CLAuDE')
+                self.ax[0].contourf(config.LON_PLOT, config.LAT_PLOT, sim.temperature_world, cmap="seismic")
+                self.ax[0].streamplot(
+                    config.LON_PLOT,
+                    config.LAT_PLOT,
+                    sim.u[:, :, 0],
+                    sim.v[:, :, 0],
+                    color="white",
+                    density=1
+                )
+                test = self.ax[1].contourf(
+                    config.HEIGHTS_PLOT,
+                    config.LAT_Z_PLOT,
+                    np.transpose(
+                        np.mean(
+                            low_level.theta_to_t(
+                                sim.potential_temperature, config.PRESSURE_LEVELS
+                            ), axis=1
+                        )
+                    )[:config.TOP, :],
+                    cmap="seismic",
+                    levels=15
+                )
+                self.ax[1].contour(
+                    config.HEIGHTS_PLOT,
+                    config.LAT_Z_PLOT,
+                    np.transpose(
+                        np.mean(
+                            sim.u,
+                            axis=1
+                        )
+                    )[:config.TOP, :],
+                    colors="white",
+                    levels=20,
+                    linewidths=1,
+                    alpha=0.8
+                )
+                self.ax[1].quiver(
+                    config.HEIGHTS_PLOT,
+                    config.LAT_Z_PLOT,
+                    np.transpose(
+                        np.mean(
+                            sim.v,
+                            axis=1
+                        )
+                    )[:config.TOP, :],
+                    np.transpose(
+                        np.mean(
+                            10 * sim.w,
+                            axis=1
+                        )
+                    )[:config.TOP, :],
+                    color="black"
+                )
+                plt.subplots_adjust(left=0.1, right=0.75)
+                self.ax[0].set_title("Surface temperature")
+                self.ax[0].set_xlim(config.LON.min(), config.LON.max())
+                self.ax[1].set_title("Atmosphere temperature")
+                self.ax[1].set_xlim(config.LAT.min(), config.LAT.max())
+                self.ax[1].set_ylim((
+                    config.PRESSURE_LEVELS.max() / 100,
+                    config.PRESSURE_LEVELS[:config.TOP].min() / 100
+                ))
+                self.ax[1].set_yscale("log")
+                self.ax[1].set_ylabel("Pressure (hPa)")
+                self.ax[1].set_xlabel("Latitude")
+                self.cbar_ax = self.f.add_axes([0.85, 0.15, 0.05, 0.7])
+                self.f.colorbar(test, cax=self.cbar_ax)
+                self.cbar_ax.set_title("Temperature (K)")
+            else:
+                # set up Config.PLOT
+                self.f, self.ax = plt.subplots(2, 2, figsize=(9, 9))
+                self.f.canvas.set_window_title("CLAuDE")
+                self.ax[0, 0].contourf(
+                    config.HEIGHTS_PLOT,
+                    config.LAT_Z_PLOT,
+                    np.transpose(np.mean(sim.u, axis=1))[:config.TOP, :],
+                    cmap="seismic"
+                )
+
+                self.ax[0, 0].set_title("u")
+                self.ax[0, 1].contourf(
+                    config.HEIGHTS_PLOT,
+                    config.LAT_Z_PLOT,
+                    np.transpose(np.mean(sim.v, axis=1))[:config.TOP, :],
+                    cmap="seismic"
+                )
+                self.ax[0, 1].set_title("v")
+                self.ax[1, 0].contourf(
+                    config.HEIGHTS_PLOT,
+                    config.LAT_Z_PLOT,
+                    np.transpose(
+                        np.mean(sim.w, axis=1)
+                    )[:config.TOP, :],
+                    cmap="seismic"
+                )
+                self.ax[1, 0].set_title("w")
+                self.ax[1, 1].contourf(
+                    config.HEIGHTS_PLOT,
+                    config.LAT_Z_PLOT,
+                    np.transpose(
+                        np.mean(sim.atmosp_addition, axis=1)
+                    )[:config.TOP, :],
+                    cmap="seismic"
+                )
+                self.ax[1, 1].set_title("atmosp_addition")
+
+                for axis in self.ax.ravel():
+                    axis.set_ylim((
+                        config.PRESSURE_LEVELS.max() / 100, config.PRESSURE_LEVELS[:config.TOP].min() / 100
+                    ))
+                    axis.set_yscale("log")
+
+            self.f.suptitle("Time {} days".format(round(sim.t / config.DAY, 2)))
+
+            if config.LEVEL_PLOTS:
+                level_divisions = int(np.floor(config.NLEVELS/config.NPLOTS))
+                self.level_plots_levels = range(config.NLEVELS)[::level_divisions][::-1]
+
+                self.g, self.bx = plt.subplots(config.NPLOTS, figsize=(9, 8), sharex=True)
+                self.g.canvas.set_window_title('CLAuDE pressure levels')
+                for k, z in zip(range(config.NPLOTS), self.level_plots_levels):
+                    z += 1
+                    self.bx[k].contourf(
+                        config.LON_PLOT,
+                        config.LAT_PLOT,
+                        sim.potential_temperature[:, :, z],
+                        cmap="seismic"
+                    )
+                    self.bx[k].set_title(str(config.PRESSURE_LEVELS[z] / 100) + " hPa")
+                    self.bx[k].set_ylabel("Latitude")
+
+                self.bx[-1].set_xlabel("Longitude")
+
+            plt.ion()
+            plt.show()
+            plt.pause(2)
+
+            if not config.DIAGNOSTIC:
+                self.ax[0].cla()
+                self.ax[1].cla()
+
+                if config.LEVEL_PLOTS:
+                    for k in range(config.NPLOTS):
+                        self.bx[k].cla()
+            else:
+                self.ax[0, 0].cla()
+                self.ax[0, 1].cla()
+                self.ax[1, 0].cla()
+                self.ax[1, 1].cla()
+
+        if config.ABOVE:
+            self.g, self.gx = plt.subplots(1, 3, figsize=(15, 5))
+            plt.ion()
+            plt.show()
+
+    def __call__(self, sim):
+        config = sim.config
+        (pole_low_index_N, pole_high_index_N,
+         pole_low_index_S, pole_high_index_S) = sim.indices
+        (grid_lat_coords_N, grid_lon_coords_N, grid_x_values_N,
+         grid_y_values_N, polar_x_coords_N, polar_y_coords_N,
+         grid_lat_coords_S, grid_lon_coords_S, grid_x_values_S,
+         grid_y_values_S, polar_x_coords_S, polar_y_coords_S) = sim.coords
+
+        quiver_padding = int(12 / config.RESOLUTION)
+
+        if config.PLOT:
+            # update Config.PLOT
+            if not config.DIAGNOSTIC:
+                # ax[0].contourf(Config.LON_PLOT, Config.LAT_PLOT, temperature_world,
+                # cmap='seismic',levels=15)
+
+                # field = np.copy(w)[:,:,sample_level]
+                field = np.copy(sim.atmosp_addition)[:, :, sim.sample_level]
+                self.ax[0].contourf(
+                    config.LON_PLOT,
+                    config.LAT_PLOT,
+                    field,
+                    cmap="seismic",
+                    levels=15
+                )
+                self.ax[0].contour(
+                    config.LON_PLOT,
+                    config.LAT_PLOT,
+                    sim.tracer[0, :, :, sim.sample_level],
+                    alpha=0.5,
+                    antialiased=True,
+                    levels=np.arange(0.01, 1.01, 0.01)
+                )
+
+                if sim.velocity:
+                    self.ax[0].quiver(
+                        config.LON_PLOT[::quiver_padding, ::quiver_padding],
+                        config.LAT_PLOT[::quiver_padding, ::quiver_padding],
+                        sim.u[::quiver_padding, ::quiver_padding, sim.sample_level],
+                        sim.v[::quiver_padding, ::quiver_padding, sim.sample_level],
+                        color="white"
+                    )
+
+                # ax[0].set_title('$\it{Ground} \quad \it{temperature}$')
+
+                self.ax[0].set_xlim((config.LON.min(), config.LON.max()))
+                self.ax[0].set_ylim((config.LAT.min(), config.LAT.max()))
+                self.ax[0].set_ylabel("Latitude")
+                self.ax[0].axhline(y=0, color="black", alpha=0.3)
+                self.ax[0].set_xlabel("Longitude")
+
+                test = self.ax[1].contourf(config.HEIGHTS_PLOT, config.LAT_Z_PLOT, np.transpose(
+                    np.mean(
+                        low_level.theta_to_t(
+                            sim.potential_temperature,
+                            config.PRESSURE_LEVELS
+                        ),
+                        axis=1
+                    ))[:config.TOP, :],
+                    cmap="seismic",
+                    levels=15
+                )
+
+                # test = ax[1].contourf(Config.HEIGHTS_PLOT, Config.LAT_Z_PLOT, np.transpose(np.
+                # mean(atmosp_addition,axis=1))[:Config.TOP,:], cmap='seismic',levels=15)
+                # test = ax[1].contourf(Config.HEIGHTS_PLOT, Config.LAT_Z_PLOT, np.transpose(np.
+                # mean(potential_temperature,axis=1)), cmap='seismic',levels=15)
+                self.ax[1].contour(
+                    config.HEIGHTS_PLOT,
+                    config.LAT_Z_PLOT,
+                    np.transpose(
+                        np.mean(sim.tracer[0], axis=1)
+                    )[:config.TOP, :],
+                    alpha=0.5,
+                    antialiased=True,
+                    levels=np.arange(0.001, 1.01, 0.01)
+                    )
+
+                if sim.velocity:
+                    self.ax[1].contour(
+                        config.HEIGHTS_PLOT,
+                        config.LAT_Z_PLOT,
+                        np.transpose(
+                            np.mean(sim.u, axis=1)
+                        )[:config.TOP, :],
+                        colors="white",
+                        levels=20,
+                        linewidths=1,
+                        alpha=0.8
+                    )
+                    self.ax[1].quiver(
+                        config.HEIGHTS_PLOT,
+                        config.LAT_Z_PLOT,
+                        np.transpose(
+                            np.mean(sim.v, axis=1)
+                        )[:config.TOP, :],
+                        np.transpose(np.mean(5 * sim.w, axis=1))[:config.TOP, :],
+                        color="black"
+                    )
+
+                self.ax[1].set_title(r"$\it{Atmospheric} \quad \it{temperature}$")
+                self.ax[1].set_xlim((-90, 90))
+                self.ax[1].set_ylim((
+                    config.PRESSURE_LEVELS.max() / 100,
+                    config.PRESSURE_LEVELS[:config.TOP].min() / 100)
+                )
+                self.ax[1].set_ylabel("Pressure (hPa)")
+                self.ax[1].set_xlabel("Latitude")
+                self.ax[1].set_yscale("log")
+                self.f.colorbar(test, cax=self.cbar_ax)
+                self.cbar_ax.set_title('Temperature (K)')
+            else:
+                self.ax[0, 0].contourf(
+                    config.HEIGHTS_PLOT,
+                    config.LAT_Z_PLOT,
+                    np.transpose(
+                        np.mean(sim.u, axis=1)
+                    )[:config.TOP, :],
+                    cmap="seismic"
+                )
+                self.ax[0, 0].set_title("u")
+                self.ax[0, 1].contourf(
+                    config.HEIGHTS_PLOT,
+                    config.LAT_Z_PLOT,
+                    np.transpose(
+                        np.mean(sim.v, axis=1)
+                    )[:config.TOP, :],
+                    cmap="seismic"
+                )
+                self.ax[0, 1].set_title("v")
+                self.ax[1, 0].contourf(
+                    config.HEIGHTS_PLOT,
+                    config.LAT_Z_PLOT,
+                    np.transpose(
+                        np.mean(sim.w, axis=1)
+                    )[:config.TOP, :],
+                    cmap="seismic"
+                )
+                self.ax[1, 0].set_title("w")
+                self.ax[1, 1].contourf(
+                    config.HEIGHTS_PLOT,
+                    config.LAT_Z_PLOT,
+                    np.transpose(
+                        np.mean(sim.atmosp_addition, axis=1)
+                    )[:config.TOP, :],
+                    cmap="seismic"
+                )
+                self.ax[1, 1].set_title("atmosp_addition")
+
+                for axis in self.ax.ravel():
+                    axis.set_ylim((
+                        config.PRESSURE_LEVELS.max() / 100,
+                        config.PRESSURE_LEVELS[:config.TOP].min() / 100
+                    ))
+                    axis.set_yscale("log")
+
+            self.f.suptitle("Time {} days".format(round(sim.t / config.DAY, 2)))
+
+            if config.LEVEL_PLOTS:
+                for k, z in zip(range(config.NPLOTS), self.level_plots_levels):
+                    z += 1
+                    self.bx[k].contourf(
+                        config.LON_PLOT,
+                        config.LAT_PLOT,
+                        sim.potential_temperature[:, :, z],
+                        cmap="seismic",
+                        levels=15
+                    )
+                    self.bx[k].quiver(
+                        config.LON_PLOT[::quiver_padding, ::quiver_padding],
+                        config.LAT_PLOT[::quiver_padding, ::quiver_padding],
+                        sim.u[::quiver_padding, ::quiver_padding, z],
+                        sim.v[::quiver_padding, ::quiver_padding, z],
+                        color="white"
+                    )
+                    self.bx[k].set_title(str(round(config.PRESSURE_LEVELS[z] / 100)) + " hPa")
+                    self.bx[k].set_ylabel("Latitude")
+                    self.bx[k].set_xlim((config.LON.min(), config.LON.max()))
+                    self.bx[k].set_ylim((config.LAT.min(), config.LAT.max()))
+
+                self.bx[-1].set_xlabel("Longitude")
+
+        if config.ABOVE and sim.velocity:
+            self.gx[0].set_title("Original data")
+            self.gx[1].set_title("Polar plane")
+            self.gx[2].set_title("Reprojected data")
+
+            self.g.suptitle("Time {} days".format(round(sim.t / config.DAY, 2)))
+
+            self.gx[0].set_title("temperature")
+
+            if config.POLE.lower() == 's':
+                self.gx[0].contourf(
+                    config.LON,
+                    config.LAT[:pole_low_index_S],
+                    sim.potential_temperature[:pole_low_index_S, :, config.ABOVE_LEVEL]
+                )
+
+                self.gx[1].set_title("polar_plane_advect")
+                polar_temps = low_level.beam_me_up(
+                    config.LAT[:pole_low_index_S],
+                    config.LON,
+                    sim.potential_temperature[:pole_low_index_S, :, :],
+                    sim.grids[1],
+                    grid_lat_coords_S,
+                    grid_lon_coords_S
+                )
+                output = low_level.beam_me_up(
+                    config.LAT[:pole_low_index_S],
+                    config.LON,
+                    sim.south_reprojected_addition,
+                    sim.grids[1],
+                    grid_lat_coords_S,
+                    grid_lon_coords_S
+                )
+
+                self.gx[1].contourf(
+                    grid_x_values_S / 1E3,
+                    grid_y_values_S / 1E3,
+                    output[:, :, config.ABOVE_LEVEL]
+                )
+                self.gx[1].contour(
+                    grid_x_values_S / 1E3,
+                    grid_y_values_S / 1E3,
+                    polar_temps[:, :, config.ABOVE_LEVEL],
+                    colors="white",
+                    levels=20,
+                    linewidths=1,
+                    alpha=0.8
+                )
+                self.gx[1].quiver(
+                    grid_x_values_S / 1E3, grid_y_values_S / 1E3,
+                    sim.x_dot_S[:, :, config.ABOVE_LEVEL],
+                    sim.y_dot_S[:, :, config.ABOVE_LEVEL]
+                )
+
+                self.gx[1].add_patch(
+                    plt.Circle(
+                        (0, 0),
+                        config.PLANET_RADIUS * np.cos(
+                            config.LAT[pole_low_index_S] * np.pi / 180.0
+                        ) / 1E3,
+                        color="r",
+                        fill=False
+                    )
+                )
+                self.gx[1].add_patch(
+                    plt.Circle(
+                        (0, 0),
+                        config.PLANET_RADIUS * np.cos(
+                            config.LAT[pole_high_index_S] * np.pi / 180.0
+                        ) / 1E3,
+                        color="r",
+                        fill=False
+                    )
+                )
+
+                self.gx[2].set_title("south_addition_smoothed")
+                self.gx[2].contourf(
+                    config.LON,
+                    config.LAT[:pole_low_index_S],
+                    sim.south_addition_smoothed[:pole_low_index_S, :, config.ABOVE_LEVEL]
+                )
+                # gx[2].contourf(Config.LON,Config.LAT[:pole_low_index_S],u[:pole_low_index_S,:,Config.ABOVE_LEVEL])
+                self.gx[2].quiver(
+                    config.LON[::5],
+                    config.LAT[:pole_low_index_S],
+                    sim.u[:pole_low_index_S, ::5, config.ABOVE_LEVEL],
+                    sim.v[:pole_low_index_S, ::5, config.ABOVE_LEVEL]
+                )
+            else:
+                self.gx[0].contourf(
+                    config.LON,
+                    config.LAT[pole_low_index_N:],
+                    sim.potential_temperature[pole_low_index_N:, :, config.ABOVE_LEVEL]
+                )
+
+                self.gx[1].set_title("polar_plane_advect")
+                polar_temps = low_level.beam_me_up(
+                    config.LAT[pole_low_index_N:],
+                    config.LON,
+                    np.flip(
+                        sim.potential_temperature[pole_low_index_N:, :, :],
+                        axis=1
+                    ),
+                    sim.grids[0],
+                    grid_lat_coords_N,
+                    grid_lon_coords_N
+                )
+                output = low_level.beam_me_up(
+                    config.LAT[pole_low_index_N:],
+                    config.LON,
+                    sim.north_reprojected_addition,
+                    sim.grids[0],
+                    grid_lat_coords_N,
+                    grid_lon_coords_N
+                )
+                self.gx[1].contourf(
+                    grid_x_values_N / 1E3,
+                    grid_y_values_N / 1E3,
+                    output[:, :, config.ABOVE_LEVEL]
+                )
+                self.gx[1].contour(
+                    grid_x_values_N / 1E3,
+                    grid_y_values_N / 1E3,
+                    polar_temps[:, :, config.ABOVE_LEVEL],
+                    colors="white",
+                    levels=20,
+                    linewidths=1,
+                    alpha=0.8
+                )
+                self.gx[1].quiver(
+                    grid_x_values_N / 1E3,
+                    grid_y_values_N / 1E3,
+                    sim.x_dot_N[:, :, config.ABOVE_LEVEL],
+                    sim.y_dot_N[:, :, config.ABOVE_LEVEL]
+                )
+
+                self.gx[1].add_patch(
+                    plt.Circle(
+                        (0, 0),
+                        config.PLANET_RADIUS * np.cos(
+                            config.LAT[pole_low_index_N] * np.pi / 180.0
+                        ) / 1E3,
+                        color="r",
+                        fill=False
+                    )
+                )
+                self.gx[1].add_patch(
+                    plt.Circle(
+                        (0, 0),
+                        config.PLANET_RADIUS * np.cos(
+                            config.LAT[pole_high_index_N] * np.pi / 180.0
+                        ) / 1E3,
+                        color="r",
+                        fill=False
+                    )
+                )
+
+                self.gx[2].set_title("south_addition_smoothed")
+                self.gx[2].contourf(
+                    config.LON,
+                    config.LAT[pole_low_index_N:],
+                    sim.u[pole_low_index_N:, :, config.ABOVE_LEVEL]
+                )
+                self.gx[2].quiver(
+                    config.LON[::5], config.LAT[pole_low_index_N:],
+                    sim.u[pole_low_index_N:, ::5, config.ABOVE_LEVEL],
+                    sim.v[pole_low_index_N:, ::5, config.ABOVE_LEVEL]
+                )
+
+        # clear plots
+        if config.PLOT or config.ABOVE:
+            plt.pause(0.001)
+
+        if config.PLOT:
+            if not config.DIAGNOSTIC:
+                self.ax[0].cla()
+                self.ax[1].cla()
+                self.cbar_ax.cla()
+            else:
+                self.ax[0, 0].cla()
+                self.ax[0, 1].cla()
+                self.ax[1, 0].cla()
+                self.ax[1, 1].cla()
+
+            if config.LEVEL_PLOTS:
+                for k in range(config.NPLOTS):
+                    self.bx[k].cla()
+
+        if config.ABOVE:
+            self.gx[0].cla()
+            self.gx[1].cla()
+            self.gx[2].cla()
@@ -0,0 +1,142 @@
+# CLimate Analysis using Digital Estimations (CLAuDE)
+
+import multiprocessing
+import types
+import warnings
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# fields read by plotting.Plotter, depending on which plots are switched on
+PLOT_FIELDS = ("temperature_world", "potential_temperature", "u", "v", "w", "atmosp_addition", "tracer")
+ABOVE_FIELDS = (
+    "x_dot_N", "y_dot_N", "x_dot_S", "y_dot_S", "north_reprojected_addition",
+    "south_reprojected_addition", "south_addition_smoothed"
+)
+
+
+class PlottingProcess:
+    """Draws the plots of a Simulation in a separate process.
+
+    Used as a Simulation hook in place of plotting.Plotter. Each call copies
+    the fields to plot into shared memory and returns straight away; if the
+    renderer is still busy with the previous frame the new one is dropped,
+    so the model never waits on matplotlib. If the renderer exits (say its
+    window is closed) a warning is given and the model carries on without
+    plots.
+    """
+
+    def __init__(self):
+        self.dropped_frames = 0
+        self._process = None
+        self._exited = False
+
+    def __call__(self, simulation):
+        if self._process is None:
+            self._start(simulation)
+        elif not self._process.is_alive():
+            # nothing would ever clear frame_ready again
+            if not self._exited:
+                self._exited = True
+                warnings.warn(
+                    "the plotting process exited with code {}, so no more frames will be drawn".format(
+                        self._process.exitcode
+                    ),
+                    RuntimeWarning
+                )
+            self.dropped_frames += 1
+            return
+        elif self._frame_ready.is_set():
+            self.dropped_frames += 1
+            return
+
+        for name, array in self._arrays.items():
+            np.copyto(array, getattr(simulation, name))
+        self._scalars[0] = simulation.t
+        self._scalars[1] = simulation.velocity
+        self._frame_ready.set()
+
+    def close(self):
+        """Stop the renderer and free the shared memory."""
+        if self._process is None:
+            return
+        self._stop.set()
+        self._process.join()
+        self._arrays = {}
+        for block in self._blocks:
+            block.close()
+            block.unlink()
+        self._process = None
+
+    def _start(self, simulation):
+        config = simulation.config
+        names = PLOT_FIELDS + (ABOVE_FIELDS if config.ABOVE else ())
+
+        self._blocks = []
+        self._arrays = {}
+        layout = {}
+        for name in names:
+            field = np.asarray(getattr(simulation, name))
+            block = shared_memory.SharedMemory(create=True, size=field.nbytes)
+            self._blocks.append(block)
+            self._arrays[name] = np.ndarray(field.shape, dtype=field.dtype, buffer=block.buf)
+            layout[name] = (block.name, field.shape, field.dtype.str)
+
+        # the geometry never changes, so it is sent once when the process starts
+        static = {
+            "config": {name: getattr(config, name) for name in dir(config) if name.isupper()},
+            "sample_level": simulation.sample_level,
+            "indices": simulation.indices,
+            "grids": simulation.grids,
+            "coords": simulation.coords,
+        }
+
+        context = multiprocessing.get_context("spawn")
+        self._scalars = context.RawArray("d", 2)
+        self._frame_ready = context.Event()
+        self._stop = context.Event()
+        self._process = context.Process(
+            target=_render_frames,
+            args=(static, layout, self._scalars, self._frame_ready, self._stop),
+            daemon=True
+        )
+        self._process.start()
+
+
+def _render_frames(static, layout, scalars, frame_ready, stop):
+    # matplotlib is only ever imported in the plotting process
+    import matplotlib.pyplot as plt
+    from plotting import Plotter
+
+    blocks = []
+    arrays = {}
+    for name, (block_name, shape, dtype) in layout.items():
+        # the model process owns these blocks and unlinks them when it is done
+        block = shared_memory.SharedMemory(name=block_name)
+        blocks.append(block)
+        arrays[name] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+
+    frame = types.SimpleNamespace(**static)
+    frame.config = types.SimpleNamespace(**static["config"])
+    plotter = None
+
+    while not stop.is_set():
+        if not frame_ready.wait(0.05):
+            if plotter is not None:
+                # keep the windows responsive while waiting for the model
+                plt.pause(0.05)
+            continue
+
+        for name in arrays:
+            setattr(frame, name, arrays[name].copy())
+        frame.t = scalars[0]
+        frame.velocity = bool(scalars[1])
+        frame_ready.clear()
+
+        if plotter is None:
+            plotter = Plotter(frame)
+        plotter(frame)
+
+    del arrays
+    for block in blocks:
+        block.close()
@@ -0,0 +1,99 @@
+# CLimate Analysis using Digital Estimations (CLAuDE)
+
+import numpy as np
+
+from geometry import jsonable, plane_axis
+
+# settings of Simulation.metadata that fix the grid a checkpoint was made on
+GRID_SETTINGS = ("RESOLUTION", "PRESSURE_LEVELS", "PLANET_RADIUS", "POLE_LOWER_LAT_LIMIT")
+# fields on the polar planes, (..., y, x, level); the rest are on the lat-lon
+# grid, with levels unless they are in SURFACE_FIELDS
+PLANE_FIELDS = ("x_dot_N", "y_dot_N", "x_dot_S", "y_dot_S")
+SURFACE_FIELDS = ("temperature_world", "albedo")
+
+
+def grid_changed(metadata, config):
+    """Whether a checkpoint with metadata was made on another grid than config's.
+
+    Save files from older versions say nothing about their grid, and are
+    taken to be on the same one.
+    """
+    return any(
+        name in metadata and jsonable(metadata[name]) != jsonable(getattr(config, name))
+        for name in GRID_SETTINGS
+    )
+
+
+def regrid_state(state, metadata, config):
+    """state, saved on the grid described by metadata, interpolated onto the grid of config.
+
+    Fields are interpolated linearly along each axis in turn: in latitude,
+    in longitude (which wraps around), in the logarithm of pressure, and
+    in x and y on the polar planes. Points beyond the old grid take the
+    value at its edge, so e.g. a new top level starts off like the old top
+    level. Any leading member axes are kept. This is meant for spinning a
+    run up cheaply on a coarse grid and carrying on at a finer one.
+    """
+    source = _grid(
+        metadata["RESOLUTION"], metadata["PRESSURE_LEVELS"], metadata["PLANET_RADIUS"],
+        metadata["POLE_LOWER_LAT_LIMIT"]
+    )
+    target = _grid(config.RESOLUTION, config.PRESSURE_LEVELS, config.PLANET_RADIUS, config.POLE_LOWER_LAT_LIMIT)
+
+    lat = interpolation_matrix(source["lat"], target["lat"])
+    lon = interpolation_matrix(source["lon"], target["lon"], period=360)
+    levels = interpolation_matrix(-np.log(source["levels"]), -np.log(target["levels"]))
+    plane = interpolation_matrix(source["plane"], target["plane"])
+
+    regridded = {}
+    for name, value in state.items():
+        if not isinstance(value, np.ndarray):
+            regridded[name] = value
+        elif name in PLANE_FIELDS:
+            regridded[name] = _apply(levels, _apply(plane, _apply(plane, value, -3), -2), -1)
+        elif name in SURFACE_FIELDS:
+            regridded[name] = _apply(lon, _apply(lat, value, -2), -1)
+        else:
+            regridded[name] = _apply(levels, _apply(lon, _apply(lat, value, -3), -2), -1)
+    return regridded
+
+
+def interpolation_matrix(source, target, period=None):
+    """(target, source) matrix of the weights of linear interpolation from the points source to target.
+
+    source has to be increasing. Beyond its ends the nearest value is used,
+    unless period is given, in which case the points wrap around.
+    """
+    source = np.asarray(source, dtype=np.float64)
+    target = np.asarray(target, dtype=np.float64)
+    n = len(source)
+    if period is not None:
+        target = source[0] + np.mod(target - source[0], period)
+        source = np.append(source, source[0] + period)
+
+    below = np.clip(np.searchsorted(source, target, side="right") - 1, 0, max(len(source) - 2, 0))
+    above = np.minimum(below + 1, len(source) - 1)
+    spacing = source[above] - source[below]
+    fraction = np.divide(target - source[below], spacing, out=np.zeros_like(target), where=spacing != 0)
+    fraction = np.clip(fraction, 0, 1)
+
+    matrix = np.zeros((len(target), n))
+    rows = np.arange(len(target))
+    np.add.at(matrix, (rows, below % n), 1 - fraction)
+    np.add.at(matrix, (rows, above % n), fraction)
+    return matrix
+
+
+def _grid(resolution, pressure_levels, planet_radius, pole_lower_lat_limit):
+    lat = np.arange(-90, 91, resolution)
+    return {
+        "lat": lat,
+        "lon": np.arange(0, 360, resolution),
+        "levels": np.asarray(pressure_levels, dtype=np.float64),
+        "plane": plane_axis(lat, planet_radius, pole_lower_lat_limit),
+    }
+
+
+def _apply(matrix, a, axis):
+    # interpolate a along axis, counted from the end
+    return np.moveaxis(np.tensordot(matrix, a, axes=(1, a.ndim + axis)), 0, a.ndim + axis)
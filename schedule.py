@@ -0,0 +1,90 @@
+# CLimate Analysis using Digital Estimations (CLAuDE)
+
+import time
+
+from instrumentation import NullInstrumentation
+
+# phases of Simulation.advance, in the order they run; "plane_velocities" is
+# the refresh of the winds of the polar planes from the lat-lon grid
+PHASES = ("radiation", "geopotential", "velocity", "projection", "plane_velocities", "advection")
+# the phases Simulation.advance can run less often than every timestep: the
+# radiation heating is held in between its runs, and the polar planes keep
+# their own winds in between refreshes; the others always run
+SUBCYCLED_PHASES = ("radiation", "plane_velocities")
+
+
+class Schedule:
+    """When each phase of a timestep runs, and what each has cost.
+
+    freq maps phases (any of SUBCYCLED_PHASES) to the number of timesteps
+    between their runs; the others run at every timestep. Whether a phase runs in full at the
+    current timestep is up to due(). start and stop bracket each phase,
+    timing it in instrumentation as well, even at a timestep where it only
+    carries on from its last run. The timing kept here is always on, as it
+    only costs two clock reads a phase, so statistics() can show what each
+    phase costs per timestep under any schedule.
+    """
+
+    def __init__(self, freq=None, instrumentation=None):
+        freq = dict(freq or {})
+        unknown = set(freq) - set(PHASES)
+        if unknown:
+            raise ValueError("unknown phases: " + ", ".join(sorted(unknown)))
+        fixed = set(freq) - set(SUBCYCLED_PHASES)
+        if fixed:
+            raise ValueError("only {} can be subcycled, not {}".format(
+                ", ".join(SUBCYCLED_PHASES), ", ".join(sorted(fixed))
+            ))
+        self.freq = {phase: int(freq.get(phase, 1)) for phase in PHASES}
+        self.instrumentation = instrumentation or NullInstrumentation()
+        self.steps = 0
+        self.runs = dict.fromkeys(PHASES, 0)
+        self.calls = dict.fromkeys(PHASES, 0)
+        self.totals = dict.fromkeys(PHASES, 0.0)
+        self._started = {}
+
+    @property
+    def subcycled(self):
+        """Whether any phase runs less often than every timestep."""
+        return any(freq > 1 for freq in self.freq.values())
+
+    def due(self, phase):
+        """Whether phase runs in full at this timestep."""
+        return self.steps % self.freq[phase] == 0
+
+    def start(self, phase):
+        self.instrumentation.start(phase)
+        self._started[phase] = time.perf_counter()
+
+    def stop(self, phase):
+        self.totals[phase] += time.perf_counter() - self._started.pop(phase)
+        self.calls[phase] += 1
+        self.runs[phase] += self.due(phase)
+        self.instrumentation.stop(phase)
+
+    def next_step(self):
+        """Move on to the next timestep."""
+        self.steps += 1
+
+    def statistics(self):
+        """Cadence, full runs, and total and per timestep cost of each phase that has run."""
+        total = sum(self.totals.values())
+        return {
+            phase: {
+                "freq": self.freq[phase],
+                "runs": self.runs[phase],
+                "total": self.totals[phase],
+                "per_step": self.totals[phase] / self.calls[phase],
+                "share": self.totals[phase] / total if total else 0.0,
+            }
+            for phase in PHASES if self.calls[phase]
+        }
+
+    def report(self):
+        """statistics() as a table, one phase a line."""
+        lines = []
+        for phase, statistics in self.statistics().items():
+            lines.append("{:<18} every {:<4} runs {:<8} {:.3e} s/step {:>6.1%}".format(
+                phase, statistics["freq"], statistics["runs"], statistics["per_step"], statistics["share"]
+            ))
+        return "\n".join(lines)
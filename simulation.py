@@ -0,0 +1,984 @@
+# CLimate Analysis using Digital Estimations (CLAuDE)
+
+import concurrent.futures
+import os
+import time
+
+import numpy as np
+
+import claude_low_level_library as low_level
+import claude_top_level_library as top_level
+
+from checkpoint import read_checkpoint
+from config import Config
+from geometry import plane_axis, read_cached_geometry, write_cached_geometry
+from instrumentation import Instrumentation, NullInstrumentation
+from regrid import grid_changed, regrid_state
+from schedule import Schedule
+from solar import SolarForcing
+
+# everything initial_setup and setup_grids derive from the configuration alone,
+# which can be built once and handed to other runs on the same grid
+GEOMETRY = (
+    "dy", "dx", "coriolis", "radiation_coefficients", "polar_grid_resolution", "grid_side_length",
+    "indices", "grids", "coriolis_plane_N", "coriolis_plane_S", "coords", "operators"
+)
+
+
+class Simulation:
+    """Model state plus the machinery to step it forward in time.
+
+    Nothing is plotted, saved or printed by the model itself: attach those
+    with add_hook, e.g. print_status below, checkpoint.CheckpointWriter or
+    plotting.Plotter.
+
+    With members set, an ensemble of that many planets is run together: every
+    field gets a leading member axis, and INSOLATION and AXIAL_TILT in config
+    may be sequences with one value per member. albedo and
+    heat_capacity_earth carry the member axis too, so they can be varied per
+    member after construction. The grid and polar plane setup is shared.
+
+    geometry, as returned by the geometry property of another Simulation on
+    the same grid, skips building the grid and polar planes again. Likewise
+    state, a dict holding every field of the model state (e.g. views of
+    shared memory, as the bands of decomposition.DecomposedSimulation use),
+    is taken as it is instead of a new state being started or loaded.
+
+    With config.INSTRUMENT set, instrumentation times each phase of a
+    timestep, every kernel called from it and every hook; see
+    instrumentation.Instrumentation.
+
+    Call close(), or use the simulation as a context manager, to stop the
+    thread the south polar plane is stepped on.
+    """
+
+    def __init__(self, config=Config, members=None, geometry=None, state=None):
+        self.config = config
+        self.members = members
+        self.member_shape = () if members is None else (members,)
+        self.hooks = []
+
+        # precision of the state, and of the sums that are sensitive to rounding
+        self.dtype = np.dtype(config.PRECISION)
+        self.accumulator = np.dtype(np.float64 if config.ACCUMULATE_DOUBLE else config.PRECISION)
+
+        # INITIATE TIME
+        self.t = 0.0
+        self.dt = config.DT_SPINUP
+        self.velocity = False
+        self.step_time = 0.0
+        # CFL number of the last timestep, when the timestep is adaptive
+        self.cfl = None
+
+        # scratch arrays for the kernels, reused from step to step
+        self.workspace = low_level.Workspace()
+        # and those of the polar planes, one for each pole so that they can be stepped at once
+        self.polar_workspaces = (low_level.Workspace(), low_level.Workspace())
+        self.smoothing_workers = config.SMOOTHING_WORKERS or int(os.environ.get("OMP_NUM_THREADS", -1))
+        # the south polar plane is stepped on this thread while the north is stepped on the calling one
+        concurrent_poles = config.CONCURRENT_POLES
+        if concurrent_poles is None:
+            concurrent_poles = int(os.environ.get("OMP_NUM_THREADS", os.cpu_count() or 1)) > 1
+        # tracemalloc's peak is process-wide, so the poles would count each other's memory
+        concurrent_poles = concurrent_poles and not config.INSTRUMENT_MEMORY
+        self.polar_executor = concurrent.futures.ThreadPoolExecutor(1) if concurrent_poles else None
+
+        # timers for each phase of a timestep and each kernel called from it
+        if config.INSTRUMENT or config.VERBOSE:
+            self.instrumentation = Instrumentation(config.INSTRUMENT_MEMORY)
+        else:
+            self.instrumentation = NullInstrumentation()
+        self.low_level = self.instrumentation.instrument(low_level)
+        # which phases run at each timestep, and their cost
+        self.schedule = Schedule(config.PHASE_FREQ, self.instrumentation)
+        self.top_level = self.instrumentation.instrument(top_level)
+        if config.INSTRUMENT_FILE:
+            self.instrumentation.write_on_signal(config.INSTRUMENT_FILE)
+
+        self.sample_level = 5
+
+        self.temperature_world = np.zeros(self.member_shape + (config.NLAT, config.NLON), self.dtype)
+
+        if not config.LOAD and state is None:
+            self.initialise_state()
+
+        # where to save the geometry once built, when it is not already cached
+        cache = None
+        if geometry is None and config.INITIAL_SETUP and config.SETUP_GRIDS and config.GEOMETRY_CACHE:
+            geometry = read_cached_geometry(config.GEOMETRY_CACHE, config)
+            if geometry is None:
+                cache = config.GEOMETRY_CACHE
+
+        if geometry is not None:
+            for name in GEOMETRY:
+                setattr(self, name, geometry[name])
+
+        if config.INITIAL_SETUP:
+            self.initial_setup(geometry is None)
+
+        if config.SETUP_GRIDS:
+            self.setup_grids(geometry is None)
+
+        if cache:
+            write_cached_geometry(cache, config, self.geometry)
+
+        # NOTE
+        # how potential_temperature is defined could result in it being out of bounds.
+
+        # a block of passive tracers, which are not advected within four rows of the poles
+        self.tracer_rows = (np.arange(config.NLAT) >= 4) & (np.arange(config.NLAT) < config.NLAT - 4)
+
+        if state is not None:
+            for name, field in state.items():
+                setattr(self, name, field)
+        else:
+            if config.LOAD:
+                # load in previous save file
+                self.load(config.SAVE_FILE)
+
+            self.tracer = np.zeros(
+                self.member_shape + (config.NTRACERS, config.NLAT, config.NLON, config.NLEVELS), self.dtype
+            )
+            self.geopotential = np.zeros_like(self.potential_temperature)
+            self.atmosp_addition = np.zeros_like(self.potential_temperature)
+
+    def initialise_state(self):
+        """Start the atmosphere at rest on the standard atmosphere profile."""
+        config = self.config
+
+        # initialise arrays for various physical fields
+        self.temperature_world += 290
+        self.potential_temperature = np.zeros(
+            self.member_shape + (config.NLAT, config.NLON, config.NLEVELS), self.dtype
+        )
+        self.u = np.zeros_like(self.potential_temperature)
+        self.v = np.zeros_like(self.potential_temperature)
+        self.w = np.zeros_like(self.potential_temperature)
+
+        # read temperature and density in from standard atmosphere
+        path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "standard_atmosphere.txt")
+        with open(path, "r") as f:
+            standard_temp = []
+            standard_pressure = []
+
+            standard_temp_append = standard_temp.append
+            standard_pressure_append = standard_pressure.append
+
+            # These var names hurt my soul.
+            for x in f:
+                h, t, r, p = x.split()
+                standard_temp_append(float(t))
+                standard_pressure_append(float(p))
+
+        # density_profile = np.interp(
+        # x=heights/1E3,xp=standard_height,fp=standard_density)
+        temp_profile = np.interp(
+            x=config.PRESSURE_LEVELS[::-1],
+            xp=standard_pressure[::-1],
+            fp=standard_temp[::-1]
+        )[::-1]
+        for k in range(config.NLEVELS):
+            self.potential_temperature[..., k] = temp_profile[k]
+
+        self.potential_temperature = low_level.t_to_theta(
+            self.potential_temperature,
+            config.PRESSURE_LEVELS,
+            self.potential_temperature
+        )
+
+    def initial_setup(self, build_geometry=True):
+        """Planet surface properties, grid spacing and Coriolis parameter."""
+        config = self.config
+
+        self.sigma = np.zeros_like(config.PRESSURE_LEVELS)
+        kappa = 287 / 1000
+        # pride
+        for index in range(len(self.sigma)):
+            self.sigma[index] = 1E3 * (
+                config.PRESSURE_LEVELS[index] / config.PRESSURE_LEVELS[0]
+            ) ** kappa
+
+        self.heat_capacity_earth = np.zeros_like(self.temperature_world) + 1E6
+
+        # heat_capacity_earth[15:36,30:60] = 1E7
+        # heat_capacity_earth[30:40,80:90] = 1E7
+
+        albedo_variance = 0.001
+        self.albedo = np.random.uniform(
+            -albedo_variance,
+            albedo_variance, (config.NLAT, config.NLON)
+        ) + 0.2
+        self.albedo = np.zeros(self.member_shape + (config.NLAT, config.NLON), self.dtype) + 0.2
+        self.solar = SolarForcing(
+            config.LAT, config.LON, config.DAY, config.YEAR, config.AXIAL_TILT,
+            self.members or 1, config.SOLAR_TABLE
+        )
+
+        if not build_geometry:
+            return
+
+        # define planet size and various geometric constants
+        circumference = 2 * np.pi * config.PLANET_RADIUS
+
+        # define how far apart the gridpoints are: note that we use central
+        # difference derivatives, and so these distances are actually twice the
+        # distance between gridboxes
+        self.dy = circumference / config.NLAT
+        self.dx = np.zeros(config.NLAT)
+        self.coriolis = np.zeros(config.NLAT)  # also define the coriolis parameter here
+        angular_speed = 2 * np.pi / config.DAY
+        for index in range(config.NLAT):
+            self.dx[index] = self.dy * np.cos(config.LAT[index] * np.pi / 180)
+            self.coriolis[index] = angular_speed * np.sin(config.LAT[index] * np.pi / 180)
+
+        # optical depth and the per-level radiation coefficients only depend on the grid
+        self.radiation_coefficients = top_level.radiation_coefficients(config.PRESSURE_LEVELS, config.LAT)
+
+    def setup_grids(self, build_geometry=True):
+        """Polar planes and the projections between them and the lat-lon grid."""
+        config = self.config
+        if build_geometry:
+            self.build_polar_grids()
+
+        self.x_dot_N = np.zeros(self.member_shape + (self.grids[0], self.grids[0], config.NLEVELS), self.dtype)
+        self.y_dot_N = np.zeros(self.member_shape + (self.grids[0], self.grids[0], config.NLEVELS), self.dtype)
+        self.x_dot_S = np.zeros(self.member_shape + (self.grids[1], self.grids[1], config.NLEVELS), self.dtype)
+        self.y_dot_S = np.zeros(self.member_shape + (self.grids[1], self.grids[1], config.NLEVELS), self.dtype)
+
+        # weights the polar plane solutions are blended into the lat-lon grid with
+        pole_low_index_N, pole_high_index_N, pole_low_index_S, pole_high_index_S = self.indices
+        self.blends = (
+            low_level.Blend(pole_low_index_N, pole_high_index_N, config.LAT),
+            low_level.Blend(pole_low_index_S, pole_high_index_S, config.LAT)
+        )
+        self.south_addition_smoothed = np.zeros(
+            self.member_shape + (pole_low_index_S, config.NLON, config.NLEVELS), self.dtype
+        )
+
+    def build_polar_grids(self):
+        """Geometry of the polar planes, which only depends on the configuration."""
+        config = self.config
+        grid_pad = 2
+
+        pole_low_index_S = np.where(config.LAT > config.POLE_LOWER_LAT_LIMIT)[0][0]
+        pole_high_index_S = np.where(config.LAT > config.POLE_HIGHER_LAT_LIMIT)[0][0]
+
+        # initialise grid
+        self.polar_grid_resolution = self.dx[pole_low_index_S]
+
+        def get_grid():
+            return plane_axis(config.LAT, config.PLANET_RADIUS, config.POLE_LOWER_LAT_LIMIT, grid_pad)
+
+        """
+        south POLE
+        """
+        grid_x_values_S = get_grid()
+        grid_y_values_S = get_grid()
+        grid_xx_S, grid_yy_S = np.meshgrid(grid_x_values_S, grid_y_values_S)
+
+        self.grid_side_length = len(grid_x_values_S)
+
+        grid_lat_coords_S = (
+            -np.arccos(
+                ((grid_xx_S ** 2 + grid_yy_S ** 2) ** 0.5) / config.PLANET_RADIUS
+            ) * 180.0 / np.pi
+        ).flatten()
+        grid_lon_coords_S = (
+            180.0 - np.arctan2(grid_yy_S, grid_xx_S) * 180.0 / np.pi
+        ).flatten()
+
+        polar_x_coords_S, polar_y_coords_S = polar_coords(config, np.arange(pole_low_index_S))
+
+        """
+        north POLE
+        """
+        pole_low_index_N = np.where(config.LAT < -config.POLE_LOWER_LAT_LIMIT)[0][-1]
+        pole_high_index_N = np.where(config.LAT < -config.POLE_HIGHER_LAT_LIMIT)[0][-1]
+
+        grid_x_values_N = get_grid()
+        grid_y_values_N = get_grid()
+        grid_xx_N, grid_yy_N = np.meshgrid(grid_x_values_N, grid_y_values_N)
+
+        grid_lat_coords_N = (
+            np.arccos((grid_xx_N ** 2 + grid_yy_N ** 2) ** 0.5 / config.PLANET_RADIUS)
+            * 180.0 / np.pi
+        ).flatten()
+        grid_lon_coords_N = (
+            180.0 - np.arctan2(grid_yy_N, grid_xx_N) * 180.0 / np.pi
+        ).flatten()
+
+        polar_x_coords_N, polar_y_coords_N = polar_coords(config, np.arange(pole_low_index_N, config.NLAT))
+
+        self.indices = (
+            pole_low_index_N,
+            pole_high_index_N,
+            pole_low_index_S,
+            pole_high_index_S
+        )
+        self.grids = (
+            grid_xx_N.shape[0],
+            grid_xx_S.shape[0]
+        )
+
+        # create Coriolis data on north and south planes
+        data = np.zeros((config.NLAT-pole_low_index_N + grid_pad, config.NLON))
+        for index in np.arange(pole_low_index_N - grid_pad, config.NLAT):
+            data[index - pole_low_index_N, :] = self.coriolis[index]
+
+        self.coriolis_plane_N = low_level.beam_me_up_2D(
+            config.LAT[(pole_low_index_N-grid_pad):],
+            config.LON,
+            data,
+            self.grids[0],
+            grid_lat_coords_N,
+            grid_lon_coords_N
+        )
+
+        data = np.zeros((pole_low_index_S + grid_pad, config.NLON))
+        for index in range(pole_low_index_S+grid_pad):
+            data[index, :] = self.coriolis[index]
+
+        self.coriolis_plane_S = low_level.beam_me_up_2D(
+            config.LAT[:(pole_low_index_S+grid_pad)],
+            config.LON,
+            data,
+            self.grids[1],
+            grid_lat_coords_S,
+            grid_lon_coords_S
+        )
+
+        self.coords = (grid_lat_coords_N, grid_lon_coords_N, grid_x_values_N,
+                       grid_y_values_N, polar_x_coords_N, polar_y_coords_N,
+                       grid_lat_coords_S, grid_lon_coords_S, grid_x_values_S,
+                       grid_y_values_S, polar_x_coords_S, polar_y_coords_S)
+
+        # the grid geometry is fixed from here on, so build the projections
+        # between the polar planes and the lat-lon grid once
+        self.operators = (
+            low_level.beam_me_up_operator(
+                config.LAT[pole_low_index_N:],
+                config.LON,
+                grid_lat_coords_N,
+                grid_lon_coords_N,
+                config.INTERPOLATION_ORDER
+            ),
+            low_level.beam_me_down_operator(
+                grid_x_values_N,
+                grid_y_values_N,
+                polar_x_coords_N,
+                polar_y_coords_N,
+                config.INTERPOLATION_ORDER
+            ),
+            low_level.beam_me_up_operator(
+                config.LAT[:pole_low_index_S],
+                config.LON,
+                grid_lat_coords_S,
+                grid_lon_coords_S,
+                config.INTERPOLATION_ORDER
+            ),
+            low_level.beam_me_down_operator(
+                grid_x_values_S,
+                grid_y_values_S,
+                polar_x_coords_S,
+                polar_y_coords_S,
+                config.INTERPOLATION_ORDER
+            )
+        )
+
+        # the grid is laid out in double precision, then stored in the
+        # precision of the state it is combined with
+        self.dx = self.dx.astype(self.dtype)
+        self.coriolis = self.coriolis.astype(self.dtype)
+        self.coriolis_plane_N = self.coriolis_plane_N.astype(self.dtype)
+        self.coriolis_plane_S = self.coriolis_plane_S.astype(self.dtype)
+        self.coords = tuple(
+            coords.astype(self.dtype) if isinstance(coords, np.ndarray) else coords for coords in self.coords
+        )
+        self.operators = tuple(operator.astype(self.dtype) for operator in self.operators)
+        self.polar_grid_resolution = float(self.polar_grid_resolution)
+
+    def load(self, path):
+        """Restart from a checkpoint (or an old pickled save file).
+
+        A checkpoint of a single run loaded into an ensemble starts every
+        member from that state, and one saved in another precision is
+        converted to this run's. One made on another grid (a different
+        RESOLUTION or PRESSURE_LEVELS, say) is interpolated onto this one
+        by regrid.regrid_state.
+        """
+        state, metadata = read_checkpoint(path)
+        if grid_changed(metadata, self.config):
+            state = regrid_state(state, metadata, self.config)
+        branch = self.members is not None and metadata.get("MEMBERS") is None
+        for name, value in state.items():
+            if isinstance(value, np.ndarray):
+                value = value.astype(self.dtype, copy=False)
+                if branch:
+                    value = np.repeat(value[None], self.members, axis=0)
+            setattr(self, name, value)
+
+    @property
+    def metadata(self):
+        """The configuration a checkpoint of this run was made with."""
+        config = self.config
+        return {
+            "RESOLUTION": config.RESOLUTION,
+            "PLANET_RADIUS": config.PLANET_RADIUS,
+            "PRESSURE_LEVELS": [float(p) for p in config.PRESSURE_LEVELS],
+            "POLE_LOWER_LAT_LIMIT": config.POLE_LOWER_LAT_LIMIT,
+            "POLE_HIGHER_LAT_LIMIT": config.POLE_HIGHER_LAT_LIMIT,
+            "MEMBERS": self.members,
+        }
+
+    @property
+    def geometry(self):
+        """The grid geometry, for sharing with other runs on the same grid."""
+        return {name: getattr(self, name) for name in GEOMETRY}
+
+    @property
+    def state(self):
+        """The prognostic fields, i.e. everything needed to restart the run."""
+        return {
+            "potential_temperature": self.potential_temperature,
+            "temperature_world": self.temperature_world,
+            "u": self.u,
+            "v": self.v,
+            "w": self.w,
+            "x_dot_N": self.x_dot_N,
+            "y_dot_N": self.y_dot_N,
+            "x_dot_S": self.x_dot_S,
+            "y_dot_S": self.y_dot_S,
+            "t": self.t,
+            "albedo": self.albedo,
+            "tracer": self.tracer,
+        }
+
+    def add_hook(self, hook, freq=1, interval=None):
+        """Call hook(simulation) after every freq timesteps.
+
+        With interval set, hook is instead called after the first timestep
+        that ends interval seconds of simulated time or more after the last
+        call, which keeps the cadence when timesteps vary in length.
+        """
+        self.hooks.append([hook, freq, interval, 0, self.t])
+
+    def courant_rate(self):
+        """Fastest rate (1/s) at which the winds cross a gridbox.
+
+        The latitude-longitude grid is only checked away from the poles, where
+        it is not replaced by the polar planes; those are checked on their own
+        grid. Multiplied by the timestep this gives the CFL number.
+        """
+        config = self.config
+        pole_low_index_N, pole_high_index_N, pole_low_index_S, pole_high_index_S = self.indices
+        rows = slice(pole_high_index_S, pole_high_index_N + 1)
+
+        # dx and dy span two gridboxes, for the central differences
+        u = np.abs(self.u[..., rows, :, :]).max(axis=(-2, -1)).reshape(-1, len(self.dx[rows])).max(axis=0)
+        rate = 2 * np.max(u / self.dx[rows]) + 2 * np.abs(self.v[..., rows, :, :]).max() / self.dy
+
+        spacing = np.abs(np.diff(config.PRESSURE_LEVELS))
+        spacing = np.concatenate((spacing[:1], spacing))
+        w = np.abs(self.w[..., rows, :, :]).reshape(-1, config.NLEVELS).max(axis=0)
+        rate += np.max(w / spacing)
+
+        planes = max(
+            np.abs(x_dot).max() + np.abs(y_dot).max()
+            for x_dot, y_dot in ((self.x_dot_N, self.y_dot_N), (self.x_dot_S, self.y_dot_S))
+        )
+        return float(max(rate, 2 * planes / self.polar_grid_resolution))
+
+    def adaptive_timestep(self):
+        """Timestep that brings the CFL number to config.CFL_TARGET.
+
+        It grows by at most config.DT_GROWTH a step, and is kept between
+        config.DT_MIN and config.DT_MAX.
+        """
+        config = self.config
+        rate = self.courant_rate()
+        dt = config.CFL_TARGET / rate if rate > 0 else config.DT_MAX
+        dt = max(min(dt, config.DT_MAX, self.dt * config.DT_GROWTH), config.DT_MIN)
+        self.cfl = rate * dt
+        return dt
+
+    def run(self, n_steps=None):
+        """Advance n_steps timesteps, or forever if n_steps is None.
+
+        If config.INSTRUMENT_FILE is set the timings are written to it at the
+        end, however the run ends.
+        """
+        step = 0
+        try:
+            while n_steps is None or step < n_steps:
+                self.step()
+                step += 1
+        finally:
+            if self.config.INSTRUMENT_FILE:
+                self.instrumentation.write(self.config.INSTRUMENT_FILE)
+
+    def step(self):
+        """Advance the model by a single timestep and call the hooks that are due.
+
+        The hooks are called before the clock moves on, so they see the time
+        at the start of the step, as the plots and saves of the original
+        script did.
+        """
+        config = self.config
+        initial_time = time.time()
+        instrumentation = self.instrumentation
+        instrumentation.start("step")
+
+        if self.t < config.SPINUP_LENGTH:
+            dt = config.DT_SPINUP
+            self.velocity = False
+        elif config.ADAPTIVE_DT:
+            dt = self.adaptive_timestep()
+            self.velocity = True
+        else:
+            dt = config.DT_MAIN
+            self.velocity = True
+        self.dt = dt
+
+        self.tracer[..., 40, 50, self.sample_level] = 1
+        self.tracer[..., 20, 50, self.sample_level] = 1
+
+        self.advance(dt)
+        self.schedule.next_step()
+
+        if np.isnan(self.u.max()):
+            raise FloatingPointError("u has become NaN at t = {} s".format(self.t))
+
+        self.step_time = time.time() - initial_time
+        instrumentation.stop("step")
+
+        # as in the original model, the hooks see the time at the start of the
+        # step, so saves and printed times are those of the old script
+        end = self.t + dt
+        for hook in self.hooks:
+            function, freq, interval, steps, last_called = hook
+            hook[3] = steps = steps + 1
+            if interval is None:
+                due = steps >= freq
+            else:
+                # allow for rounding in the sum of the timesteps
+                due = end - last_called >= interval * (1 - 1E-9)
+            if due:
+                with instrumentation.timer(getattr(function, "__name__", type(function).__name__)):
+                    function(self)
+                hook[3] = 0
+                hook[4] = end
+
+        # advance time by one timestep
+        self.t = end
+
+    def close(self):
+        """Stop the polar thread; any further steps do the poles one after the other."""
+        if self.polar_executor is not None:
+            self.polar_executor.shutdown()
+            self.polar_executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _both_poles(self, north, south):
+        # call north() and south(), side by side when there is a polar executor
+        if self.polar_executor is None:
+            north()
+            south()
+            return
+        future = self.polar_executor.submit(self._timed, "south_pole", south)
+        north()
+        future.result()
+
+    def _timed(self, name, function):
+        with self.instrumentation.timer(name):
+            function()
+
+    def advance(self, dt):
+        """Update the fields over a timestep of dt, leaving the clock alone."""
+        config = self.config
+        instrumentation = self.instrumentation
+        schedule = self.schedule
+        # the kernels, each timed when the run is instrumented
+        low_level = self.low_level
+        top_level = self.top_level
+
+        (pole_low_index_N, pole_high_index_N,
+         pole_low_index_S, pole_high_index_S) = self.indices
+        (grid_lat_coords_N, grid_lon_coords_N, grid_x_values_N,
+         grid_y_values_N, polar_x_coords_N, polar_y_coords_N,
+         grid_lat_coords_S, grid_lon_coords_S, grid_x_values_S,
+         grid_y_values_S, polar_x_coords_S, polar_y_coords_S) = self.coords
+        grids = self.grids
+        operators = self.operators
+        blend_N, blend_S = self.blends
+        dx = self.dx
+        dy = self.dy
+
+        schedule.start("radiation")
+        # when the radiation is subcycled, its heating rates are held in between runs
+        hold = schedule.freq["radiation"] > 1
+        if hold:
+            atmosphere_heating = self.workspace.get(
+                'atmosphere_heating', self.potential_temperature.shape, self.dtype
+            )
+            surface_heating = self.workspace.get('surface_heating', self.temperature_world.shape, self.dtype)
+        if schedule.due("radiation"):
+            if hold:
+                np.copyto(atmosphere_heating, self.potential_temperature)
+                np.copyto(surface_heating, self.temperature_world)
+            self.temperature_world, self.potential_temperature = top_level.radiation_calculation(
+                self.temperature_world,
+                self.potential_temperature,
+                config.PRESSURE_LEVELS,
+                self.heat_capacity_earth,
+                self.albedo,
+                config.INSOLATION,
+                config.LAT,
+                config.LON,
+                self.t,
+                dt,
+                config.DAY,
+                config.YEAR,
+                config.AXIAL_TILT,
+                self.radiation_coefficients,
+                self.workspace,
+                self.accumulator,
+                self.solar.pattern(self.t)
+            )
+            if hold:
+                np.subtract(self.potential_temperature, atmosphere_heating, out=atmosphere_heating)
+                atmosphere_heating /= dt
+                np.subtract(self.temperature_world, surface_heating, out=surface_heating)
+                surface_heating /= dt
+        else:
+            heating_step = self.workspace.get('heating_step', self.potential_temperature.shape, self.dtype)
+            self.potential_temperature += np.multiply(atmosphere_heating, dt, out=heating_step)
+            self.temperature_world += dt * surface_heating
+
+        if config.SMOOTHING:
+            self.potential_temperature, = top_level.spectral_filter(
+                (self.potential_temperature,), (config.SMOOTHING_PARAM_T,), workers=self.smoothing_workers
+            )
+
+        schedule.stop("radiation")
+
+        schedule.start("geopotential")
+        diffusion = top_level.laplacian_2d(self.temperature_world, dx, dy, self.workspace)
+        diffusion[..., 0, :] = np.mean(diffusion[..., 1, :], axis=-1, keepdims=True)
+        diffusion[..., -1, :] = np.mean(diffusion[..., -2, :], axis=-1, keepdims=True)
+        diffusion *= dt * 1E-5
+        self.temperature_world -= diffusion
+
+        # update geopotential field
+        low_level.cumulative_sum_z(self.potential_temperature, self.sigma, self.geopotential, self.accumulator)
+        np.negative(self.geopotential, out=self.geopotential)
+        schedule.stop("geopotential")
+
+        if self.velocity:
+            schedule.start("velocity")
+            u_add, v_add = top_level.velocity_calculation(
+                self.u,
+                self.v,
+                self.w,
+                config.PRESSURE_LEVELS,
+                self.geopotential,
+                self.potential_temperature,
+                self.coriolis,
+                config.GRAVITY,
+                dx,
+                dy,
+                dt,
+                out=(
+                    self.workspace.get('u_add', self.u.shape, self.dtype),
+                    self.workspace.get('v_add', self.v.shape, self.dtype)
+                )
+            )
+
+            schedule.stop("velocity")
+
+            schedule.start("projection")
+            grid_velocities = (self.x_dot_N, self.y_dot_N, self.x_dot_S, self.y_dot_S)
+
+            (u_add, v_add, self.north_reprojected_addition, self.south_reprojected_addition,
+             self.x_dot_N, self.y_dot_N, self.x_dot_S, self.y_dot_S) = top_level.polar_planes(
+                 self.u,
+                 self.v,
+                 u_add,
+                 v_add,
+                 self.potential_temperature,
+                 self.geopotential,
+                 grid_velocities,
+                 self.indices,
+                 grids,
+                 self.coords,
+                 self.coriolis_plane_N,
+                 self.coriolis_plane_S,
+                 self.grid_side_length,
+                 config.PRESSURE_LEVELS,
+                 config.LAT,
+                 config.LON,
+                 dt,
+                 self.polar_grid_resolution,
+                 config.GRAVITY,
+                 operators,
+                 blends=self.blends,
+                 executor=self.polar_executor,
+                 workspaces=self.polar_workspaces
+            )
+
+            self.u += u_add
+            self.v += v_add
+
+            if config.SMOOTHING:
+                self.u, self.v = top_level.spectral_filter(
+                    (self.u, self.v), (config.SMOOTHING_PARAM_U, config.SMOOTHING_PARAM_V),
+                    workers=self.smoothing_workers
+                )
+
+            schedule.stop("projection")
+
+            # between refreshes, the polar planes carry on with their own winds
+            schedule.start("plane_velocities")
+            if schedule.due("plane_velocities"):
+                self.x_dot_N, self.y_dot_N, self.x_dot_S, self.y_dot_S = top_level.update_plane_velocities(
+                    config.LAT,
+                    config.LON,
+                    pole_low_index_N,
+                    pole_low_index_S,
+                    np.flip(self.u[..., pole_low_index_N:, :, :], axis=-2),
+                    np.flip(self.v[..., pole_low_index_N:, :, :], axis=-2),
+                    grids,
+                    grid_lat_coords_N,
+                    grid_lon_coords_N,
+                    self.u[..., :pole_low_index_S, :, :],
+                    self.v[..., :pole_low_index_S, :, :],
+                    grid_lat_coords_S,
+                    grid_lon_coords_S,
+                    operators,
+                    executor=self.polar_executor,
+                    workspaces=self.polar_workspaces,
+                    out=(self.x_dot_N, self.y_dot_N, self.x_dot_S, self.y_dot_S)
+                )
+            schedule.stop("plane_velocities")
+
+            # allow for thermal advection in the atmosphere
+            schedule.start("advection")
+            instrumentation.start("w")
+            # using updated u,v fields calculated w
+            # https://www.sjsu.edu/faculty/watkins/omega.htm
+            self.w = top_level.w_calculation(
+                self.u,
+                self.v,
+                self.w,
+                config.PRESSURE_LEVELS,
+                self.geopotential,
+                self.potential_temperature,
+                self.coriolis,
+                config.GRAVITY,
+                dx,
+                dy,
+                dt,
+                out=self.w,
+                workspace=self.workspace,
+                accumulator=self.accumulator
+            )
+
+            if config.SMOOTHING:
+                self.w, = top_level.spectral_filter(
+                    (self.w,), (config.SMOOTHING_PARAM_W,), (0.25,), self.smoothing_workers
+                )
+
+            # the two polar planes, each only writing to its own rows of w
+            def w_north():
+                workspace = self.polar_workspaces[0]
+                theta_N = low_level.beam_me_up(
+                    config.LAT[pole_low_index_N:],
+                    config.LON,
+                    self.potential_temperature[..., pole_low_index_N:, :, :],
+                    grids[0],
+                    grid_lat_coords_N,
+                    grid_lon_coords_N,
+                    operators[0],
+                    workspace.get('plane_theta', self.x_dot_N.shape, self.dtype)
+                )
+                w_N = top_level.w_plane(
+                    self.x_dot_N,
+                    self.y_dot_N,
+                    theta_N,
+                    config.PRESSURE_LEVELS,
+                    self.polar_grid_resolution,
+                    config.GRAVITY,
+                    self.accumulator,
+                    workspace.get('plane_w', self.x_dot_N.shape, self.dtype),
+                    workspace
+                )
+                w_N = np.flip(
+                    low_level.beam_me_down(
+                        config.LON,
+                        w_N,
+                        pole_low_index_N,
+                        grid_x_values_N,
+                        grid_y_values_N,
+                        polar_x_coords_N,
+                        polar_y_coords_N,
+                        operators[1],
+                        workspace.get('reprojected_w', self.w[..., pole_low_index_N:, :, :].shape, self.dtype)
+                    ),
+                    axis=-2
+                )
+                blend_N(self.w[..., pole_low_index_N:, :, :], w_N, self.w[..., pole_low_index_N:, :, :])
+
+            def w_south():
+                workspace = self.polar_workspaces[1]
+                w_S = top_level.w_plane(
+                    self.x_dot_S,
+                    self.y_dot_S,
+                    low_level.beam_me_up(
+                        config.LAT[:pole_low_index_S],
+                        config.LON,
+                        self.potential_temperature[..., :pole_low_index_S, :, :],
+                        grids[1],
+                        grid_lat_coords_S,
+                        grid_lon_coords_S,
+                        operators[2],
+                        workspace.get('plane_theta', self.x_dot_S.shape, self.dtype)
+                    ),
+                    config.PRESSURE_LEVELS,
+                    self.polar_grid_resolution,
+                    config.GRAVITY,
+                    self.accumulator,
+                    workspace.get('plane_w', self.x_dot_S.shape, self.dtype),
+                    workspace
+                )
+                w_S = low_level.beam_me_down(
+                    config.LON,
+                    w_S,
+                    pole_low_index_S,
+                    grid_x_values_S,
+                    grid_y_values_S,
+                    polar_x_coords_S,
+                    polar_y_coords_S,
+                    operators[3],
+                    workspace.get('reprojected_w', self.w[..., :pole_low_index_S, :, :].shape, self.dtype)
+                )
+                blend_S(self.w[..., :pole_low_index_S, :, :], w_S, self.w[..., :pole_low_index_S, :, :])
+
+            self._both_poles(w_north, w_south)
+
+            self.w[..., 18:] *= 0
+
+            instrumentation.stop("w")
+
+            """
+            LINE BREAK
+            """
+
+            # theta and every tracer share the upwind coefficients of one pass
+            self.atmosp_addition, tracer_addition = top_level.advect_scalars(
+                self.potential_temperature,
+                self.tracer,
+                self.u,
+                self.v,
+                self.w,
+                dx,
+                dy,
+                config.PRESSURE_LEVELS,
+                self.tracer_rows,
+                self.atmosp_addition,
+                self.workspace.get('tracer_addition', self.tracer.shape, self.dtype)
+            )
+
+            # combine addition calculated on polar grid with
+            # that calculated on the cartestian grid, in the
+            # global temperature addition array
+            blend_N(
+                self.atmosp_addition[..., pole_low_index_N:, :, :],
+                self.north_reprojected_addition,
+                self.atmosp_addition[..., pole_low_index_N:, :, :]
+            )
+            blend_S(
+                self.atmosp_addition[..., :pole_low_index_S, :, :],
+                self.south_reprojected_addition,
+                self.south_addition_smoothed
+            )
+            self.atmosp_addition[..., :pole_low_index_S, :, :] = self.south_addition_smoothed
+
+            if config.SMOOTHING:
+                self.atmosp_addition, = top_level.spectral_filter(
+                    (self.atmosp_addition,), (config.SMOOTHING_PARAM_ADD,), workers=self.smoothing_workers
+                )
+
+            self.atmosp_addition[..., 17] *= 0.5
+            self.atmosp_addition[..., 18:] *= 0
+
+            self.potential_temperature -= np.multiply(
+                self.atmosp_addition, dt,
+                out=self.workspace.get('heating_step', self.potential_temperature.shape, self.dtype)
+            )
+
+            """
+            LINE BREAK
+            """
+
+            tracer_addition *= dt
+            self.tracer -= tracer_addition
+
+            diffusion = top_level.laplacian_3d(
+                self.potential_temperature,
+                dx,
+                dy,
+                config.PRESSURE_LEVELS,
+                self.workspace
+            )
+            diffusion[..., 0, :, :] = np.mean(diffusion[..., 1, :, :], axis=-2, keepdims=True)
+            diffusion[..., -1, :, :] = np.mean(diffusion[..., -2, :, :], axis=-2, keepdims=True)
+            diffusion *= dt * 1E-4
+            self.potential_temperature -= diffusion
+
+            """
+            LINE BREAK
+            """
+
+            schedule.stop("advection")
+
+
+def polar_coords(config, rows):
+    """x and y on a polar plane of the lat-lon gridpoints in rows, row after row."""
+    radius = config.PLANET_RADIUS * np.cos(config.LAT[rows] * np.pi / 180.0)
+    lon = config.LON * np.pi / 180.0
+    return np.outer(radius, np.sin(lon)).ravel(), np.outer(-radius, np.cos(lon)).ravel()
+
+
+def print_status(simulation):
+    """Print the current time and the range of each field to the command line."""
+    print("+++ t = " + str(round(simulation.t / simulation.config.DAY, 2)) + " days +++")
+    print(
+        "T:",
+        round(simulation.temperature_world.max() - 273.15, 1),
+        "-",
+        round(simulation.temperature_world.min() - 273.15, 1),
+        "C",
+        sep=" "
+    )
+    print(
+        "U:",
+        round(simulation.u.max(), 2),
+        "-",
+        round(simulation.u.min(), 2),
+        "V:",
+        round(simulation.v.max(), 2),
+        "-",
+        round(simulation.v.min(), 2),
+        "W:",
+        round(simulation.w.max(), 2),
+        "-",
+        round(simulation.w.min(), 4),
+        sep=" "
+    )
+    print('Time: ', str(float(round(simulation.step_time, 3))), 's')
+    if simulation.cfl is not None:
+        print('dt: ', str(round(simulation.dt, 1)), 's', ' CFL: ', str(round(simulation.cfl, 3)))
@@ -0,0 +1,69 @@
+# CLimate Analysis using Digital Estimations (CLAuDE)
+
+import numpy as np
+
+import claude_low_level_library as low_level
+
+
+class SolarForcing:
+    """Sunlight over the grid at a given time, normalised to an insolation of one.
+
+    radiation_calculation scales the one pattern by the insolation for the
+    surface and by the ozone heating of each level, so it is only worked
+    out once per timestep. axial_tilt may hold one value per member, and the
+    pattern has a leading axis of members either way.
+
+    With table set to (times_of_day, seasons), the longitude and latitude
+    factors of the pattern are worked out up front at that many evenly
+    spaced times of the day and of the year, and the nearest of each is used
+    at every timestep. That suits long runs on a fixed orbit: the sun then
+    moves in steps of day / times_of_day and year / seasons.
+    """
+
+    def __init__(self, lat, lon, day, year, axial_tilt, members=1, table=None):
+        self.lat = lat
+        self.lon = lon
+        self.day = day
+        self.year = year
+        self.axial_tilts = np.broadcast_to(np.asarray(axial_tilt, dtype=np.float64), (members,))
+        self.table = table
+
+        if table is not None:
+            times_of_day, seasons = table
+            self.longitude_factors = [
+                low_level.solar_longitude_factor(lon, t, day) for t in _times(day, times_of_day)
+            ]
+            # tilt: factors at each season
+            self.latitude_factors = {
+                tilt: [low_level.solar_latitude_factors(1, lat, t, year, tilt) for t in _times(year, seasons)]
+                for tilt in set(self.axial_tilts)
+            }
+
+    def pattern(self, t):
+        """(members, lat, lon) array of the normalised sunlight at time t."""
+        if self.table is None:
+            cos_lon = low_level.solar_longitude_factor(self.lon, t, self.day)
+        else:
+            times_of_day, seasons = self.table
+            cos_lon = self.longitude_factors[_nearest(t, self.day, times_of_day)]
+            season = _nearest(t, self.year, seasons)
+
+        pattern = np.empty((len(self.axial_tilts), len(self.lat), len(self.lon)))
+        for m, tilt in enumerate(self.axial_tilts):
+            if m > 0 and tilt == self.axial_tilts[m - 1]:
+                pattern[m] = pattern[m - 1]
+                continue
+            if self.table is None:
+                day_side, over_pole = low_level.solar_latitude_factors(1, self.lat, t, self.year, tilt)
+            else:
+                day_side, over_pole = self.latitude_factors[tilt][season]
+            pattern[m] = low_level.solar_pattern(day_side, over_pole, cos_lon)
+        return pattern
+
+
+def _times(period, n):
+    return [int(round(index * period / n)) for index in range(n)]
+
+
+def _nearest(t, period, n):
+    return int(round((t % period) / period * n)) % n
@@ -0,0 +1,204 @@
+# CLimate Analysis using Digital Estimations (CLAuDE)
+
+import contextlib
+import itertools
+import json
+import multiprocessing
+import os
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from config import Config
+from geometry import flatten_geometry, geometry_key, jsonable, unflatten_geometry
+from simulation import Simulation
+
+# OpenMP and BLAS thread pools, limited in the workers so they do not fight
+# each other for cores
+THREAD_VARIABLES = ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS")
+ALIGNMENT = 64
+
+# set in each worker by _initialise_worker
+_geometries = {}
+_blocks = []
+
+
+def parameter_grid(**values):
+    """Every combination of the given settings, as a list of override dicts.
+
+    parameter_grid(AXIAL_TILT=[0, 23.5], INSOLATION=[1300, 1370]) gives four
+    members.
+    """
+    names = list(values)
+    return [dict(zip(names, combination)) for combination in itertools.product(*values.values())]
+
+
+def sweep_config(config, overrides):
+    """A subclass of config with overrides applied and the grid rederived."""
+    settings = dict(overrides)
+    settings.setdefault("LOAD", False)
+    member = type("SweepConfig", (config,), settings)
+
+    if "RESOLUTION" in settings:
+        member.LAT = np.arange(-90, 91, member.RESOLUTION)
+        member.LON = np.arange(0, 360, member.RESOLUTION)
+        member.NLAT = len(member.LAT)
+        member.NLON = len(member.LON)
+        member.LON_PLOT, member.LAT_PLOT = np.meshgrid(member.LON, member.LAT)
+    if "PRESSURE_LEVELS" in settings:
+        member.PRESSURE_LEVELS = np.asarray(member.PRESSURE_LEVELS)
+        member.NLEVELS = len(member.PRESSURE_LEVELS)
+    if "RESOLUTION" in settings or "PRESSURE_LEVELS" in settings:
+        member.HEIGHTS_PLOT, member.LAT_Z_PLOT = np.meshgrid(member.LAT, member.PRESSURE_LEVELS[:member.TOP] / 100)
+    return member
+
+
+def diagnostics(simulation):
+    """Global mean surface temperature and jet strength of a run."""
+    weights = np.cos(simulation.config.LAT * np.pi / 180.0)
+    zonal_mean_temperature = simulation.temperature_world.mean(axis=-1)
+    zonal_mean_u = simulation.u.mean(axis=-2)
+    return {
+        "t": simulation.t,
+        "global_mean_temperature": float(np.average(zonal_mean_temperature, weights=weights)),
+        "jet_strength": float(np.abs(zonal_mean_u).max()),
+    }
+
+
+def share_geometry(geometry):
+    """Copy the arrays in geometry into a single block of shared memory.
+
+    Returns the block and a picklable description, from which
+    attach_geometry rebuilds the geometry in another process without copying
+    the arrays. The caller owns the block and must unlink it when done.
+    """
+    arrays, layout = flatten_geometry(geometry)
+
+    fields = []
+    offset = 0
+    for array in arrays:
+        fields.append((array.shape, array.dtype.str, offset))
+        offset = -(-(offset + array.nbytes) // ALIGNMENT) * ALIGNMENT
+
+    block = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+    for array, (shape, dtype, offset) in zip(arrays, fields):
+        np.ndarray(shape, dtype=dtype, buffer=block.buf, offset=offset)[...] = array
+    return block, (block.name, fields, layout)
+
+
+def attach_geometry(description, writeable=False):
+    """Rebuild geometry shared by share_geometry, returning (block, geometry).
+
+    The arrays are views of the shared block, read-only unless writeable,
+    and the block has to stay open for as long as they are in use.
+    """
+    block_name, fields, layout = description
+    block = shared_memory.SharedMemory(name=block_name)
+    arrays = []
+    for shape, dtype, offset in fields:
+        array = np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf, offset=offset)
+        array.flags.writeable = writeable
+        arrays.append(array)
+    return block, unflatten_geometry(arrays, layout)
+
+
+def run_sweep(overrides, steps, results_path, config=Config, processes=None, threads=1):
+    """Run one simulation per entry of overrides, spread over a process pool.
+
+    Each member starts from rest with config changed by its overrides and is
+    advanced steps timesteps, after which its diagnostics are appended to
+    results_path as a line of JSON. Members already in results_path are
+    skipped, so a sweep that was killed picks up where it left off. The grid
+    geometry is built once in this process and shared with the workers.
+
+    Returns the results of every member, in the order of overrides.
+    """
+    keys = [_member_key(member) for member in overrides]
+    results = {}
+    partial_line = False
+    if os.path.exists(results_path):
+        with open(results_path) as f:
+            for line in f:
+                # a sweep killed mid-write can leave a partial last line
+                partial_line = not line.endswith("\n")
+                try:
+                    result = json.loads(line)
+                except ValueError:
+                    continue
+                results[_member_key(result["overrides"])] = result
+
+    pending = [member for member, key in zip(overrides, keys) if key not in results]
+    if pending:
+        blocks = []
+        descriptions = {}
+        try:
+            for member in pending:
+                member_config = sweep_config(config, member)
+                key = geometry_key(member_config)
+                if key not in descriptions:
+                    with Simulation(member_config) as simulation:
+                        block, descriptions[key] = share_geometry(simulation.geometry)
+                    blocks.append(block)
+
+            processes = processes or max(1, (os.cpu_count() or 1) // threads)
+            tasks = [(config, member, steps) for member in pending]
+            with thread_limit(threads):
+                context = multiprocessing.get_context("spawn")
+                pool = context.Pool(processes, initializer=_initialise_worker, initargs=(descriptions,))
+            with pool, open(results_path, "a") as f:
+                if partial_line:
+                    # so the first new result does not run on from it
+                    f.write("\n")
+                for result in pool.imap_unordered(_run_member, tasks):
+                    f.write(json.dumps(result) + "\n")
+                    f.flush()
+                    os.fsync(f.fileno())
+                    results[_member_key(result["overrides"])] = result
+        finally:
+            for block in blocks:
+                block.close()
+                block.unlink()
+
+    return [results[key] for key in keys]
+
+
+@contextlib.contextmanager
+def thread_limit(threads):
+    """Limit the thread pools of processes started inside the with block."""
+    # the workers inherit the environment they are started with
+    saved = {name: os.environ.get(name) for name in THREAD_VARIABLES}
+    os.environ.update({name: str(threads) for name in THREAD_VARIABLES})
+    try:
+        yield
+    finally:
+        for name, value in saved.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+
+def _member_key(overrides):
+    return json.dumps(jsonable(overrides), sort_keys=True)
+
+
+def _initialise_worker(descriptions):
+    # the parent owns the blocks and unlinks them once the sweep is finished
+    for key, description in descriptions.items():
+        block, _geometries[key] = attach_geometry(description)
+        _blocks.append(block)
+
+
+def _run_member(task):
+    config, overrides, steps = task
+    member_config = sweep_config(config, overrides)
+    with Simulation(member_config, geometry=_geometries[geometry_key(member_config)]) as simulation:
+        error = None
+        try:
+            simulation.run(steps)
+        except FloatingPointError as exception:
+            error = str(exception)
+
+        result = {"overrides": jsonable(overrides), "steps": steps, "error": error}
+        result.update(diagnostics(simulation))
+    return result
@@ -0,0 +1,64 @@
+# CLimate Analysis using Digital Estimations (CLAuDE)
+
+import time
+
+import numpy as np
+import pytest
+
+from checkpoint import CheckpointWriter, read_checkpoint, write_checkpoint
+from simulation import Simulation
+
+from test_simulation import small_config
+
+
+def test_checkpoint_round_trips_arrays_and_scalars(tmp_path):
+    path = str(tmp_path / "state.ckpt")
+    state = {
+        "u": np.arange(24, dtype=np.float32).reshape(2, 3, 4),
+        "albedo": np.linspace(0, 1, 7),
+        "count": np.arange(5, dtype=np.int64),
+        "t": np.float64(1234.5),
+    }
+    write_checkpoint(path, state, {"RESOLUTION": 3})
+
+    loaded, metadata = read_checkpoint(path)
+    assert metadata == {"RESOLUTION": 3}
+    assert loaded["t"] == 1234.5
+    for name in ("u", "albedo", "count"):
+        assert loaded[name].dtype == state[name].dtype
+        assert loaded[name].shape == state[name].shape
+        np.testing.assert_array_equal(loaded[name], state[name])
+
+
+def test_writer_raises_failed_write_on_close(tmp_path):
+    writer = CheckpointWriter(str(tmp_path / "missing" / "state.ckpt"))
+    writer.save({"u": np.zeros(3)})
+    with pytest.raises(FileNotFoundError):
+        writer.close()
+
+
+def test_writer_raises_failed_write_on_next_save(tmp_path):
+    writer = CheckpointWriter(str(tmp_path / "missing" / "state.ckpt"))
+    writer.save({"u": np.zeros(3)})
+    deadline = time.monotonic() + 10
+    while writer.error is None and time.monotonic() < deadline:
+        time.sleep(0.01)
+    with pytest.raises(FileNotFoundError):
+        writer.save({"u": np.zeros(3)})
+    # the error is only raised once
+    writer.close()
+
+
+def test_restart_leaves_checkpoint_untouched(tmp_path):
+    path = str(tmp_path / "state.ckpt")
+    with Simulation(small_config()) as simulation:
+        simulation.run(1)
+        write_checkpoint(path, simulation.state, simulation.metadata)
+    with open(path, "rb") as f:
+        saved = f.read()
+
+    with Simulation(small_config()) as restarted:
+        restarted.load(path)
+        restarted.run(2)
+    with open(path, "rb") as f:
+        assert f.read() == saved
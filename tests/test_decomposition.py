@@ -0,0 +1,21 @@
+# CLimate Analysis using Digital Estimations (CLAuDE)
+
+import numpy as np
+
+from decomposition import DecomposedSimulation
+from simulation import Simulation
+
+from test_simulation import small_config
+
+
+def test_bands_match_serial_run_exactly():
+    with Simulation(small_config(CONCURRENT_POLES=False)) as serial:
+        serial.run(2)
+        expected = {name: np.copy(value) for name, value in serial.state.items()}
+
+    with DecomposedSimulation(small_config(), bands=2) as decomposed:
+        decomposed.run(2)
+        state = decomposed.state
+        assert state.keys() == expected.keys()
+        for name, value in expected.items():
+            assert np.array_equal(state[name], value), name
@@ -0,0 +1,65 @@
+# CLimate Analysis using Digital Estimations (CLAuDE)
+
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from history import HistoryWriter, bit_round, read_history
+
+
+def snapshot(t):
+    return SimpleNamespace(
+        t=t,
+        u=np.full((3, 4, 2), t, dtype=np.float64),
+        albedo=np.arange(12, dtype=np.float32).reshape(3, 4) + t,
+    )
+
+
+def test_bit_round_error_is_half_the_last_bit_kept():
+    keep_bits = 10
+    a = np.random.default_rng(0).normal(size=1000) * 1e3
+    rounded = bit_round(a.copy(), keep_bits)
+
+    _, exponent = np.frexp(a)
+    last_bit = np.ldexp(1.0, exponent - 1 - keep_bits)
+    assert np.all(np.abs(rounded - a) <= last_bit / 2)
+
+    drop = np.finfo(a.dtype).nmant - keep_bits
+    dropped = rounded.view(np.uint64) & np.uint64((1 << drop) - 1)
+    assert not dropped.any()
+
+
+def test_history_round_trips_across_reopen(tmp_path):
+    path = str(tmp_path / "history")
+    writer = HistoryWriter(path, ["u", "albedo"])
+    for t in range(3):
+        writer(snapshot(float(t)))
+    writer.close()
+
+    writer = HistoryWriter(path, ["u", "albedo"])
+    assert writer.count == 3
+    for t in range(3, 5):
+        writer(snapshot(float(t)))
+    writer.close()
+
+    history = read_history(path)
+    assert history.count == 5
+    assert history.fields == ["u", "albedo"]
+    np.testing.assert_array_equal(history.t, np.arange(5.0))
+    for t in range(5):
+        expected = snapshot(float(t))
+        assert history["u"].dtype == np.float64
+        assert history["albedo"].dtype == np.float32
+        np.testing.assert_array_equal(history["u"][t], expected.u)
+        np.testing.assert_array_equal(history["albedo"][t], expected.albedo)
+
+
+def test_reopen_with_other_fields_is_refused(tmp_path):
+    path = str(tmp_path / "history")
+    writer = HistoryWriter(path, ["u", "albedo"])
+    writer(snapshot(0.0))
+    writer.close()
+
+    with pytest.raises(ValueError, match="history archive"):
+        HistoryWriter(path, ["u"])
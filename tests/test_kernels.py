@@ -0,0 +1,42 @@
+# CLimate Analysis using Digital Estimations (CLAuDE)
+
+import numpy as np
+import pytest
+
+import claude_top_level_library as top_level
+from benchmark import benchmark_cases, benchmark_simulation, check_case
+
+# the smallest grid the polar planes fit on, with the standard levels
+RESOLUTION = 3
+NLEVELS = 21
+PRECISIONS = (np.float64, np.float32)
+
+CASES = [
+    pytest.param(case, np.dtype(precision), id="{}-{}".format(case.name, np.dtype(precision).name))
+    for precision in PRECISIONS
+    for case in benchmark_cases(benchmark_simulation(RESOLUTION, NLEVELS, precision))
+    if case.reference is not None
+]
+
+
+@pytest.mark.parametrize("case, precision", CASES)
+def test_kernel_matches_reference(case, precision):
+    error = check_case(case)
+    assert error <= max(case.tolerance, 1000 * np.finfo(precision).eps), case.name
+
+
+def test_radiation_keeps_fractional_timestep():
+    # an adaptive timestep is not a whole number of seconds
+    simulation = benchmark_simulation(RESOLUTION, NLEVELS, np.float64)
+    config = simulation.config
+
+    def surface_change(dt):
+        temperature_world = simulation.temperature_world.copy()
+        top_level.radiation_calculation(
+            temperature_world, simulation.potential_temperature.copy(), config.PRESSURE_LEVELS,
+            simulation.heat_capacity_earth, simulation.albedo, config.INSOLATION, config.LAT, config.LON, 0.0, dt,
+            config.DAY, config.YEAR, config.AXIAL_TILT
+        )
+        return temperature_world - simulation.temperature_world
+
+    np.testing.assert_allclose(surface_change(0.5), surface_change(1.0) / 2, rtol=1E-9, atol=1E-12)
@@ -0,0 +1,29 @@
+# CLimate Analysis using Digital Estimations (CLAuDE)
+
+import warnings
+
+import pytest
+
+from plotting_process import PlottingProcess
+from simulation import Simulation
+
+from test_simulation import small_config
+
+
+def test_warns_once_when_renderer_has_exited(monkeypatch):
+    monkeypatch.setenv("MPLBACKEND", "Agg")
+    simulation = Simulation(small_config())
+    plotter = PlottingProcess()
+    try:
+        plotter(simulation)
+        plotter._process.terminate()
+        plotter._process.join()
+
+        with pytest.warns(RuntimeWarning, match="plotting process exited"):
+            plotter(simulation)
+        with warnings.catch_warnings():
+            warnings.simplefilter("error")
+            plotter(simulation)
+        assert plotter.dropped_frames == 2
+    finally:
+        plotter.close()
@@ -0,0 +1,43 @@
+# CLimate Analysis using Digital Estimations (CLAuDE)
+
+import numpy as np
+
+import simulation as simulation_module
+from checkpoint import write_checkpoint
+from simulation import Simulation
+
+from test_simulation import small_config
+
+
+def coarse_checkpoint(path):
+    coarse = Simulation(small_config(RESOLUTION=3))
+    coarse.run(2)
+    write_checkpoint(str(path), coarse.state, coarse.metadata)
+    coarse.close()
+    return coarse
+
+
+def test_coarse_checkpoint_carries_on_at_finer_resolution(tmp_path):
+    path = tmp_path / "coarse.ckpt"
+    coarse_checkpoint(path)
+
+    with Simulation(small_config(RESOLUTION=2)) as fine:
+        fine.load(str(path))
+        assert fine.potential_temperature.shape[:2] == (len(fine.config.LAT), len(fine.config.LON))
+        fine.run(2)
+        for name, value in fine.state.items():
+            assert np.all(np.isfinite(value)), name
+
+
+def test_same_grid_load_is_exact(tmp_path, monkeypatch):
+    path = tmp_path / "coarse.ckpt"
+    coarse = coarse_checkpoint(path)
+
+    def regrid_state(*args):
+        raise AssertionError("a checkpoint on the same grid was regridded")
+
+    monkeypatch.setattr(simulation_module, "regrid_state", regrid_state)
+    with Simulation(small_config(RESOLUTION=3)) as restarted:
+        restarted.load(str(path))
+        for name, value in coarse.state.items():
+            assert np.array_equal(restarted.state[name], value), name
@@ -0,0 +1,128 @@
+# CLimate Analysis using Digital Estimations (CLAuDE)
+
+import pickle
+import tracemalloc
+
+import numpy as np
+import pytest
+
+from checkpoint import PICKLE_FIELDS
+from config import Config
+from decomposition import SHARED_FIELDS
+from schedule import Schedule
+from simulation import Simulation
+from sweep import sweep_config
+
+
+def small_config(**overrides):
+    """The default configuration, started from rest."""
+    return sweep_config(Config, dict({"LOAD": False}, **overrides))
+
+
+def test_hooks_see_time_at_start_of_step():
+    simulation = Simulation(small_config())
+    times = []
+    simulation.add_hook(lambda sim: times.append(sim.t), freq=2)
+    simulation.run(4)
+    assert times == [Config.DT_MAIN, 3 * Config.DT_MAIN]
+    assert simulation.t == 4 * Config.DT_MAIN
+
+
+def test_default_save_file_resumes_from_pickled_save(tmp_path, monkeypatch):
+    # the pickled 12-tuple written by the original script
+    reference = Simulation(small_config())
+    reference.t = 1234.0
+    reference.u += 1
+    with open(tmp_path / Config.SAVE_FILE, "wb") as f:
+        pickle.dump(tuple(reference.state[name] for name in PICKLE_FIELDS), f)
+
+    monkeypatch.chdir(tmp_path)
+    simulation = Simulation(sweep_config(Config, {"LOAD": True}))
+    assert simulation.t == 1234.0
+    np.testing.assert_array_equal(simulation.u, reference.u)
+
+
+def test_step_allocates_less_than_a_field():
+    simulation = Simulation(small_config(CONCURRENT_POLES=False))
+    # the first step fills the workspaces
+    simulation.step()
+    tracemalloc.start()
+    try:
+        simulation.step()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    assert peak < simulation.potential_temperature.nbytes
+
+
+def test_memory_tracking_steps_poles_in_turn():
+    simulation = Simulation(small_config(INSTRUMENT_MEMORY=True, CONCURRENT_POLES=True))
+    assert simulation.polar_executor is None
+
+
+def test_close_stops_polar_thread():
+    with Simulation(small_config(CONCURRENT_POLES=True)) as simulation:
+        executor = simulation.polar_executor
+        simulation.step()
+    assert simulation.polar_executor is None
+    assert executor._shutdown
+    # the poles are then stepped in turn
+    simulation.step()
+
+
+def test_given_state_is_used_as_is():
+    reference = Simulation(small_config())
+    # the fields a band of a DecomposedSimulation is given, less the ones only they write
+    state = {name: np.copy(getattr(reference, name)) for name in SHARED_FIELDS if hasattr(reference, name)}
+    with Simulation(small_config(), geometry=reference.geometry, state=state) as simulation:
+        for name, field in state.items():
+            assert getattr(simulation, name) is field, name
+
+
+def test_subcycled_radiation_changes_trajectory():
+    plain = Simulation(small_config())
+    plain.run(4)
+    subcycled = Simulation(small_config(PHASE_FREQ={"radiation": 3}))
+    subcycled.run(4)
+    assert not np.array_equal(subcycled.potential_temperature, plain.potential_temperature)
+
+    statistics = subcycled.schedule.statistics()
+    # in full at the first and fourth steps, held in between
+    assert statistics["radiation"]["runs"] == 2
+    assert statistics["advection"]["runs"] == statistics["velocity"]["runs"] == plain.schedule.runs["advection"]
+
+
+def test_only_radiation_and_plane_velocities_are_subcycled():
+    with pytest.raises(ValueError):
+        Schedule({"advection": 4, "velocity": 3})
+
+
+def test_adaptive_timestep_is_bounded_and_meets_cfl_target():
+    config = small_config(ADAPTIVE_DT=True)
+    simulation = Simulation(config)
+    for _ in range(4):
+        previous = simulation.dt
+        simulation.step()
+        assert config.DT_MIN <= simulation.dt <= config.DT_MAX
+        assert simulation.dt <= previous * config.DT_GROWTH * (1 + 1e-12)
+
+    # winds that need exactly DT_MAIN, which no bound gets in the way of
+    simulation.u[:], simulation.v[:], simulation.w[:] = 1, 0, 0
+    for field in ("x_dot_N", "y_dot_N", "x_dot_S", "y_dot_S"):
+        getattr(simulation, field)[:] = 0
+    simulation.u *= config.CFL_TARGET / (config.DT_MAIN * simulation.courant_rate())
+    simulation.dt = config.DT_MAX
+    assert simulation.adaptive_timestep() == pytest.approx(config.DT_MAIN)
+    assert simulation.cfl == pytest.approx(config.CFL_TARGET)
+
+    # still winds grow the timestep as fast as allowed, up to DT_MAX
+    simulation.u[:] = 0
+    simulation.dt = config.DT_MIN
+    assert simulation.adaptive_timestep() == pytest.approx(config.DT_MIN * config.DT_GROWTH)
+    simulation.dt = config.DT_MAX
+    assert simulation.adaptive_timestep() == config.DT_MAX
+
+    # and winds too fast for DT_MIN leave the CFL number above the target
+    simulation.u[:] = 1000
+    assert simulation.adaptive_timestep() == config.DT_MIN
+    assert simulation.cfl > config.CFL_TARGET
@@ -0,0 +1,28 @@
+# CLimate Analysis using Digital Estimations (CLAuDE)
+
+import json
+
+from sweep import run_sweep
+
+
+def test_resumed_sweep_runs_only_missing_members(tmp_path):
+    results_path = str(tmp_path / "results.jsonl")
+    overrides = [{"AXIAL_TILT": 0.0}, {"AXIAL_TILT": 10.0}, {"AXIAL_TILT": 20.0}]
+    # written by an earlier sweep, which was killed while writing the last member
+    done = {"overrides": overrides[1], "steps": 1, "error": None, "marker": "from earlier sweep"}
+    with open(results_path, "w") as f:
+        f.write(json.dumps(done) + "\n")
+        f.write(json.dumps({"overrides": overrides[2], "steps": 1})[:20])
+
+    results = run_sweep(overrides, 1, results_path, processes=1)
+
+    assert [result["overrides"] for result in results] == overrides
+    assert results[1] == done
+    assert all("marker" not in results[i] and results[i]["error"] is None for i in (0, 2))
+
+    with open(results_path) as f:
+        lines = f.read().splitlines()
+    # the earlier result, the partial line, then each member run now on a line of its own
+    assert len(lines) == 4
+    new = sorted(json.loads(line)["overrides"]["AXIAL_TILT"] for line in lines[2:])
+    assert new == [0.0, 20.0]